@@ -1,4 +1,8 @@
 from datetime import datetime, timedelta
+import hashlib
+import hmac
+import os
+import time
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 
@@ -12,13 +16,49 @@ def get_password_hash(password):
     return pwd_context.hash(password)
 
 # --- JWT Token ---
-SECRET_KEY = "your-super-secret-key-for-lms-project"
+# Never commit the key: AUTH_MODE=jwt refuses to start without JWT_SECRET_KEY (at least MIN_SECRET_BYTES), e.g. from
+# python -c "import secrets; print(secrets.token_urlsafe(48))"
+SECRET_KEY = os.getenv("JWT_SECRET_KEY", "")
+MIN_SECRET_BYTES = 32
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 # 1 Hour
+JWT_ISSUER = os.getenv("JWT_ISSUER", "online-course-portal")
+JWT_AUDIENCE = os.getenv("JWT_AUDIENCE", "online-course-portal-api")
+
+def jwt_configured() -> bool:
+    return len(SECRET_KEY.encode()) >= MIN_SECRET_BYTES
 
 def create_access_token(data: dict):
+    if not jwt_configured(): raise RuntimeError(f"JWT_SECRET_KEY must be set to at least {MIN_SECRET_BYTES} bytes")
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "iss": JWT_ISSUER, "aud": JWT_AUDIENCE})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
\ No newline at end of file
+    return encoded_jwt
+
+def decode_access_token(token: str):
+    """Verify signature, expiry, issuer and audience; returns the claims or None if the token is invalid."""
+    if not jwt_configured(): return None
+    try:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM], issuer=JWT_ISSUER, audience=JWT_AUDIENCE)
+    except JWTError:
+        return None
+
+# --- Signed URLs ---
+# A separate key of its own; without one (at least MIN_SECRET_BYTES) signed URLs are disabled rather than forgeable
+URL_SIGNING_KEY = os.getenv("URL_SIGNING_KEY", "")
+
+def url_signing_configured() -> bool:
+    return len(URL_SIGNING_KEY.encode()) >= MIN_SECRET_BYTES
+
+def sign_url(path: str, expires: int, signed_params: str = "") -> str:
+    """HMAC-SHA256 over a URL path, its expiry (unix seconds) and any other parameters that must not be altered."""
+    if not url_signing_configured(): raise RuntimeError(f"URL_SIGNING_KEY must be set to at least {MIN_SECRET_BYTES} bytes")
+    return hmac.new(URL_SIGNING_KEY.encode(), f"{path}\n{expires}\n{signed_params}".encode(), hashlib.sha256).hexdigest()
+
+def verify_url_signature(path: str, expires, signed_params: str, signature: str) -> bool:
+    if not url_signing_configured(): return False
+    try: expires = int(expires)
+    except (TypeError, ValueError): return False
+    if expires < time.time(): return False
+    return hmac.compare_digest(sign_url(path, expires, signed_params), signature or "")
@@ -0,0 +1,108 @@
+"""Peak RSS and latency of the admin student list: today's aggregation vs. the old in-Python join.
+
+    python benchmarks/bench_admin_students.py [--students 50000] [--courses 500] [--enrolled 5]
+
+Seeds the students (each enrolled in --enrolled courses, some completed) once, then runs every variant in a fresh
+process so ru_maxrss is that variant's own peak:
+
+  join      the pre-aggregation endpoint body: every student and course read into Python and joined in a loop
+  pipeline  GET /api/v1/admin/students/ page by page (admin cache off), i.e. the same data through the aggregation
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import sys
+import time
+from datetime import datetime
+
+from common import app_client, insert_batched, login, student_doc, admin_doc, Timer
+import main as backend
+
+
+async def seed(args):
+    await backend.ensure_indexes()
+    course_ids = await insert_batched(backend.courses_collection, ({"title": f"Course {i}", "description": "benchmark", "enrollment_count": 0, "content_count": 4} for i in range(args.courses)))
+    rng = random.Random(1)
+
+    def student(i):
+        enrolled = rng.sample(course_ids, min(args.enrolled, len(course_ids)))
+        enrollments = {str(c): {"completed_items": 4, "total_items": 4, "percentage": 100, "completed_at": datetime.utcnow()} if rng.random() < .3
+                       else {"completed_items": 1, "total_items": 4, "percentage": 25, "completed_at": None} for c in enrolled}
+        progress = {str(c): [f"item-{k}" for k in range(e["completed_items"])] for c, e in zip(enrolled, enrollments.values())}
+        return student_doc(i, enrolled_courses=enrolled, enrollments=enrollments, progress=progress)
+
+    await insert_batched(backend.students_collection, (student(i) for i in range(args.students)))
+    await backend.admins_collection.insert_one(admin_doc())
+
+
+async def legacy_join() -> list:
+    """GET /api/v1/admin/students/ as it was before the aggregation (5bee802~1), minus the HTTP layer."""
+    students = await backend.students_collection.find({}, {"password": 0, "access_token": 0, "completed_courses": 0, "progress": 0}).to_list()
+    all_courses = {str(c["_id"]): c.get("title", "Unknown") async for c in backend.courses_collection.find({}, {"title": 1})}
+    for student in students:
+        student["_id"] = str(student["_id"])
+        enrollments, enrolled_ids = student.pop("enrollments", {}), student.pop("enrolled_courses", [])
+        titles = [all_courses[str(c)] for c in enrolled_ids if str(c) in all_courses]
+        student["enrolled_course_titles"] = titles
+        student["completed_courses_count"] = sum(1 for c in enrolled_ids if str(c) in all_courses and enrollments.get(str(c), {}).get("completed_at"))
+        student["total_enrolled_count"] = len(enrolled_ids)
+    return students
+
+
+async def run_variant(variant: str) -> dict:
+    if variant == "join":
+        with Timer() as total:
+            students = await legacy_join()
+            body = backend.jsonable_encoder(students); size = len(json.dumps(body, default=str))
+        return {"rows": len(students), "first": total.elapsed, "total": total.elapsed, "bytes": size}
+    async with app_client(keep=True, lifespan=False) as client:
+        headers = await login(client, "admin", admin_doc()["email"])
+        rows = size = 0; first = None; after = None
+        with Timer() as total:
+            while True:
+                params = {"limit": backend.MAX_PAGE_SIZE, **({"after": after} if after else {})}
+                start = time.perf_counter()
+                r = await client.get("/api/v1/admin/students/", params=params, headers=headers)
+                r.raise_for_status()
+                first = first if first is not None else time.perf_counter() - start
+                page = r.json(); rows += len(page["items"]); size += len(r.content); after = page["next"]
+                if not after: break
+        return {"rows": rows, "first": first, "total": total.elapsed, "bytes": size}
+
+
+def child(variant: str):
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result = asyncio.run(run_variant(variant))
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss   # KiB on Linux
+    print(f"{variant:<9} rows={result['rows']:<7} first page={result['first'] * 1000:9.1f}ms  all rows={result['total'] * 1000:9.1f}ms"
+          f"  body={result['bytes'] / 1024 / 1024:7.1f}MB  peak RSS +{(peak - baseline) / 1024:7.1f}MB")
+
+
+async def compare(args):
+    await seed(args)
+    try:
+        for variant in ("join", "pipeline"):
+            env = {**os.environ, "ADMIN_CACHE_ENABLED": "false"}
+            process = await asyncio.create_subprocess_exec(sys.executable, os.path.abspath(__file__), "--child", variant, env=env)
+            if await process.wait(): raise SystemExit(f"{variant} failed")
+    finally:
+        await backend.client.drop_database(backend.db.name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=50000)
+    parser.add_argument("--courses", type=int, default=500)
+    parser.add_argument("--enrolled", type=int, default=5)
+    parser.add_argument("--child", choices=["join", "pipeline"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child); return
+    asyncio.run(compare(args))
+
+
+if __name__ == "__main__":
+    main()
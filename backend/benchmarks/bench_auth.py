@@ -0,0 +1,59 @@
+"""p50/p99 latency of a cheap authenticated endpoint with session tokens vs. JWTs.
+
+    python benchmarks/bench_auth.py [--students 1000] [--requests 5000] [--concurrency 50]
+
+AUTH_MODE and the session cache are read when main.py is imported, so each configuration runs in its own process:
+session/jwt, each with the principal cache on and off. The endpoint is GET /api/v1/student/conversation (one indexed
+lookup once the caller is authenticated); the difference between the rows is the cost of authentication.
+"""
+import argparse
+import asyncio
+import os
+import random
+import secrets
+import subprocess
+import sys
+import time
+
+CONFIGURATIONS = [("session", "true"), ("session", "false"), ("jwt", "true"), ("jwt", "false")]
+
+
+async def run(args):
+    from common import app_client, insert_batched, login, student_doc, latency_row
+    import main
+    async with app_client() as client:
+        await insert_batched(main.students_collection, (student_doc(i) for i in range(args.students)))
+        headers = [await login(client, "student", f"student{i}@bench.example") for i in range(min(args.students, args.logins))]
+        semaphore, samples = asyncio.Semaphore(args.concurrency), []
+
+        async def one():
+            async with semaphore:
+                start = time.perf_counter()
+                r = await client.get("/api/v1/student/conversation", headers=random.choice(headers))
+                samples.append(time.perf_counter() - start)
+                assert r.status_code == 200, r.text
+
+        await asyncio.gather(*(one() for _ in range(args.requests // 10)))   # warm-up
+        samples.clear()
+        await asyncio.gather(*(one() for _ in range(args.requests)))
+        print(latency_row(f"{main.AUTH_MODE}, cache={'on' if main.SESSION_CACHE_ENABLED else 'off'}", samples))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=1000)
+    parser.add_argument("--logins", type=int, default=200, help="distinct tokens used by the requests")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        asyncio.run(run(args)); return
+    for mode, cache in CONFIGURATIONS:
+        env = {**os.environ, "AUTH_MODE": mode, "SESSION_CACHE_ENABLED": cache}
+        env.setdefault("JWT_SECRET_KEY", secrets.token_urlsafe(48))
+        subprocess.run([sys.executable, os.path.abspath(__file__), "--child", *sys.argv[1:]], env=env, check=True)
+
+
+if __name__ == "__main__":
+    main()
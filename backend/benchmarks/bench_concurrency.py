@@ -0,0 +1,116 @@
+"""Fast-request latency and throughput while slow admin requests run on the same server.
+
+    python benchmarks/bench_concurrency.py --base-url http://localhost:8000 [--students 20000] [--duration 20]
+
+Needs a running server (one uvicorn worker, so blocking shows). Everything is seeded through the HTTP API, so the same
+run works against a server built from the tree before the async driver (edbbef9~1), which is the "before" number. That
+tree hard-codes the online_course_portal database, so point its copy at a scratch one first:
+
+    git worktree add ../ocp-before edbbef9~1
+    sed -i 's/client\["online_course_portal"\]/client["ocp_benchmark_before"]/' ../ocp-before/backend/main.py
+    (cd ../ocp-before/backend && uvicorn main:app --port 8001)
+    MONGO_DB=ocp_benchmark_before python benchmarks/bench_concurrency.py --base-url http://localhost:8001 --slow-path /api/v1/admin/students/
+    MONGO_DB=ocp_benchmark ADMIN_CACHE_ENABLED=false uvicorn main:app --port 8000
+    python benchmarks/bench_concurrency.py --base-url http://localhost:8000
+
+The slow request reads the whole student collection: the old unpaginated /admin/students/ join, or today's streamed
+export. Phase 1 runs only fast requests (student profile reads); phase 2 adds the slow clients. With a blocking driver
+the fast p99 in phase 2 climbs to the duration of a slow request; with the async driver it should stay close to phase 1.
+MONGO_DB must name the database the server uses; it is dropped afterwards (--keep to leave it for another run).
+"""
+import argparse
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+from common import student_doc, admin_doc, latency_row
+import httpx
+
+
+async def seed(client, args) -> tuple:
+    semaphore = asyncio.Semaphore(32)
+
+    async def register(role, doc):
+        async with semaphore:
+            r = await client.post(f"/api/v1/{role}/register", json=doc)
+            if r.status_code not in (200, 400): r.raise_for_status()   # 400: already registered by a --keep run
+
+    async def login(role, email):
+        async with semaphore:
+            r = await client.post(f"/api/v1/{role}/login", json={"email": email, "password": "pass"})
+            r.raise_for_status()
+            return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+    await register("admin", admin_doc())
+    admin = await login("admin", admin_doc()["email"])
+    courses = []
+    for i in range(args.courses):
+        r = await client.post("/api/v1/courses/no-file/", json={"title": f"Course {i}", "description": "benchmark course"}, headers=admin)
+        r.raise_for_status(); courses.append(r.json()["course_id"])
+    await asyncio.gather(*(register("student", student_doc(i)) for i in range(args.students)))
+    students = await asyncio.gather(*(login("student", student_doc(i)["email"]) for i in range(args.fast_clients)))
+
+    async def enroll(headers, i):
+        async with semaphore:
+            for k in range(3): await client.post(f"/api/v1/student/enroll/{courses[(i + k) % len(courses)]}", headers=headers)
+    await asyncio.gather(*(enroll(h, i) for i, h in enumerate(students)))
+    return admin, students
+
+
+@asynccontextmanager
+async def scratch_database(keep: bool):
+    import main as backend
+    try: yield
+    finally:
+        if not keep: await backend.client.drop_database(backend.db.name)
+
+
+async def phase(client, args, admin, students, slow_clients: int) -> tuple:
+    fast, slow, deadline = [], [], time.perf_counter() + args.duration
+
+    async def fast_loop(headers):
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            (await client.get(args.fast_path, headers=headers)).raise_for_status()
+            fast.append(time.perf_counter() - start)
+
+    async def slow_loop():
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            async with client.stream("GET", args.slow_path, headers=admin) as r:
+                r.raise_for_status()
+                async for _ in r.aiter_raw(): pass
+            slow.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(fast_loop(h) for h in students), *(slow_loop() for _ in range(slow_clients)))
+    return fast, slow
+
+
+async def run(args):
+    limits = httpx.Limits(max_connections=args.fast_clients + args.slow_clients + 8)
+    # Not server_client(): its ensure_indexes() would add today's indexes to the "before" server's database
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=None, limits=limits) as client, scratch_database(args.keep):
+        admin, students = await seed(client, args)
+        fast, _ = await phase(client, args, admin, students, 0)
+        print(latency_row("fast only", fast, f"{len(fast) / args.duration:8.1f} req/s"))
+        fast, slow = await phase(client, args, admin, students, args.slow_clients)
+        print(latency_row("fast, with slow running", fast, f"{len(fast) / args.duration:8.1f} req/s"))
+        print(latency_row("slow", slow, f"{len(slow) / args.duration:8.2f} req/s"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", required=True)
+    parser.add_argument("--students", type=int, default=20000)
+    parser.add_argument("--courses", type=int, default=50)
+    parser.add_argument("--fast-clients", type=int, default=32)
+    parser.add_argument("--slow-clients", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=20, help="seconds per phase")
+    parser.add_argument("--fast-path", default="/api/v1/student/profile")
+    parser.add_argument("--slow-path", default="/api/v1/admin/export/students?format=ndjson")
+    parser.add_argument("--keep", action="store_true", help="leave the seeded data in MONGO_DB")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""Throughput of concurrent large downloads per FILE_DELIVERY_MODE, and what they do to other requests.
+
+    python benchmarks/bench_delivery.py --target app=http://localhost:8000 \\
+        --target x-accel-redirect=http://localhost:8080 [--size-mb 50] [--concurrency 16] [--rounds 3]
+
+Each --target is a label and the URL of one deployment of this tree, all sharing MONGO_DB and the uploads directory:
+
+    MONGO_DB=ocp_benchmark uvicorn main:app --port 8000                                            # app
+    MONGO_DB=ocp_benchmark FILE_DELIVERY_MODE=x-accel-redirect uvicorn main:app --port 8001
+    nginx on :8080 proxying to :8001 with   location /protected-uploads/ { internal; alias <backend>/uploads/; }
+
+The file is uploaded once through the first target. Every round starts --concurrency downloads of it through
+/download/ and, meanwhile, times student profile reads on the same target: with the app streaming the bytes, those
+reads queue behind the transfers; with the proxy doing it they should not.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from common import server_client, student_doc, admin_doc, latency_row
+import httpx
+
+CHUNK = 256 * 1024
+
+
+async def seed(client, size: int) -> tuple:
+    for role, doc in (("admin", admin_doc()), ("student", student_doc(0))):
+        (await client.post(f"/api/v1/{role}/register", json=doc)).raise_for_status()
+    tokens = {}
+    for role, doc in (("admin", admin_doc()), ("student", student_doc(0))):
+        r = await client.post(f"/api/v1/{role}/login", json={"email": doc["email"], "password": "pass"}); r.raise_for_status()
+        tokens[role] = {"Authorization": f"Bearer {r.json()['access_token']}"}
+    r = await client.post("/api/v1/courses/no-file/", json={"title": "Recordings", "description": "delivery benchmark"}, headers=tokens["admin"]); r.raise_for_status()
+    course_id = r.json()["course_id"]
+    with tempfile.TemporaryFile() as f:
+        block = os.urandom(CHUNK)
+        for written in range(0, size, CHUNK): f.write(block[:min(CHUNK, size - written)])
+        f.seek(0)
+        (await client.post("/api/v1/admin/upload", data={"course_id": course_id}, files={"content": ("lecture.mp4", f, "video/mp4")}, headers=tokens["admin"])).raise_for_status()
+    (await client.post(f"/api/v1/student/enroll/{course_id}", headers=tokens["student"])).raise_for_status()
+    r = await client.get(f"/api/v1/student/course/{course_id}", headers=tokens["student"]); r.raise_for_status()
+    content_id = next(i["content_id"] for i in r.json()["course_content"] if i.get("type") == "file")
+    return f"/api/v1/student/course/{course_id}/download/{content_id}", tokens["student"]
+
+
+async def measure(label: str, base_url: str, path: str, headers: dict, args, size: int):
+    limits = httpx.Limits(max_connections=args.concurrency + 4)
+    async with httpx.AsyncClient(base_url=base_url, timeout=None, limits=limits) as client:
+        downloads, probes, moved, busy = [], [], 0, 0.0
+        for _ in range(args.rounds):
+            running = True
+
+            async def download():
+                nonlocal moved
+                start, received = time.perf_counter(), 0
+                async with client.stream("GET", path, headers=headers) as r:
+                    r.raise_for_status()
+                    async for chunk in r.aiter_raw(CHUNK): received += len(chunk)
+                if received != size: raise SystemExit(f"{label}: got {received} of {size} bytes")
+                downloads.append(time.perf_counter() - start); moved += received
+
+            async def probe():
+                while running:
+                    start = time.perf_counter()
+                    (await client.get("/api/v1/student/profile", headers=headers)).raise_for_status()
+                    probes.append(time.perf_counter() - start)
+                    await asyncio.sleep(.05)
+
+            prober = asyncio.create_task(probe())
+            start = time.perf_counter()
+            await asyncio.gather(*(download() for _ in range(args.concurrency)))
+            busy += time.perf_counter() - start
+            running = False; await prober
+        print(latency_row(f"{label} download", downloads, f"{moved / 1024 / 1024 / busy:8.1f} MB/s aggregate"))
+        print(latency_row(f"{label} profile read", probes))
+
+
+async def run(args):
+    targets = [t.split("=", 1) for t in args.target]
+    size = args.size_mb * 1024 * 1024
+    async with server_client(targets[0][1]) as client:
+        path, headers = await seed(client, size)
+        for label, base_url in targets:
+            await measure(label, base_url, path, headers, args, size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target", action="append", required=True, metavar="LABEL=URL")
+    parser.add_argument("--size-mb", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+    if any("=" not in t for t in args.target): sys.exit("--target takes LABEL=URL")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
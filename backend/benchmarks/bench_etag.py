@@ -0,0 +1,95 @@
+"""Repeat-visit test for the conditional GETs: bytes saved and latency of 304s vs. full responses.
+
+    python benchmarks/bench_etag.py [--courses 200] [--enrolled 20] [--items 10] [--visits 50]
+
+A student's dashboard visit is GET /courses/, /student/enrolled-courses and /student/course/{id} for every enrolled
+course. The first visit stores the ETags; each repeat visit sends them back as If-None-Match. Another student then
+enrolls in every one of those courses, and the next visit must still be all 304s. Then the admin uploads to one
+enrolled course, and the next visit must refetch exactly that course and the catalog. Exits non-zero when a response
+that should be a 304 is not, or the other way round.
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+from common import app_client, login, student_doc, admin_doc, latency_row
+import main as backend
+
+
+async def seed(client, args) -> tuple:
+    await backend.admins_collection.insert_one(admin_doc())
+    await backend.students_collection.insert_many([student_doc(0), student_doc(1)])
+    admin, student = await login(client, "admin", admin_doc()["email"]), await login(client, "student", student_doc(0)["email"])
+    # The catalog through the API, so every version counter is bumped the way production bumps it
+    course_ids = []
+    for i in range(args.courses):
+        r = await client.post("/api/v1/courses/no-file/", json={"title": f"Course {i}", "description": "Lecture notes and recordings " * 8}, headers=admin)
+        r.raise_for_status(); course_ids.append(r.json()["course_id"])
+    for course_id in course_ids[:args.enrolled]:
+        for k in range(args.items):
+            (await client.post("/api/v1/admin/upload", data={"course_id": course_id, "youtube_link_upload": f"https://youtu.be/video{k:05d}"}, headers=admin)).raise_for_status()
+        (await client.post(f"/api/v1/student/enroll/{course_id}", headers=student)).raise_for_status()
+    return admin, student, course_ids[:args.enrolled]
+
+
+async def visit(client, student: dict, course_ids: list, etags: dict) -> dict:
+    """One dashboard visit; returns {path: (status, body bytes, seconds)} and updates `etags`."""
+    results = {}
+    for path in ["/api/v1/courses/", "/api/v1/student/enrolled-courses", *(f"/api/v1/student/course/{c}" for c in course_ids)]:
+        headers = {**student, **({"If-None-Match": etags[path]} if path in etags else {})}
+        start = time.perf_counter()
+        r = await client.get(path, headers=headers)
+        results[path] = (r.status_code, len(r.content), time.perf_counter() - start)
+        if r.status_code == 200: etags[path] = r.headers["ETag"]
+    return results
+
+
+async def run(args) -> bool:
+    ok = True
+    async with app_client() as client:
+        admin, student, course_ids = await seed(client, args)
+        etags = {}
+        first = await visit(client, student, course_ids, etags)
+        ok &= all(status == 200 for status, _, _ in first.values())
+        full, revalidated = [], []
+        for _ in range(args.visits):
+            repeat = await visit(client, student, course_ids, etags)
+            ok &= all(status == 304 for status, _, _ in repeat.values())
+            revalidated += [seconds for _, _, seconds in repeat.values()]
+            full += [seconds for _, _, seconds in (await visit(client, student, course_ids, {})).values()]
+        first_bytes = sum(size for _, size, _ in first.values())
+        repeat_bytes = sum(size for _, size, _ in repeat.values())
+        print(f"first visit   {len(first)} requests, {first_bytes:>9} body bytes")
+        print(f"repeat visit  {len(repeat)} requests, {repeat_bytes:>9} body bytes  ({first_bytes - repeat_bytes} saved per visit)")
+        print(latency_row("200 (no validator)", full))
+        print(latency_row("304 (If-None-Match)", revalidated))
+
+        other = await login(client, "student", student_doc(1)["email"])
+        for course_id in course_ids: (await client.post(f"/api/v1/student/enroll/{course_id}", headers=other)).raise_for_status()
+        after = await visit(client, student, course_ids, etags)
+        print(f"after another student enrolled: {sum(status == 200 for status, _, _ in after.values())} of {len(after)} refetched")
+        ok &= all(status == 304 for status, _, _ in after.values())
+
+        changed = course_ids[0]
+        (await client.post("/api/v1/admin/upload", data={"course_id": changed, "youtube_link_upload": "https://youtu.be/new"}, headers=admin)).raise_for_status()
+        after = await visit(client, student, course_ids, etags)
+        refetched = sorted(path for path, (status, _, _) in after.items() if status == 200)
+        expected = sorted(["/api/v1/courses/", "/api/v1/student/enrolled-courses", f"/api/v1/student/course/{changed}"])
+        print(f"after an upload to one course: {len(refetched)} of {len(after)} refetched")
+        ok &= refetched == expected
+    print("ok" if ok else "FAILED: unexpected status codes")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--courses", type=int, default=200)
+    parser.add_argument("--enrolled", type=int, default=20)
+    parser.add_argument("--items", type=int, default=10, help="content items per enrolled course")
+    parser.add_argument("--visits", type=int, default=50)
+    sys.exit(0 if asyncio.run(run(parser.parse_args())) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Byte-range checks and time to the bytes of page 1 of a large PDF, with and without Range requests.
+
+    MONGO_DB=ocp_benchmark uvicorn main:app --port 8000
+    python benchmarks/bench_ranges.py --base-url http://localhost:8000 [--size-mb 100] [--runs 5]
+
+Uploads one PDF of --size-mb whose first page sits at the start of the file and whose xref table sits at the end (as in
+any linearized lecture deck), then:
+
+  checks     200 + Accept-Ranges, single and suffix ranges (206), unsatisfiable range (416), invalid range (ignored,
+             200), multi-range (206 multipart/byteranges or the whole file), If-Range with the current (206) and a
+             stale (200) validator
+  full       what a viewer without range support needs before it can draw page 1: the whole file
+  ranges     what pdf.js fetches first: the tail (trailer + xref), then the start of the file (page 1)
+
+Exits non-zero if a check fails. The uploaded file stays in the server's storage until the course is deleted.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from common import server_client, student_doc, admin_doc, percentile
+
+CHUNK = 64 * 1024
+
+
+def write_pdf(path: str, size: int):
+    """A valid single-page PDF padded to `size` bytes by an unreferenced stream placed between page 1 and the xref."""
+    page = b"BT /F1 24 Tf 72 720 Td (Page 1) Tj ET"
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+               b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R >>",
+               b"<< /Length %d >>\nstream\n%s\nendstream" % (len(page), page)]
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(f.tell()); f.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+        padding = max(size - f.tell() - 400, 0)
+        offsets.append(f.tell()); f.write(b"5 0 obj\n<< /Length %d >>\nstream\n" % padding)
+        block = os.urandom(1024 * 1024)
+        for written in range(0, padding, len(block)): f.write(block[:min(len(block), padding - written)])
+        f.write(b"\nendstream\nendobj\n")
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(offsets) + 1))
+        for offset in offsets: f.write(b"%010d 00000 n \n" % offset)
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(offsets) + 1, xref))
+
+
+async def seed(client, path: str) -> tuple:
+    for role, doc in (("admin", admin_doc()), ("student", student_doc(0))):
+        (await client.post(f"/api/v1/{role}/register", json=doc)).raise_for_status()
+    tokens = {}
+    for role, doc in (("admin", admin_doc()), ("student", student_doc(0))):
+        r = await client.post(f"/api/v1/{role}/login", json={"email": doc["email"], "password": "pass"}); r.raise_for_status()
+        tokens[role] = {"Authorization": f"Bearer {r.json()['access_token']}"}
+    r = await client.post("/api/v1/courses/no-file/", json={"title": "Large deck", "description": "range benchmark"}, headers=tokens["admin"]); r.raise_for_status()
+    course_id = r.json()["course_id"]
+    with open(path, "rb") as f:
+        (await client.post("/api/v1/admin/upload", data={"course_id": course_id}, files={"content": ("deck.pdf", f, "application/pdf")}, headers=tokens["admin"])).raise_for_status()
+    (await client.post(f"/api/v1/student/enroll/{course_id}", headers=tokens["student"])).raise_for_status()
+    r = await client.get(f"/api/v1/student/course/{course_id}", headers=tokens["student"]); r.raise_for_status()
+    content_id = next(i["content_id"] for i in r.json()["course_content"] if i.get("type") == "file")
+    return f"/api/v1/student/course/{course_id}/view/{content_id}", tokens["student"]
+
+
+async def checks(client, url: str, headers: dict, path: str) -> list:
+    size, failures = os.path.getsize(path), []
+    with open(path, "rb") as f: head = f.read(1024); f.seek(size - 1024); tail = f.read()
+
+    def check(name, ok):
+        print(f"  {'ok  ' if ok else 'FAIL'} {name}")
+        if not ok: failures.append(name)
+
+    async with client.stream("GET", url, headers=headers) as r:
+        check("whole file: 200, Accept-Ranges, Content-Length", r.status_code == 200 and r.headers.get("accept-ranges") == "bytes" and int(r.headers["content-length"]) == size)
+        etag = r.headers.get("etag")
+    r = await client.get(url, headers={**headers, "Range": "bytes=0-1023"})
+    check("bytes=0-1023: 206 with the first KiB", r.status_code == 206 and r.headers.get("content-range") == f"bytes 0-1023/{size}" and r.content == head)
+    r = await client.get(url, headers={**headers, "Range": "bytes=-1024"})
+    check("bytes=-1024: 206 with the last KiB", r.status_code == 206 and r.headers.get("content-range") == f"bytes {size - 1024}-{size - 1}/{size}" and r.content == tail)
+    r = await client.get(url, headers={**headers, "Range": f"bytes={size}-"})
+    check("bytes=<size>-: 416 with Content-Range */size", r.status_code == 416 and r.headers.get("content-range") == f"bytes */{size}")
+    async with client.stream("GET", url, headers={**headers, "Range": "bytes=9-2"}) as r:
+        check("bytes=9-2 (last < first, invalid): ignored, 200 whole file", r.status_code == 200 and int(r.headers["content-length"]) == size)
+    async with client.stream("GET", url, headers={**headers, "Range": "bytes=0-9,20-29"}) as r:
+        check("multi-range: 206 multipart/byteranges or the whole file", (r.status_code == 206 and r.headers["content-type"].startswith("multipart/byteranges")) or (r.status_code == 200 and int(r.headers["content-length"]) == size))
+    r = await client.get(url, headers={**headers, "Range": "bytes=0-1023", "If-Range": etag or ""})
+    check("If-Range current validator: 206", r.status_code == 206)
+    async with client.stream("GET", url, headers={**headers, "Range": "bytes=0-1023", "If-Range": '"stale"'}) as r:
+        check("If-Range stale validator: 200 whole file", r.status_code == 200 and int(r.headers["content-length"]) == size)
+    return failures
+
+
+async def timed_get(client, url: str, headers: dict) -> tuple:
+    """(seconds to first body byte, seconds to last byte)"""
+    start, first = time.perf_counter(), None
+    async with client.stream("GET", url, headers=headers) as r:
+        r.raise_for_status()
+        async for _ in r.aiter_raw(CHUNK):
+            if first is None: first = time.perf_counter() - start
+    return first, time.perf_counter() - start
+
+
+async def run(args) -> bool:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "deck.pdf")
+        write_pdf(path, args.size_mb * 1024 * 1024)
+        async with server_client(args.base_url) as client:
+            url, headers = await seed(client, path)
+            print("checks")
+            failures = await checks(client, url, headers, path)
+            full, ranged, first_bytes = [], [], []
+            for _ in range(args.runs):
+                first, total = await timed_get(client, url, headers)
+                first_bytes.append(first); full.append(total)
+                start = time.perf_counter()
+                await timed_get(client, url, {**headers, "Range": f"bytes=-{CHUNK}"})
+                await timed_get(client, url, {**headers, "Range": f"bytes=0-{CHUNK - 1}"})
+                ranged.append(time.perf_counter() - start)
+            print(f"time until page 1 can be drawn ({args.size_mb} MB PDF, {args.runs} runs, p50)")
+            print(f"  full download    {percentile(full, .5) * 1000:9.1f}ms   (first byte after {percentile(first_bytes, .5) * 1000:.1f}ms)")
+            print(f"  range requests   {percentile(ranged, .5) * 1000:9.1f}ms   (tail + first {CHUNK // 1024} KiB)")
+    return not failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", required=True)
+    parser.add_argument("--size-mb", type=int, default=100)
+    parser.add_argument("--runs", type=int, default=5)
+    sys.exit(0 if asyncio.run(run(parser.parse_args())) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Catalog search latency and response size at 100k courses, against downloading the whole catalog.
+
+    python benchmarks/bench_search.py [--courses 100000] [--queries 200]
+
+Seeds --courses generated courses straight into the scratch database and starts the app, which builds the text index
+and (the vocabulary being empty) the prefix-search terms. Then compares:
+
+  catalog   every page of GET /api/v1/courses/, i.e. what the browser had to download before it could filter locally
+  search    GET /api/v1/courses/search first pages for whole words, prefixes (search-as-you-type) and two-word queries
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from common import app_client, insert_batched, login, student_doc, latency_row, Timer
+import main as backend
+
+SUBJECTS = ["python", "java", "statistics", "calculus", "chemistry", "biology", "economics", "marketing", "design", "history",
+            "philosophy", "physics", "algebra", "databases", "networking", "security", "accounting", "psychology", "music", "writing"]
+LEVELS = ["introduction", "advanced", "applied", "foundations", "practical", "modern", "essential", "complete"]
+FILLER = ["lectures", "projects", "exercises", "weekly", "quizzes", "examples", "theory", "practice", "case", "studies",
+          "beginners", "professionals", "hands", "guided", "notes", "reading", "assignments", "review"]
+
+
+def course(rng: random.Random, i: int) -> dict:
+    subject, other = rng.sample(SUBJECTS, 2)
+    title = f"{rng.choice(LEVELS).title()} {subject.title()} {i}"
+    description = " ".join([subject, other, *rng.sample(FILLER, 8)])
+    return {"title": title, "description": description, "enrollment_count": 0, "content_count": 0}
+
+
+def queries(rng: random.Random, n: int) -> list:
+    kinds = [lambda: rng.choice(SUBJECTS), lambda: rng.choice(SUBJECTS)[:rng.randint(2, 4)],
+             lambda: f"{rng.choice(LEVELS)} {rng.choice(SUBJECTS)}", lambda: f"{rng.choice(SUBJECTS)} {rng.choice(FILLER)[:3]}"]
+    return [rng.choice(kinds)() for _ in range(n)]
+
+
+async def run(args):
+    rng = random.Random(1)
+    await insert_batched(backend.courses_collection, (course(rng, i) for i in range(args.courses)))
+    await backend.students_collection.insert_one(student_doc(0))
+    start = time.perf_counter()
+    async with app_client() as client:
+        print(f"startup (text index, search vocabulary, autocomplete): {time.perf_counter() - start:.1f}s")
+        headers = await login(client, "student", student_doc(0)["email"])
+
+        pages, size, after = [], 0, None
+        with Timer() as catalog:
+            while True:
+                start = time.perf_counter()
+                r = await client.get("/api/v1/courses/", params={"limit": backend.MAX_PAGE_SIZE, **({"after": after} if after else {})}, headers=headers)
+                r.raise_for_status(); pages.append(time.perf_counter() - start)
+                size += len(r.content); after = r.json()["next"]
+                if not after: break
+        print(f"catalog   {len(pages)} pages, {size / 1024 / 1024:.1f} MB, {catalog.elapsed * 1000:.0f}ms for all of it")
+
+        samples, sizes, hits = [], [], 0
+        for q in queries(rng, args.queries):
+            start = time.perf_counter()
+            r = await client.get("/api/v1/courses/search", params={"q": q}, headers=headers)
+            r.raise_for_status(); samples.append(time.perf_counter() - start)
+            sizes.append(len(r.content)); hits += bool(r.json()["items"])
+        print(latency_row("search (first page)", samples, f"avg {sum(sizes) / len(sizes) / 1024:.1f} KB, {hits}/{len(samples)} with results"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--courses", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
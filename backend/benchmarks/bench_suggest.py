@@ -0,0 +1,90 @@
+"""Autocomplete lookups in suggest.PrefixIndex at 1M entries: build time, memory, lookup and update latency.
+
+    python benchmarks/bench_suggest.py [--entries 1000000] [--lookups 20000] [--updates 1000]
+
+Fills the student index the way build_suggestions() does (name at every word start, email from its start) with
+generated students, then times, without any database or HTTP in the way:
+
+  lookup    student_suggestions.search(q, SUGGEST_LIMIT) for 1-6 character prefixes of names, surnames and emails
+  add       a register: student_suggestions.add() of a new student
+  rename    a profile update: add() of an existing id with a new name (remove plus insert)
+  remove    a student delete
+
+Exits non-zero when the lookup p99 is not under --budget-ms (default 1ms).
+"""
+import argparse
+import random
+import resource
+import sys
+import time
+
+from common import latency_row, percentile, Timer
+from bson import ObjectId
+import main as backend
+from suggest import PrefixIndex
+
+FIRST = ["anna", "ben", "carla", "david", "elena", "farid", "grace", "hugo", "ines", "jonas", "kira", "liam", "maya", "noah",
+         "olga", "pablo", "quinn", "rosa", "sami", "tara", "umar", "vera", "wei", "xena", "yusuf", "zoe"]
+LAST = ["alvarez", "brown", "chen", "dubois", "eriksen", "fischer", "garcia", "haddad", "ivanova", "jensen", "kowalski",
+        "lopez", "muller", "nakamura", "okafor", "patel", "rossi", "smith", "tanaka", "usman", "virtanen", "wong"]
+
+
+def student(rng: random.Random, i: int) -> dict:
+    first, last = rng.choice(FIRST), rng.choice(LAST)
+    return {"_id": ObjectId(), "full_name": f"{first.title()} {last.title()} {i}", "email": f"{first}.{last}{i}@bench.example"}
+
+
+def prefix(rng: random.Random, students: list) -> str:
+    s = rng.choice(students)
+    text = rng.choice([s["full_name"], s["full_name"].split(" ")[1], s["email"]])
+    return text[:rng.randint(1, 6)]
+
+
+def timed(fn, args_list) -> list:
+    samples = []
+    for args in args_list:
+        start = time.perf_counter(); fn(*args); samples.append(time.perf_counter() - start)
+    return samples
+
+
+def run(args) -> bool:
+    rng = random.Random(1)
+    students = [student(rng, i) for i in range(args.entries)]
+    index, rss = PrefixIndex(), resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    with Timer() as build:
+        index.build(backend.student_suggestion(s) for s in students)
+    grown = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss) / 1024
+    print(f"build     {len(index)} entries, {len(index._keys)} keys, {build.elapsed:.1f}s, peak RSS +{grown:.0f} MB")
+
+    queries = [prefix(rng, students) for _ in range(args.lookups)]
+    hits = 0
+
+    def lookup(q):
+        nonlocal hits
+        hits += bool(index.search(q, backend.SUGGEST_LIMIT))
+    lookups = timed(lookup, [(q,) for q in queries])
+    print(latency_row("lookup", lookups, f"{hits}/{len(queries)} with results"))
+
+    new = [student(rng, args.entries + i) for i in range(args.updates)]
+    print(latency_row("add (register)", timed(index.add, [backend.student_suggestion(s) for s in new])))
+    renamed = [{**s, "full_name": f"Renamed {s['full_name']}"} for s in rng.sample(students, args.updates)]
+    print(latency_row("rename (profile update)", timed(index.add, [backend.student_suggestion(s) for s in renamed])))
+    print(latency_row("remove (delete)", timed(index.remove, [(str(s["_id"]),) for s in new])))
+
+    p99 = percentile(lookups, .99) * 1000
+    ok = p99 < args.budget_ms
+    print(f"ok: lookup p99 {p99 * 1000:.1f}µs" if ok else f"FAILED: lookup p99 {p99:.3f}ms is over the {args.budget_ms}ms budget")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=1000000)
+    parser.add_argument("--lookups", type=int, default=20000)
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--budget-ms", type=float, default=1.0)
+    sys.exit(0 if run(parser.parse_args()) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Conformance check for the storage backends in storage.py: the same operations and expectations against each one.
+
+    python benchmarks/check_storage.py local
+    python benchmarks/check_storage.py gridfs                     # in MONGO_DB (scratch database, dropped afterwards)
+    python benchmarks/check_storage.py s3 --bucket ocp-check      # S3_ENDPOINT_URL + AWS_* credentials, e.g. MinIO:
+
+    docker run -p 9000:9000 -e MINIO_ROOT_USER=minio -e MINIO_ROOT_PASSWORD=minio123 minio/minio server /data
+    S3_ENDPOINT_URL=http://localhost:9000 AWS_ACCESS_KEY_ID=minio AWS_SECRET_ACCESS_KEY=minio123 AWS_DEFAULT_REGION=us-east-1 \\
+        python benchmarks/check_storage.py s3 --bucket ocp-check --create-bucket
+
+Covers multi-part writes (larger than S3Storage.PART_SIZE), stat, whole and ranged reads (as the view/download
+endpoints issue them), empty objects, move, delete and abort. Exits non-zero if anything differs.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+
+import common  # noqa: F401  (puts the backend directory on sys.path)
+from storage import LocalStorage, GridFSStorage, S3Storage, READ_CHUNK
+
+SIZE = S3Storage.PART_SIZE + 3 * READ_CHUNK + 17   # two multipart parts, reads that do not end on a chunk boundary
+
+
+async def read_all(storage, key: str, start: int = 0, end: int = None) -> bytes:
+    return b"".join([chunk async for chunk in storage.read(key, start, end)])
+
+
+async def write(storage, key: str, data: bytes, piece: int = 100_000):
+    writer = await storage.open_writer(key)
+    for i in range(0, len(data), piece): await writer.write(data[i:i + piece])
+    await writer.close()
+
+
+async def check(storage) -> list:
+    failures = []
+
+    def expect(name, ok):
+        print(f"  {'ok  ' if ok else 'FAIL'} {name}")
+        if not ok: failures.append(name)
+
+    data = os.urandom(SIZE)
+    await write(storage, "check/blob", data)
+    stat = await storage.stat("check/blob")
+    expect("stat after a multi-part write", stat is not None and stat["size"] == SIZE and stat["mtime"] > 0)
+    expect("whole read", await read_all(storage, "check/blob") == data)
+    expect("range in the middle", await read_all(storage, "check/blob", 1000, 1999) == data[1000:2000])
+    expect("range to the end", await read_all(storage, "check/blob", SIZE - 10) == data[-10:])
+    expect("range ending on the last byte", await read_all(storage, "check/blob", SIZE - 10, SIZE - 1) == data[-10:])
+    expect("first byte", await read_all(storage, "check/blob", 0, 0) == data[:1])
+
+    await write(storage, "check/empty", b"")
+    stat = await storage.stat("check/empty")
+    expect("empty object: stat", stat is not None and stat["size"] == 0)
+    expect("empty object: whole read", await read_all(storage, "check/empty") == b"")
+
+    await storage.move("check/blob", "check/moved")
+    expect("move: old key gone", await storage.stat("check/blob") is None)
+    expect("move: new key readable", await read_all(storage, "check/moved", 0, 99) == data[:100])
+
+    writer = await storage.open_writer("check/aborted")
+    await writer.write(os.urandom(S3Storage.PART_SIZE + 1)); await writer.abort()
+    expect("abort leaves nothing behind", await storage.stat("check/aborted") is None)
+
+    for key in ("check/moved", "check/empty"): await storage.delete(key)
+    expect("delete", await storage.stat("check/moved") is None and await storage.stat("check/empty") is None)
+    await storage.delete("check/never-existed")
+    expect("delete of a missing key is a no-op", True)
+    expect("stat of a missing key is None", await storage.stat("check/never-existed") is None)
+    return failures
+
+
+async def run(args) -> bool:
+    if args.backend == "local":
+        with tempfile.TemporaryDirectory() as root:
+            failures = await check(LocalStorage(root))
+    elif args.backend == "gridfs":
+        import main
+        try: failures = await check(GridFSStorage(main.db, "check_uploads"))
+        finally: await main.client.drop_database(main.db.name)
+    else:
+        storage = S3Storage(args.bucket, "ocp-check", os.getenv("S3_ENDPOINT_URL"))
+        if args.create_bucket: storage.client.create_bucket(Bucket=args.bucket)
+        failures = await check(storage)
+    print("ok" if not failures else f"FAILED: {len(failures)} check(s)")
+    return not failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("backend", choices=["local", "gridfs", "s3"])
+    parser.add_argument("--bucket", default="ocp-check")
+    parser.add_argument("--create-bucket", action="store_true")
+    sys.exit(0 if asyncio.run(run(parser.parse_args())) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Shared setup for the benchmark scripts in this directory.
+
+Every script points main.py at a scratch database (MONGO_DB, default "ocp_benchmark") before importing it, seeds what it
+needs there and drops it when done. Run them from the backend directory against a local MongoDB:
+
+    pip install httpx
+    python benchmarks/<script>.py --help
+
+Scripts that need a real HTTP server (streaming, several workers, a fronting proxy) take --base-url; start that server
+with the same MONGO_DB, e.g. `MONGO_DB=ocp_benchmark uvicorn main:app --port 8000`.
+"""
+import os
+import sys
+import time
+from contextlib import asynccontextmanager, nullcontext
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.environ.setdefault("MONGO_DB", "ocp_benchmark")
+if os.environ["MONGO_DB"] == "online_course_portal":
+    sys.exit("Refusing to benchmark against the application database; set MONGO_DB to a scratch database")
+
+import httpx
+
+
+# ==============================================================================
+# CLIENTS AND DATA
+# ==============================================================================
+@asynccontextmanager
+async def app_client(keep: bool = False, lifespan: bool = True):
+    """An httpx client talking to main.app in-process; drops the scratch database afterwards. lifespan=False skips the
+    startup work (indexes, autocomplete build, broker) when a measurement must not include it."""
+    import main
+    try:
+        async with main.app.router.lifespan_context(main.app) if lifespan else nullcontext():
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench", timeout=None) as client:
+                yield client
+    finally:
+        if not keep: await main.client.drop_database(main.db.name)
+
+
+@asynccontextmanager
+async def server_client(base_url: str, keep: bool = False):
+    """An httpx client for a running server (see the module docstring); drops the scratch database afterwards."""
+    import main
+    try:
+        await main.ensure_indexes()
+        async with httpx.AsyncClient(base_url=base_url, timeout=None) as client:
+            yield client
+    finally:
+        if not keep: await main.client.drop_database(main.db.name)
+
+
+def student_doc(i: int, **fields) -> dict:
+    return {"full_name": f"Student {i}", "email": f"student{i}@bench.example", "password": "pass", "date_of_birth": "2000-01-01",
+            "gender": "other", "security_question": "q", "security_answer": "a", **fields}
+
+
+def admin_doc(i: int = 0) -> dict:
+    return {"full_name": f"Admin {i}", "email": f"admin{i}@bench.example", "password": "pass", "date_of_birth": "1980-01-01",
+            "gender": "other", "security_question": "q", "security_answer": "a"}
+
+
+async def insert_batched(collection, docs, batch: int = 5000) -> list:
+    ids, chunk = [], []
+    for doc in docs:
+        chunk.append(doc)
+        if len(chunk) >= batch:
+            ids += (await collection.insert_many(chunk)).inserted_ids; chunk = []
+    if chunk: ids += (await collection.insert_many(chunk)).inserted_ids
+    return ids
+
+
+async def login(client, role: str, email: str) -> dict:
+    r = await client.post(f"/api/v1/{role}/login", json={"email": email, "password": "pass"})
+    r.raise_for_status()
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+
+# ==============================================================================
+# MEASURING
+# ==============================================================================
+def percentile(samples, q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else float("nan")
+
+
+def latency_row(label: str, samples, extra: str = "") -> str:
+    """One result line; samples in seconds, printed in milliseconds."""
+    return (f"{label:<28} n={len(samples):<6} p50={percentile(samples, .5) * 1000:8.2f}ms  p99={percentile(samples, .99) * 1000:8.2f}ms"
+            f"  max={max(samples, default=float('nan')) * 1000:8.2f}ms  {extra}").rstrip()
+
+
+class Timer:
+    def __enter__(self):
+        self.start = time.perf_counter(); return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
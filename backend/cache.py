@@ -0,0 +1,136 @@
+import asyncio
+import time
+from collections import OrderedDict
+from threading import Lock
+
+# ==============================================================================
+# BOUNDED TTL / LRU CACHE
+# ==============================================================================
+class TTLCache:
+    """Small in-process LRU cache whose entries expire `ttl` seconds after they are set.
+
+    Used for values that are cheap to rebuild but hit on every request (e.g. the
+    authenticated principal). `enabled=False` turns every lookup into a miss.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0, enabled: bool = True):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        if not self.enabled:
+            self.misses += 1
+            return None
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None: del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        if not self.enabled: return
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def invalidate_where(self, predicate):
+        """Drop every entry whose (key, value) matches `predicate`."""
+        with self._lock:
+            for key in [k for k, (_, v) in self._data.items() if predicate(k, v)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        return {"enabled": self.enabled, "size": len(self._data), "maxsize": self.maxsize, "ttl": self.ttl, "hits": self.hits, "misses": self.misses}
+
+
+# ==============================================================================
+# STALE-WHILE-REVALIDATE CACHE (ASYNC, SINGLE-FLIGHT)
+# ==============================================================================
+class SWRCache:
+    """Async cache for expensive computations, keyed by e.g. page parameters.
+
+    A value younger than `fresh` seconds is served as is (HIT). Until `fresh + stale`
+    seconds it is still served (STALE) while one background task recomputes it; older
+    or missing values are computed inline (MISS). Concurrent loads of one key share a
+    single in-flight task. `clear()` also disowns the loads in flight: what they return
+    is handed to their callers but not stored, since it may predate the change.
+    """
+
+    def __init__(self, fresh: float, stale: float = 0.0, maxsize: int = 256, enabled: bool = True):
+        self.fresh = fresh
+        self.stale = stale
+        self.maxsize = maxsize
+        self.enabled = enabled
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._inflight = {}
+        self._generation = 0   # bumped by clear(); a load started under an older one is not stored
+
+    async def get(self, key, loader):
+        """Return (value, age in seconds, "HIT" | "STALE" | "MISS"); `loader` is an async callable."""
+        entry = self._data.get(key) if self.enabled else None
+        if entry is not None:
+            age = time.monotonic() - entry[0]
+            if age < self.fresh + self.stale:
+                self._data.move_to_end(key)
+                if age < self.fresh:
+                    self.hits += 1
+                    return entry[1], age, "HIT"
+                self.stale_hits += 1
+                self._load(key, loader)
+                return entry[1], age, "STALE"
+        self.misses += 1
+        # shield: a caller that disconnects must not cancel the load other callers are waiting on
+        return await asyncio.shield(self._load(key, loader)), 0.0, "MISS"
+
+    def _load(self, key, loader) -> asyncio.Task:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._run(key, loader, self._generation))
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())  # background refresh errors are logged in _run
+            self._inflight[key] = task
+        return task
+
+    async def _run(self, key, loader, generation: int):
+        try:
+            value = await loader()
+        except Exception as e:
+            print(f"❌ Cache refresh failed for {key!r}: {e}")
+            raise
+        finally:
+            if self._inflight.get(key) is asyncio.current_task(): del self._inflight[key]
+        if self.enabled and generation == self._generation:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return value
+
+    def clear(self):
+        self._generation += 1
+        self._data.clear()
+        self._inflight.clear()
+
+    def stats(self) -> dict:
+        return {"enabled": self.enabled, "size": len(self._data), "fresh": self.fresh, "stale": self.stale, "hits": self.hits, "stale_hits": self.stale_hits, "misses": self.misses, "inflight": len(self._inflight)}
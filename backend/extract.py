@@ -0,0 +1,71 @@
+import importlib.util
+import io
+import re
+from functools import lru_cache
+
+# ==============================================================================
+# TEXT EXTRACTION FOR UPLOADED COURSE FILES
+# ==============================================================================
+# Runs inside the extraction worker processes, so this module must not import main (or anything that connects to the
+# database). pypdf and python-docx are imported lazily; supported() reports a type as unsupported when its library is not
+# installed, so those files are skipped instead of failing in the worker.
+CHUNK_CHARS = 1000
+MAX_CHUNKS = 2000
+MIN_TERM = 2
+
+EXTRACTORS = {}
+REQUIRES = {}
+
+def extractor(*extensions, requires: str):
+    def register(fn):
+        for ext in extensions: EXTRACTORS[ext] = fn; REQUIRES[ext] = requires
+        return fn
+    return register
+
+@lru_cache(maxsize=None)
+def installed(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+def supported(filename: str) -> bool:
+    ext = filename.lower().rsplit(".", 1)[-1]
+    return ext in EXTRACTORS and installed(REQUIRES[ext])
+
+def terms(text: str) -> list:
+    """Distinct lower-cased word tokens, in order of first appearance (the same tokenizer serves indexing and queries)."""
+    return [w for w in dict.fromkeys(re.findall(r"\w+", text.lower())) if len(w) >= MIN_TERM]
+
+@extractor("pdf", requires="pypdf")
+def pdf_pages(f):
+    from pypdf import PdfReader
+    for number, page in enumerate(PdfReader(f).pages, start=1):
+        yield number, page.extract_text() or ""
+
+@extractor("docx", requires="docx")
+def docx_paragraphs(f):
+    from docx import Document
+    document = Document(f)
+    yield None, "\n".join(p.text for p in document.paragraphs)
+    for table in document.tables:
+        yield None, "\n".join(cell.text for row in table.rows for cell in row.cells)
+
+def split_text(text: str):
+    """Pieces of at most CHUNK_CHARS, cut at whitespace where possible."""
+    # PDF text can carry lone surrogates, which BSON cannot encode
+    text = re.sub(r"\s+", " ", text).encode("utf-8", "ignore").decode("utf-8").strip()
+    while text:
+        if len(text) <= CHUNK_CHARS: yield text; return
+        cut = text.rfind(" ", 0, CHUNK_CHARS)
+        if cut <= 0: cut = CHUNK_CHARS
+        yield text[:cut]
+        text = text[cut:].lstrip()
+
+def extract_chunks(source, filename: str) -> list:
+    """[{n, page, text, terms}] for a file given as a local path or its bytes. Pages (PDF) are never merged into one chunk."""
+    extract = EXTRACTORS[filename.lower().rsplit(".", 1)[-1]]
+    chunks = []
+    with (open(source, "rb") if isinstance(source, str) else io.BytesIO(source)) as f:
+        for page, text in extract(f):
+            for piece in split_text(text):
+                chunks.append({"n": len(chunks), "page": page, "text": piece, "terms": terms(piece)})
+                if len(chunks) >= MAX_CHUNKS: return chunks
+    return chunks
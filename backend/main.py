@@ -1,28 +1,89 @@
-from fastapi import FastAPI, HTTPException, Request, Form, UploadFile, File, Depends
+from fastapi import FastAPI, HTTPException, Request, Response, Form, Depends, Query
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import FileResponse, StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.encoders import jsonable_encoder
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, EmailStr, Field
 from typing import Optional, List
-from pymongo import MongoClient
+from pymongo import AsyncMongoClient, IndexModel, UpdateOne, ASCENDING, DESCENDING, TEXT, ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from contextlib import asynccontextmanager
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from python_multipart.multipart import MultipartParser, parse_options_header
+from python_multipart.exceptions import MultipartParseError
 from bson.objectid import ObjectId
-from datetime import datetime
-import shutil
+from bson import json_util
+from datetime import datetime, timedelta
+from urllib.parse import quote, urlencode, parse_qsl
+from email.utils import formatdate
 import os
+import re
+import asyncio
+import multiprocessing
+import json
+import base64
+import hashlib
+import csv
+import io
 import mimetypes
+import time
+from cache import TTLCache, SWRCache
+from suggest import PrefixIndex
+from pubsub import broker_from_env
+from auth import create_access_token, decode_access_token, jwt_configured, MIN_SECRET_BYTES, sign_url, verify_url_signature, url_signing_configured
+from storage import storage_from_env
+from extract import extract_chunks, supported as extraction_supported, terms as text_terms
 
 # ==============================================================================
 # 1. APPLICATION SETUP
 # ==============================================================================
 
-app = FastAPI(title="Online Course Portal API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await ensure_indexes()
+    if not await stats_collection.find_one({"_id": DASHBOARD_STATS_ID}): await reconcile_counters()
+    if not await conversations_collection.find_one({}, {"_id": 1}) and await messages_collection.find_one({}, {"_id": 1}): await backfill_conversations()
+    if not await search_terms_collection.find_one({}, {"_id": 1}) and await courses_collection.find_one({}, {"_id": 1}): await rebuild_search_terms()
+    await build_suggestions()
+    await broker.start()
+    track_indexing(index_pending_content())
+    yield
+    await broker.close()
+    for task in list(indexing_tasks): task.cancel()
+    if extract_pool: extract_pool.shutdown(cancel_futures=True)
 
-# Serve uploaded files statically
+app = FastAPI(title="Online Course Portal API", lifespan=lifespan)
+
+class SignedStaticFiles(StaticFiles):
+    """Static files served only for a valid, unexpired signature (see `signed_file_url`); no database access."""
+    async def get_response(self, path: str, scope):
+        params = dict(parse_qsl(scope.get("query_string", b"").decode()))
+        url_path = "/uploads/" + path.replace(os.sep, "/")
+        name, disposition = params.get("name", ""), params.get("disposition", "")
+        if disposition not in ("inline", "attachment") or not verify_url_signature(url_path, params.get("exp"), f"{name}\n{disposition}", params.get("sig")):
+            return PlainTextResponse("Invalid or expired link", status_code=403)
+        if storage.name != "local":
+            # Remote storage: nothing on local disk, stream the object instead
+            key = path.replace(os.sep, "/")
+            stat = await storage.stat(key)
+            if stat is None: return PlainTextResponse("Not Found", status_code=404)
+            response = await stream_stored_file(Request(scope), {"key": key, "name": name, "content_type": guess_content_type(name), **stat}, disposition)
+        else:
+            response = await super().get_response(path, scope)
+        if response.status_code in (200, 206):
+            response.headers["Content-Type"] = guess_content_type(name)
+            response.headers["Content-Disposition"] = f'{disposition}; filename="{name}"'
+            response.headers["Cache-Control"] = f"private, max-age={max(int(params['exp']) - int(time.time()), 0)}"
+        return response
+
+# Serve uploaded files statically, behind signed, expiring URLs
 # Get the directory where this script is located
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 UPLOADS_DIR = os.path.join(BASE_DIR, "uploads")
 os.makedirs(UPLOADS_DIR, exist_ok=True)
-app.mount("/uploads", StaticFiles(directory=UPLOADS_DIR), name="uploads")
+app.mount("/uploads", SignedStaticFiles(directory=UPLOADS_DIR), name="uploads")
 
 
 
@@ -32,12 +93,18 @@ app.add_middleware(
     allow_credentials=True, 
     allow_methods=["*"], 
     allow_headers=["*"],
-    expose_headers=["Content-Disposition"]
+    expose_headers=["Content-Disposition", "ETag", "Age", "X-Cache", "Accept-Ranges", "Content-Range", "Content-Length"]
 )
 
-# Database Connection
-client = MongoClient("mongodb://localhost:27017/")
-db = client["online_course_portal"]
+# Database Connection (MONGO_DB lets the benchmarks under benchmarks/ run against a scratch database)
+client = AsyncMongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017/"))
+db = client[os.getenv("MONGO_DB", "online_course_portal")]
+
+# Where uploaded course files live: local UPLOADS_DIR, GridFS or an S3-compatible bucket (see storage.py)
+storage = storage_from_env(db, UPLOADS_DIR)
+
+# Pushed message events: in-process fan-out, or Redis when several workers serve the streams (see pubsub.py)
+broker = broker_from_env()
 
 # Collections
 students_collection = db["students"]
@@ -45,6 +112,249 @@ admins_collection = db["admins"]
 courses_collection = db["courses"]
 reviews_collection = db["reviews"]
 messages_collection = db["messages"]
+conversations_collection = db["conversations"]
+stats_collection = db["stats"]
+versions_collection = db["versions"]
+enrollment_buckets_collection = db["enrollment_buckets"]
+blobs_collection = db["blobs"]
+search_terms_collection = db["search_terms"]
+content_chunks_collection = db["content_chunks"]
+
+# Indexes backing the hot lookups; built idempotently at startup (see `python manage.py indexes`)
+INDEXES = {
+    "students": [
+        IndexModel([("email", ASCENDING)], unique=True, name="email_unique"),
+        IndexModel([("access_token", ASCENDING)], sparse=True, name="access_token_sparse"),
+        IndexModel([("enrolled_courses", ASCENDING)], name="enrolled_courses"),
+        IndexModel([("completed_courses", ASCENDING)], name="completed_courses"),
+    ],
+    "courses": [
+        IndexModel([("enrollment_count", DESCENDING)], name="enrollment_count_desc"),
+        IndexModel([("title", TEXT), ("description", TEXT)], weights={"title": 10, "description": 1}, name="title_description_text"),
+    ],
+    "admins": [
+        IndexModel([("email", ASCENDING)], unique=True, name="email_unique"),
+        IndexModel([("access_token", ASCENDING)], sparse=True, name="access_token_sparse"),
+    ],
+    "messages": [
+        IndexModel([("recipient_id", ASCENDING), ("sender_type", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)], name="recipient_sender_timestamp_id"),
+        IndexModel([("sender_type", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)], name="sender_type_timestamp_id"),
+        IndexModel([("conversation_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)], name="conversation_timestamp_id"),
+    ],
+    "conversations": [
+        IndexModel([("student_id", ASCENDING)], unique=True, name="student_unique"),
+        IndexModel([("last_message_at", DESCENDING), ("_id", DESCENDING)], name="last_message_at_id_desc"),
+    ],
+    "reviews": [
+        IndexModel([("created_at", DESCENDING), ("_id", DESCENDING)], name="created_at_id_desc"),
+        IndexModel([("course_id", ASCENDING), ("created_at", DESCENDING)], name="course_created_at"),
+    ],
+    "enrollment_buckets": [
+        IndexModel([("course_id", ASCENDING), ("day", ASCENDING)], unique=True, name="course_day_unique"),
+        IndexModel([("day", ASCENDING)], name="day"),
+    ],
+    "content_chunks": [
+        IndexModel([("course_id", ASCENDING), ("terms", ASCENDING)], name="course_terms"),
+        IndexModel([("course_id", ASCENDING), ("content_id", ASCENDING)], name="course_content_id"),
+        IndexModel([("sha256", ASCENDING)], name="sha256"),
+    ],
+}
+
+async def ensure_indexes():
+    for collection_name, models in INDEXES.items():
+        try:
+            await db[collection_name].create_indexes(models)
+        except OperationFailure as e:
+            # A missing secondary index only costs speed (the report command shows it). The unique ones are what keep
+            # registration, conversations and enrollment buckets free of duplicates, so without them do not start.
+            for model in [m for m in models if m.document.get("unique")]:
+                try: await db[collection_name].create_indexes([model])
+                except OperationFailure as unique_error:
+                    # e.g. IndexOptionsConflict: an operator already built the same unique index under another name
+                    if await has_unique_index(db[collection_name], model): continue
+                    raise RuntimeError(f"Could not build the unique index {model.document['name']} on {collection_name} ({unique_error}); remove the duplicate documents and restart") from unique_error
+            print(f"❌ Could not build indexes on {collection_name}: {e}")
+
+async def has_unique_index(collection, model: IndexModel) -> bool:
+    """Whether `collection` already has a unique index on exactly the model's key, whatever its name."""
+    key = list(model.document["key"].items())
+    return any([ix.get("unique") and list(ix["key"].items()) == key async for ix in await collection.list_indexes()])
+
+# Dashboard counters: one small document in `stats`, kept current with $inc by the write paths.
+# Per-course `enrollment_count` and per-student `completed_courses` feed it; `python manage.py reconcile-stats` rebuilds all three.
+DASHBOARD_STATS_ID = "dashboard"
+
+async def bump_stats(**deltas):
+    await stats_collection.update_one({"_id": DASHBOARD_STATS_ID}, {"$inc": deltas}, upsert=True)
+
+async def backfill_content_count(only_missing: bool = True) -> int:
+    """Set courses.content_count from the course_content array; returns how many courses were written."""
+    query = {"content_count": {"$exists": False}} if only_missing else {}
+    course_ids = await courses_collection.distinct("_id", query)
+    result = await courses_collection.update_many({"_id": {"$in": course_ids}}, [{"$set": {"content_count": {"$size": {"$ifNull": ["$course_content", []]}}}}])
+    if result.modified_count: await bump_versions(*course_ids)
+    return result.modified_count
+
+# Per-enrollment completion state lives in `enrollments.<course_id>` on the student document:
+# {completed_items, total_items, percentage, completed_at}. It is updated with pipeline updates so each write is atomic.
+def refresh_enrollment_stage(course_key: str) -> dict:
+    """Pipeline stage recomputing percentage/completed_at from completed_items/total_items."""
+    e = f"enrollments.{course_key}"
+    done, total = f"${e}.completed_items", f"${e}.total_items"
+    is_complete = {"$and": [{"$gt": [total, 0]}, {"$eq": [done, total]}]}
+    return {"$set": {
+        f"{e}.percentage": {"$cond": [{"$gt": [total, 0]}, {"$toInt": {"$round": [{"$multiply": [{"$divide": [done, total]}, 100]}, 0]}}, 0]},
+        f"{e}.completed_at": {"$cond": [is_complete, {"$ifNull": [f"${e}.completed_at", "$$NOW"]}, None]},
+    }}
+
+async def record_course_completed(student_id: ObjectId, course_id: ObjectId):
+    previous = await students_collection.find_one_and_update({"_id": student_id, "completed_courses": {"$ne": course_id}}, {"$addToSet": {"completed_courses": course_id}}, projection={"completed_courses": 1})
+    if previous is not None and not previous.get("completed_courses"): await bump_stats(completed_students=1)
+
+async def clear_course_completions(course_id: ObjectId):
+    """Course got new content or was deleted: nobody has completed it any more."""
+    only_completion = await students_collection.count_documents({"completed_courses": [course_id]})
+    await students_collection.update_many({"completed_courses": course_id}, {"$pull": {"completed_courses": course_id}})
+    if only_completion: await bump_stats(completed_students=-only_completion)
+
+async def forget_student(student: dict):
+    """Undo a deleted student's contribution to the counters (and drop them from autocomplete)."""
+    student_suggestions.remove(str(student["_id"]))
+    await conversations_collection.delete_one({"student_id": student["_id"]})
+    await bump_stats(total_students=-1, completed_students=-1 if student.get("completed_courses") else 0)
+    if student.get("enrolled_courses"):
+        await courses_collection.update_many({"_id": {"$in": student["enrolled_courses"]}}, {"$inc": {"enrollment_count": -1}})
+
+async def reconcile_counters(apply: bool = True) -> dict:
+    """Recompute every counter from the source documents; returns the drift that was found (and fixed if `apply`):
+    the dashboard stats that differ, and how many documents had a wrong value of each per-course / per-student field."""
+    course_totals, touched = {}, set()
+    drift = {"stats": {}, "content_count": 0, "enrollment_count": 0, "completed_courses": 0, "enrollments": 0}
+    async for course in courses_collection.find({}, {"course_content.content_id": 1, "content_count": 1, "enrollment_count": 1}):
+        course_totals[course["_id"]] = len(course.get("course_content", []))
+        if course.get("content_count") != course_totals[course["_id"]]:
+            drift["content_count"] += 1; touched.add(course["_id"])
+            if apply: await courses_collection.update_one({"_id": course["_id"]}, {"$set": {"content_count": course_totals[course["_id"]]}})
+    enrollment_counts = defaultdict(int)
+    totals = {"total_students": 0, "completed_students": 0, "total_courses": len(course_totals)}
+
+    async for student in students_collection.find({}, {"enrolled_courses": 1, "progress": 1, "completed_courses": 1, "enrollments": 1}):
+        progress = student.get("progress", {})
+        completed = [c for c in student.get("enrolled_courses", []) if course_totals.get(c, 0) > 0 and len(progress.get(str(c), [])) == course_totals[c]]
+        enrollments = student.get("enrollments", {})
+        expected = {}
+        for c in student.get("enrolled_courses", []):
+            if c not in course_totals: continue
+            done, total = len(progress.get(str(c), [])), course_totals[c]
+            current = enrollments.get(str(c), {})
+            expected[str(c)] = {"completed_items": done, "total_items": total, "percentage": round(done / total * 100) if total else 0,
+                                "completed_at": (current.get("completed_at") or datetime.utcnow()) if c in completed else None}
+        for c in student.get("enrolled_courses", []):
+            if c in course_totals: enrollment_counts[c] += 1
+        totals["total_students"] += 1
+        if completed: totals["completed_students"] += 1
+        stale_enrollments = {k: v for k, v in expected.items() if {f: enrollments.get(k, {}).get(f) for f in ("completed_items", "total_items", "percentage")} != {f: v[f] for f in ("completed_items", "total_items", "percentage")} or bool(enrollments.get(k, {}).get("completed_at")) != bool(v["completed_at"])}
+        wrong_completed, wrong_enrollments = set(completed) != set(student.get("completed_courses", [])), bool(stale_enrollments or set(enrollments) - set(expected))
+        drift["completed_courses"] += wrong_completed; drift["enrollments"] += wrong_enrollments
+        if apply and (wrong_completed or wrong_enrollments): await students_collection.update_one({"_id": student["_id"]}, {"$set": {"completed_courses": completed, "enrollments": expected}})
+
+    async for course in courses_collection.find({}, {"enrollment_count": 1}):
+        if course.get("enrollment_count", 0) != enrollment_counts[course["_id"]]:
+            drift["enrollment_count"] += 1
+            if apply: await courses_collection.update_one({"_id": course["_id"]}, {"$set": {"enrollment_count": enrollment_counts[course["_id"]]}})
+
+    stored = await stats_collection.find_one({"_id": DASHBOARD_STATS_ID}) or {}
+    drift["stats"] = {k: {"stored": stored.get(k), "actual": v} for k, v in totals.items() if stored.get(k) != v}
+    if apply:
+        await stats_collection.update_one({"_id": DASHBOARD_STATS_ID}, {"$set": totals}, upsert=True)
+        if touched: await bump_versions(*touched)
+    return drift
+
+# Trending: enroll events land in one bucket per (course, UTC day) holding the day's `count` and per-hour `hours.HH`.
+# Windows are answered from the buckets alone; "all" reads the per-course enrollment_count.
+TRENDING_WINDOWS = {"24h": 1, "7d": 7, "30d": 30}
+TRENDING_DASHBOARD_WINDOW = os.getenv("TRENDING_DASHBOARD_WINDOW", "7d")
+
+async def record_enrollment_event(course_id: ObjectId):
+    now = datetime.utcnow()
+    day = datetime(now.year, now.month, now.day)
+    await enrollment_buckets_collection.update_one({"course_id": course_id, "day": day}, {"$inc": {"count": 1, f"hours.{now.hour:02d}": 1}}, upsert=True)
+
+async def top_courses(window: str, k: int) -> list:
+    """Top-k courses by enrollments in the window: [{course_id, title, enrollments}]."""
+    if window == "all":
+        ranked = [(c["_id"], c["enrollment_count"]) async for c in courses_collection.find({"enrollment_count": {"$gt": 0}}, {"enrollment_count": 1}, sort=[("enrollment_count", DESCENDING)], limit=k)]
+    elif window == "24h":
+        # Sum the hourly slots of today's and yesterday's buckets that fall inside the last 24 hours
+        now = datetime.utcnow()
+        since = now.replace(minute=0, second=0, microsecond=0) - timedelta(hours=23)
+        totals = defaultdict(int)
+        async for bucket in enrollment_buckets_collection.find({"day": {"$gte": since.replace(hour=0)}}, {"course_id": 1, "day": 1, "hours": 1}):
+            totals[bucket["course_id"]] += sum(n for hour, n in bucket.get("hours", {}).items() if bucket["day"] + timedelta(hours=int(hour)) >= since)
+        ranked = sorted(((c, n) for c, n in totals.items() if n > 0), key=lambda item: (-item[1], item[0]))[:k]
+    else:
+        now = datetime.utcnow()
+        since = datetime(now.year, now.month, now.day) - timedelta(days=TRENDING_WINDOWS[window] - 1)
+        ranked = [(row["_id"], row["enrollments"]) async for row in await enrollment_buckets_collection.aggregate([
+            {"$match": {"day": {"$gte": since}}},
+            {"$group": {"_id": "$course_id", "enrollments": {"$sum": "$count"}}},
+            {"$sort": {"enrollments": -1, "_id": 1}},
+            {"$limit": k}])]
+    titles = {c["_id"]: c["title"] async for c in courses_collection.find({"_id": {"$in": [c for c, _ in ranked]}}, {"title": 1})}
+    return [{"course_id": str(c), "title": titles[c], "enrollments": n} for c, n in ranked if c in titles]
+
+# Content versions: {_id: "catalog" | course ObjectId, v} bumped whenever a course payload changes.
+# Read endpoints derive their ETags from these so a revalidation never has to load the course documents.
+# enrollment_count changes on every enrollment, so the student-facing payloads leave it out and enrolling bumps nothing.
+CATALOG_VERSION_ID = "catalog"
+STUDENT_COURSE_HIDDEN = {"enrollment_count": 0}
+
+async def bump_versions(*course_ids):
+    keys = [CATALOG_VERSION_ID, *course_ids]
+    await versions_collection.bulk_write([UpdateOne({"_id": k}, {"$inc": {"v": 1}}, upsert=True) for k in keys], ordered=False)
+
+async def get_versions(*keys) -> dict:
+    """Version per key; keys that were never bumped are at 0."""
+    found = {d["_id"]: d["v"] async for d in versions_collection.find({"_id": {"$in": list(keys)}})}
+    return {k: found.get(k, 0) for k in keys}
+
+# Auth mode: "session" (opaque token stored on the user document) or "jwt" (signed and verified in memory; the account
+# behind it is still looked up, through the session cache, so deleted accounts and renames take effect)
+AUTH_MODE = os.getenv("AUTH_MODE", "session").lower()
+if AUTH_MODE == "jwt" and not jwt_configured():
+    raise RuntimeError(f"AUTH_MODE=jwt requires JWT_SECRET_KEY (at least {MIN_SECRET_BYTES} bytes of random data)")
+
+# Session cache: token -> principal (only identity fields, never progress/enrollments)
+SESSION_CACHE_ENABLED = os.getenv("SESSION_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", "300"))
+SESSION_CACHE_MAXSIZE = int(os.getenv("SESSION_CACHE_MAXSIZE", "10000"))
+session_cache = TTLCache(maxsize=SESSION_CACHE_MAXSIZE, ttl=SESSION_CACHE_TTL, enabled=SESSION_CACHE_ENABLED)
+PRINCIPAL_PROJECTION = {"full_name": 1, "email": 1}
+
+# Admin aggregate cache: per endpoint (fresh seconds, extra seconds a stale value may be served while it refreshes)
+ADMIN_CACHE_ENABLED = os.getenv("ADMIN_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+ADMIN_CACHE_POLICIES = {
+    "dashboard": (float(os.getenv("DASHBOARD_CACHE_FRESH", "10")), float(os.getenv("DASHBOARD_CACHE_STALE", "60"))),
+    "students": (float(os.getenv("STUDENTS_CACHE_FRESH", "30")), float(os.getenv("STUDENTS_CACHE_STALE", "300"))),
+    "reviews": (float(os.getenv("REVIEWS_CACHE_FRESH", "30")), float(os.getenv("REVIEWS_CACHE_STALE", "300"))),
+}
+admin_caches = {name: SWRCache(fresh, stale, enabled=ADMIN_CACHE_ENABLED) for name, (fresh, stale) in ADMIN_CACHE_POLICIES.items()}
+
+# Autocomplete: in-process prefix indexes over course titles and student names/emails. Built at startup and kept
+# current by this process's write paths; with several worker processes, another worker's writes show up after a restart.
+SUGGEST_LIMIT = 10
+course_suggestions = PrefixIndex()
+student_suggestions = PrefixIndex()
+
+def course_suggestion(course: dict) -> tuple:
+    return str(course["_id"]), [course.get("title")], [], {"_id": str(course["_id"]), "title": course.get("title")}
+
+def student_suggestion(student: dict) -> tuple:
+    return str(student["_id"]), [student.get("full_name")], [student.get("email")], {"_id": str(student["_id"]), "full_name": student.get("full_name"), "email": student.get("email")}
+
+async def build_suggestions():
+    course_suggestions.build([course_suggestion(c) async for c in courses_collection.find({}, {"title": 1})])
+    student_suggestions.build([student_suggestion(s) async for s in students_collection.find({}, PRINCIPAL_PROJECTION)])
 
 # ==============================================================================
 # 2. PYDANTIC MODELS
@@ -79,121 +389,350 @@ class StudentMessageSchema(BaseModel):
 # ==============================================================================
 # 3. AUTHENTICATION HELPERS
 # ==============================================================================
-async def get_current_student(request: Request):
+def get_bearer_token(request: Request) -> str:
     auth_header = request.headers.get("Authorization")
     if not auth_header or "Bearer " not in auth_header: raise HTTPException(status_code=401, detail="Not authenticated")
-    token = auth_header.split(" ")[1]
-    student = students_collection.find_one({"access_token": token})
-    if not student: raise HTTPException(status_code=401, detail="Invalid token")
+    return auth_header.split(" ")[1]
+
+def principal_query(token: str, role: str) -> dict:
+    """How a bearer token finds its account. Session mode: the stored opaque token. JWT mode: the subject of a token
+    whose signature, expiry, issuer and audience check out (every request, in memory), so a deleted account stops working."""
+    if AUTH_MODE != "jwt": return {"access_token": token}
+    claims = decode_access_token(token)
+    if not claims or claims.get("role") != role or not ObjectId.is_valid(claims.get("sub", "")):
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return {"_id": ObjectId(claims["sub"])}
+
+def issue_token(role: str, user: dict) -> str:
+    if AUTH_MODE == "jwt":
+        return create_access_token({"sub": str(user["_id"]), "role": role})
+    return f"fake-{role}-token-for-{user['_id']}"
+
+async def get_current_student(request: Request):
+    token = get_bearer_token(request)
+    query = principal_query(token, "student")
+    student = session_cache.get(("student", token))
+    if student is None:
+        student = await students_collection.find_one(query, PRINCIPAL_PROJECTION)
+        if not student: raise HTTPException(status_code=401, detail="Invalid token")
+        session_cache.set(("student", token), student)
     return student
 
 async def get_current_admin(request: Request):
-    auth_header = request.headers.get("Authorization")
-    if not auth_header or "Bearer " not in auth_header: raise HTTPException(status_code=401, detail="Not authenticated")
-    token = auth_header.split(" ")[1]
-    admin = admins_collection.find_one({"access_token": token})
-    if not admin: raise HTTPException(status_code=401, detail="Invalid token")
+    token = get_bearer_token(request)
+    query = principal_query(token, "admin")
+    admin = session_cache.get(("admin", token))
+    if admin is None:
+        admin = await admins_collection.find_one(query, PRINCIPAL_PROJECTION)
+        if not admin: raise HTTPException(status_code=401, detail="Invalid token")
+        session_cache.set(("admin", token), admin)
     return admin
 
+async def cached_aggregate(name: str, key, loader) -> tuple:
+    """Serve `loader()` through the admin cache; returns (value, Age / X-Cache headers)."""
+    value, age, state = await admin_caches[name].get(key, loader)
+    return value, {"Age": str(int(age)), "X-Cache": state}
+
+def invalidate_principal(role: str, principal_id: ObjectId):
+    """Drop every cached session of one student/admin (login, profile change, delete)."""
+    session_cache.invalidate_where(lambda key, value: key[0] == role and value["_id"] == principal_id)
+
+async def load_student(student: dict, *fields: str) -> dict:
+    """Fetch only the given fields of the authenticated student's document."""
+    projection = {f: 1 for f in fields} if fields else None
+    doc = await students_collection.find_one({"_id": student["_id"]}, projection)
+    if doc is None: raise HTTPException(status_code=401, detail="Invalid token")
+    return doc
+
+async def require_enrollment(student: dict, course_id: str) -> ObjectId:
+    if not ObjectId.is_valid(course_id) or not await students_collection.find_one({"_id": student["_id"], "enrolled_courses": ObjectId(course_id)}, {"_id": 1}):
+        raise HTTPException(status_code=403, detail="Not enrolled in this course")
+    return ObjectId(course_id)
+
+def make_etag(*parts) -> str:
+    """Strong ETag from the values a response is built from (versions, ids, page parameters)."""
+    return '"' + hashlib.sha256(json_util.dumps(parts).encode()).hexdigest()[:32] + '"'
+
+def conditional(request: Request, response: Response, etag: str) -> Optional[Response]:
+    """Set the validator on `response`; return a bare 304 when the client already holds this representation."""
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    response.headers.update(headers)
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match.strip() == "*" or etag in [t.strip().removeprefix("W/") for t in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return None
+
+# --- Keyset pagination: opaque `after` cursors over `_id` or (timestamp, _id), never skip() ---
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def encode_cursor(*values) -> str:
+    return base64.urlsafe_b64encode(json_util.dumps(values).encode()).decode()
+
+def decode_cursor(token: str) -> list:
+    try: return list(json_util.loads(base64.urlsafe_b64decode(token.encode())))
+    except Exception: raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+
+class Page:
+    """`after`/`limit` query parameters; the limit is clamped server-side."""
+    def __init__(self, after: Optional[str] = Query(None), limit: int = Query(DEFAULT_PAGE_SIZE)):
+        self.after = decode_cursor(after) if after else None
+        self.limit = min(max(limit, 1), MAX_PAGE_SIZE)
+
+    def after_id(self) -> dict:
+        """Filter for ascending `_id` order."""
+        if not self.after: return {}
+        if not isinstance(self.after[0], ObjectId): raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+        return {"_id": {"$gt": self.after[0]}}
+
+    def after_desc(self, field: str) -> dict:
+        """Filter for descending (field, _id) order."""
+        if not self.after: return {}
+        if len(self.after) != 2: raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+        value, last_id = self.after
+        # Only values this API emits (a timestamp or a score, then an _id), never documents that could smuggle in operators
+        if not isinstance(value, (datetime, int, float)) or isinstance(value, bool) or not isinstance(last_id, ObjectId):
+            raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+        return {"$or": [{field: {"$lt": value}}, {field: value, "_id": {"$lt": last_id}}]}
+
+    def cache_key(self) -> tuple:
+        return json_util.dumps(self.after), self.limit
+
+    def next_cursor(self, docs: list, *key_fields: str):
+        """Fetch limit + 1 docs; if the extra one came back, drop it and return the cursor of the last kept doc."""
+        if len(docs) <= self.limit: return None
+        del docs[self.limit:]
+        return encode_cursor(*[docs[-1][f] for f in key_fields])
+
+# --- Pushed messages: Server-Sent Events per student ("student:<id>") and for the admins' inbox. The POST endpoints
+# publish after the insert; a reconnecting client sends Last-Event-ID (the last message _id it saw, or all zeros for
+# "since my list was empty") and first gets what it missed from the database ---
+ADMIN_INBOX_CHANNEL = "admins"
+SSE_KEEPALIVE = float(os.getenv("SSE_KEEPALIVE", "15"))
+SSE_BACKLOG_LIMIT = 500
+
+def student_channel(student_id: ObjectId) -> str:
+    return f"student:{student_id}"
+
+async def push_message(channel: str, message_id: ObjectId, data: dict):
+    # The message is already stored; a broker failure only costs the live push (clients catch up on reconnect)
+    try: await broker.publish(channel, {"id": str(message_id), "data": jsonable_encoder(data)})
+    except Exception as e: print(f"❌ Could not push message {message_id} to {channel}: {e!r}")
+
+def sse_event(event_id, data: dict) -> str:
+    return f"id: {event_id}\nevent: message\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+def backlog_next(messages: list):
+    return messages[-1]["_id"] if len(messages) >= SSE_BACKLOG_LIMIT else None
+
+def stream_messages(request: Request, channel: str, load_missed) -> StreamingResponse:
+    """`load_missed(after)` returns ([(message _id, event data)] oldest first, next_after): one page of at most
+    SSE_BACKLOG_LIMIT stored messages, and the _id of the last one read when the page was full (None at the end). The
+    events may be fewer than the messages read (filtered out), so only next_after says whether there is more."""
+    value = request.headers.get("Last-Event-ID") or request.query_params.get("last_event_id")
+    after = ObjectId(value) if value and ObjectId.is_valid(value) else None
+
+    async def events():
+        # Subscribe before reading the backlog so nothing published in between is lost; duplicates are skipped
+        queue = broker.subscribe(channel)
+        try:
+            yield "retry: 3000\n\n"
+            replayed = set()
+            next_after = after
+            while next_after:
+                missed, next_after = await load_missed(next_after)
+                for message_id, data in missed:
+                    replayed.add(str(message_id)); yield sse_event(message_id, data)
+            while True:
+                try: event = await asyncio.wait_for(queue.get(), SSE_KEEPALIVE)
+                except asyncio.TimeoutError: yield ": keep-alive\n\n"; continue
+                if event is None: return  # fell too far behind; the client resumes from its Last-Event-ID
+                if event["id"] not in replayed: yield sse_event(event["id"], event["data"])
+        finally:
+            broker.unsubscribe(channel, queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# --- Conversations: one thread per student with the admin team (students write to the shared admin inbox, not to a
+# particular admin). The thread document carries last_message_at, a preview and per-side unread counters, all updated
+# when a message is written, so the inbox is one indexed read and a thread pages over (conversation_id, timestamp, _id) ---
+PREVIEW_CHARS = 120
+UNREAD_FIELD = {"student": "unread_admin", "admin": "unread_student"}  # sender type -> the other side's counter
+
+async def record_message(student_id: ObjectId, student_name: str, message_doc: dict):
+    """Store a message in the student's thread and update the thread summary. `student_name` only names a new thread;
+    profile updates keep it current after that. Callers make sure the student exists."""
+    unread, other = UNREAD_FIELD[message_doc["sender_type"]], UNREAD_FIELD["admin" if message_doc["sender_type"] == "student" else "student"]
+    message_doc["_id"] = ObjectId()
+    conversation = await conversations_collection.find_one_and_update({"student_id": student_id}, {
+        "$set": {"last_message_at": message_doc["timestamp"], "last_message_id": message_doc["_id"], "last_sender_type": message_doc["sender_type"], "preview": message_doc["message"][:PREVIEW_CHARS]},
+        "$inc": {unread: 1, "message_count": 1}, "$setOnInsert": {"student_name": student_name, other: 0}}, upsert=True, projection={"_id": 1}, return_document=ReturnDocument.AFTER)
+    message_doc["conversation_id"] = conversation["_id"]
+    return await messages_collection.insert_one(message_doc)
+
+def conversation_json(conversation: dict, unread_field: str) -> dict:
+    return {"conversation_id": str(conversation["_id"]), "student_id": str(conversation["student_id"]), "student_name": conversation.get("student_name"),
+            "preview": conversation.get("preview"), "last_message_at": conversation.get("last_message_at"), "last_message_id": str(conversation.get("last_message_id") or ""), "last_sender_type": conversation.get("last_sender_type"),
+            "message_count": conversation.get("message_count", 0), "unread": conversation.get(unread_field, 0)}
+
+async def thread_page(conversation_id: ObjectId, page: Page) -> dict:
+    messages = await messages_collection.find({"conversation_id": conversation_id, **page.after_desc("timestamp")}).sort([("timestamp", DESCENDING), ("_id", DESCENDING)]).limit(page.limit + 1).to_list()
+    next_cursor = page.next_cursor(messages, "timestamp", "_id")
+    return {"messages": [message_json(msg) for msg in messages], "next": next_cursor}
+
+async def backfill_conversations() -> int:
+    """Thread the messages written before conversations existed (history counts as read); returns how many were threaded."""
+    names = {s["_id"]: s.get("full_name") async for s in students_collection.find({}, {"full_name": 1})}
+    threads, writes, threaded = {}, [], 0
+    async for msg in messages_collection.find({"conversation_id": {"$exists": False}}).sort("_id", ASCENDING):
+        student_id = msg.get("sender_id") if msg.get("sender_type") == "student" else msg.get("recipient_id")
+        if student_id not in names: continue
+        if student_id not in threads:
+            result = await conversations_collection.update_one({"student_id": student_id}, {"$setOnInsert": {"student_name": names[student_id], "unread_admin": 0, "unread_student": 0, "message_count": 0}}, upsert=True)
+            conversation_id = result.upserted_id or (await conversations_collection.find_one({"student_id": student_id}, {"_id": 1}))["_id"]
+            threads[student_id] = {"_id": conversation_id, "created": result.upserted_id is not None, "last": None}
+        thread = threads[student_id]
+        thread["last"] = msg
+        writes.append(UpdateOne({"_id": msg["_id"]}, {"$set": {"conversation_id": thread["_id"]}}))
+        if len(writes) >= 1000: await messages_collection.bulk_write(writes, ordered=False); threaded += len(writes); writes = []
+    if writes: await messages_collection.bulk_write(writes, ordered=False); threaded += len(writes)
+    for thread in threads.values():
+        last = thread["last"]
+        # Threads that already have newer messages keep their summary. The count is recounted, not incremented by this
+        # run's tally, so workers that run the backfill side by side at startup cannot add it up more than once
+        summary = {"last_message_at": last["timestamp"], "last_message_id": last["_id"], "last_sender_type": last["sender_type"], "preview": last.get("message", "")[:PREVIEW_CHARS]} if thread["created"] else {}
+        count = await messages_collection.count_documents({"conversation_id": thread["_id"]})
+        await conversations_collection.update_one({"_id": thread["_id"]}, {"$set": {"message_count": count, **summary}})
+    return threaded
+
 # ==============================================================================
 # 4. STUDENT API ROUTES (REFINED)
 # ==============================================================================
 @app.post("/api/v1/student/register")
-def register_student(data: StudentRegister):
-    if students_collection.find_one({"email": data.email}): raise HTTPException(status_code=400, detail="Email already registered")
-    result = students_collection.insert_one(data.dict())
+async def register_student(data: StudentRegister):
+    try: result = await students_collection.insert_one(data.dict())
+    except DuplicateKeyError: raise HTTPException(status_code=400, detail="Email already registered")
+    await bump_stats(total_students=1)
+    student_suggestions.add(*student_suggestion({"_id": result.inserted_id, "full_name": data.full_name, "email": data.email}))
     return {"message": "Student registered successfully", "id": str(result.inserted_id)}
 
 @app.post("/api/v1/student/login", response_model=StudentLoginResponse)
-def login_student(data: StudentLogin):
-    student = students_collection.find_one({"email": data.email, "password": data.password})
+async def login_student(data: StudentLogin):
+    student = await students_collection.find_one({"email": data.email, "password": data.password})
     if not student: raise HTTPException(status_code=401, detail="Invalid email or password")
-    token = f"fake-student-token-for-{student['_id']}"
-    students_collection.update_one({"_id": student["_id"]}, {"$set": {"access_token": token}})
+    token = issue_token("student", student)
+    if AUTH_MODE != "jwt":
+        await students_collection.update_one({"_id": student["_id"]}, {"$set": {"access_token": token}})
+        invalidate_principal("student", student["_id"])
     return {"message": "Login successful", "student_id": str(student["_id"]), "full_name": student["full_name"], "access_token": token}
 
 @app.get("/api/v1/student/profile")
 async def get_student_profile(student: dict = Depends(get_current_student)):
-    profile_data = student.copy()
+    profile_data = await load_student(student)
     profile_data["_id"] = str(profile_data["_id"])
     if "access_token" in profile_data: del profile_data["access_token"]
     profile_data["enrolled_courses"] = [str(c) for c in profile_data.get("enrolled_courses", [])]
+    profile_data["completed_courses"] = [str(c) for c in profile_data.get("completed_courses", [])]
     return profile_data
 
 @app.put("/api/v1/student/profile")
 async def update_student_profile(update_data: StudentProfileUpdate, student: dict = Depends(get_current_student)):
     update_dict = {k: v for k, v in update_data.dict().items() if v is not None and v.strip() != ""}
-    if "email" in update_dict and update_dict["email"] != student["email"]:
-        if students_collection.find_one({"email": update_dict["email"]}): raise HTTPException(status_code=400, detail="Email already in use")
-    if update_dict: students_collection.update_one({"_id": student["_id"]}, {"$set": update_dict})
+    if update_dict:
+        try: await students_collection.update_one({"_id": student["_id"]}, {"$set": update_dict})
+        except DuplicateKeyError: raise HTTPException(status_code=400, detail="Email already in use")
+        invalidate_principal("student", student["_id"])
+        if "full_name" in update_dict or "email" in update_dict: student_suggestions.add(*student_suggestion({**student, **update_dict}))
+        if "full_name" in update_dict: await conversations_collection.update_one({"student_id": student["_id"]}, {"$set": {"student_name": update_dict["full_name"]}})
     return {"message": "Profile updated successfully"}
 
 @app.delete("/api/v1/student/profile")
 async def delete_student_account(student: dict = Depends(get_current_student)):
-    students_collection.delete_one({"_id": student["_id"]}); return {"message": "Account deleted successfully"}
+    deleted = await students_collection.find_one_and_delete({"_id": student["_id"]}, projection={"enrolled_courses": 1, "completed_courses": 1})
+    invalidate_principal("student", student["_id"])
+    if deleted: await forget_student(deleted)
+    return {"message": "Account deleted successfully"}
 
 @app.get("/api/v1/student/dashboard-stats")
 async def get_student_dashboard_stats(student: dict = Depends(get_current_student)):
-    # Calculate completed courses based on progress = 100%
+    student = await load_student(student, "enrolled_courses", "enrollments")
     enrolled_ids = student.get("enrolled_courses", [])
-    student_progress = student.get("progress", {})
-    completed_count = 0
-    
-    if enrolled_ids:
-        courses = list(courses_collection.find({"_id": {"$in": enrolled_ids}}))
-        for course in courses:
-            course_id_str = str(course["_id"])
-            total_content = len(course.get("course_content", []))
-            completed_content_count = len(student_progress.get(course_id_str, []))
-            if total_content > 0 and completed_content_count == total_content:
-                completed_count += 1
+    completed_count = sum(1 for e in student.get("enrollments", {}).values() if e.get("completed_at"))
 
     return {
-        "total_courses_available": courses_collection.count_documents({}),
+        "total_courses_available": await courses_collection.count_documents({}),
         "enrolled_courses_count": len(enrolled_ids),
         "completed_courses_count": completed_count
     }
 
 @app.post("/api/v1/student/messages")
 async def student_send_message_to_admin(data: StudentMessageSchema, student: dict = Depends(get_current_student)):
+    # The principal may come from the session cache (or a JWT) of a student deleted since: no thread for them
+    sender = await students_collection.find_one({"_id": student["_id"]}, {"full_name": 1})
+    if not sender: raise HTTPException(status_code=401, detail="Invalid token")
     message_doc = {"sender_id": student["_id"], "sender_type": "student", "recipient_type": "admin", "message": data.message, "timestamp": datetime.utcnow()}
-    messages_collection.insert_one(message_doc); return {"message": "Message sent to admin successfully"}
+    result = await record_message(student["_id"], sender.get("full_name"), message_doc)
+    await push_message(ADMIN_INBOX_CHANNEL, result.inserted_id, {"message_id": str(result.inserted_id), "student_id": str(student["_id"]), "student_name": sender.get("full_name"), "message": data.message, "timestamp": message_doc["timestamp"]})
+    return {"message": "Message sent to admin successfully"}
 
 @app.get("/api/v1/student/messages")
-async def student_get_messages_from_admin(student: dict = Depends(get_current_student)):
+async def student_get_messages_from_admin(student: dict = Depends(get_current_student), page: Page = Depends()):
     # Ensure we're comparing ObjectIds correctly
     student_id = student["_id"]
     # Query for messages where recipient_id matches student_id and sender is admin
-    messages = list(messages_collection.find({
+    messages = await messages_collection.find({
         "recipient_id": student_id, 
-        "sender_type": "admin"
-    }).sort("timestamp", -1))
-    
-    # Convert ObjectIds to strings for JSON serialization
-    for msg in messages: 
-        msg["_id"] = str(msg["_id"])
-        if "sender_id" in msg:
-            msg["sender_id"] = str(msg["sender_id"])
-        if "recipient_id" in msg:
-            msg["recipient_id"] = str(msg["recipient_id"])
-        if "timestamp" in msg:
-            msg["timestamp"] = str(msg["timestamp"])
-    return {"messages": messages}
+        "sender_type": "admin",
+        **page.after_desc("timestamp")
+    }).sort([("timestamp", DESCENDING), ("_id", DESCENDING)]).limit(page.limit + 1).to_list()
+    next_cursor = page.next_cursor(messages, "timestamp", "_id")
+    return {"messages": [message_json(msg) for msg in messages], "next": next_cursor}
+
+def message_json(msg: dict) -> dict:
+    """Convert ObjectIds (and the timestamp) to strings for JSON serialization."""
+    msg = dict(msg)
+    for field in ("_id", "sender_id", "recipient_id", "conversation_id", "timestamp"):
+        if field in msg: msg[field] = str(msg[field])
+    return msg
+
+@app.get("/api/v1/student/messages/stream")
+async def student_message_stream(request: Request, student: dict = Depends(get_current_student)):
+    async def load_missed(after: ObjectId) -> tuple:
+        messages = await messages_collection.find({"recipient_id": student["_id"], "sender_type": "admin", "_id": {"$gt": after}}).sort("_id", ASCENDING).limit(SSE_BACKLOG_LIMIT).to_list()
+        return [(msg["_id"], message_json(msg)) for msg in messages], backlog_next(messages)
+    return stream_messages(request, student_channel(student["_id"]), load_missed)
+
+@app.get("/api/v1/student/conversation")
+async def get_student_conversation(student: dict = Depends(get_current_student)):
+    conversation = await conversations_collection.find_one({"student_id": student["_id"]})
+    return conversation_json(conversation, "unread_student") if conversation else None
+
+@app.get("/api/v1/student/conversation/messages")
+async def get_student_thread(student: dict = Depends(get_current_student), page: Page = Depends()):
+    conversation = await conversations_collection.find_one({"student_id": student["_id"]}, {"_id": 1})
+    return await thread_page(conversation["_id"], page) if conversation else {"messages": [], "next": None}
+
+@app.post("/api/v1/student/conversation/read")
+async def mark_student_conversation_read(student: dict = Depends(get_current_student)):
+    await conversations_collection.update_one({"student_id": student["_id"]}, {"$set": {"unread_student": 0}})
+    return {"message": "Conversation marked as read"}
 
 @app.get("/api/v1/student/enrolled-courses")
-async def get_enrolled_courses(student: dict = Depends(get_current_student)):
-    enrolled_ids = student.get("enrolled_courses", [])
+async def get_enrolled_courses(request: Request, response: Response, student: dict = Depends(get_current_student)):
+    enrolled_ids = (await load_student(student, "enrolled_courses")).get("enrolled_courses", [])
+    versions = await get_versions(*enrolled_ids)
+    if (not_modified := conditional(request, response, make_etag("enrolled", [[k, v] for k, v in versions.items()]))): return not_modified
     if not enrolled_ids: return []
-    courses = list(courses_collection.find({"_id": {"$in": enrolled_ids}}, {"course_content": 0}))
+    courses = await courses_collection.find({"_id": {"$in": enrolled_ids}}, {"course_content": 0, **STUDENT_COURSE_HIDDEN}).to_list()
     for course in courses: course["_id"] = str(course["_id"])
     return courses
 
 @app.get("/api/v1/student/course/{course_id}")
-async def get_single_course_content(course_id: str, student: dict = Depends(get_current_student)):
-    enrolled_ids_str = [str(c) for c in student.get("enrolled_courses", [])]
-    if course_id not in enrolled_ids_str: raise HTTPException(status_code=403, detail="Not enrolled in this course")
-    
-    course = courses_collection.find_one({"_id": ObjectId(course_id)})
+async def get_single_course_content(course_id: str, request: Request, response: Response, student: dict = Depends(get_current_student)):
+    obj_course_id = await require_enrollment(student, course_id)
+    version = (await get_versions(obj_course_id))[obj_course_id]
+    if (not_modified := conditional(request, response, make_etag("course", obj_course_id, version))): return not_modified
+    course = await courses_collection.find_one({"_id": obj_course_id}, STUDENT_COURSE_HIDDEN)
     if not course: raise HTTPException(status_code=404, detail="Course not found")
         
     course["_id"] = str(course["_id"])
@@ -219,181 +758,203 @@ async def get_single_course_content(course_id: str, student: dict = Depends(get_
 
 @app.post("/api/v1/student/course/{course_id}/mark-complete")
 async def mark_content_complete(course_id: str, data: MarkCompleteSchema, student: dict = Depends(get_current_student)):
-    students_collection.update_one({"_id": student["_id"]}, {"$addToSet": {f"progress.{course_id}": data.content_id}})
+    enrollment_key = f"enrollments.{course_id}"
+    updated = None
+    if ObjectId.is_valid(course_id):
+        progress_key = f"progress.{course_id}"
+        updated = await students_collection.find_one_and_update(
+            {"_id": student["_id"], enrollment_key: {"$exists": True}},
+            [{"$set": {progress_key: {"$setUnion": [{"$ifNull": [f"${progress_key}", []]}, [{"$literal": data.content_id}]]}}},
+             {"$set": {f"{enrollment_key}.completed_items": {"$size": f"${progress_key}"}}},
+             refresh_enrollment_stage(course_id)],
+            projection={enrollment_key: 1}, return_document=ReturnDocument.AFTER)
+    if updated is None:
+        # Not enrolled (or a document from before enrollment state existed): just record the item
+        await students_collection.update_one({"_id": student["_id"]}, {"$addToSet": {f"progress.{course_id}": data.content_id}})
+    elif updated["enrollments"][course_id].get("completed_at"):
+        await record_course_completed(student["_id"], ObjectId(course_id))
     return {"message": "Progress updated"}
 
+# --- Course files: (course, content_id) -> resolved file, shared by the download and view endpoints ---
+# Only the DB-derived part (path, name, type) is cached; size/mtime come from a fresh stat on every request.
+CONTENT_MANIFEST_TTL = float(os.getenv("CONTENT_MANIFEST_TTL", "300"))
+content_manifest = TTLCache(maxsize=10000, ttl=CONTENT_MANIFEST_TTL)
+
+def guess_content_type(filename: str) -> str:
+    ext = os.path.splitext(filename)[1].lower()
+    if ext == ".pdf": return "application/pdf"
+    if ext in (".doc", ".docx"): return "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+    return mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+def view_disposition(name: str) -> str:
+    # Browsers cannot preview DOCX inline, so those are always downloaded
+    return "attachment" if os.path.splitext(name)[1].lower() in (".doc", ".docx") else "inline"
+
+def storage_key(stored_path: str) -> str:
+    """Content items store paths relative to BASE_DIR ("uploads/<key>"); refuse anything outside the uploads directory."""
+    path = os.path.normpath(os.path.join(BASE_DIR, stored_path.replace("\\", "/")))
+    if os.path.commonpath([path, os.path.normpath(UPLOADS_DIR)]) != os.path.normpath(UPLOADS_DIR):
+        raise HTTPException(status_code=403, detail="Access denied")
+    return os.path.relpath(path, UPLOADS_DIR).replace(os.sep, "/")
+
+def file_entry(item: dict) -> dict:
+    """Storage key, local path (None on remote storage), name and content type of a file content item."""
+    if not item.get("path"): raise HTTPException(status_code=404, detail="File path not found")
+    key = storage_key(item["path"])
+    name = item.get("name", os.path.basename(key))
+    return {"key": key, "path": storage.local_path(key), "name": name, "content_type": guess_content_type(name), "sha256": item.get("sha256")}
+
+async def resolve_course_file(course_id: ObjectId, content_id: str) -> dict:
+    """Storage key, local path, name, size, mtime and content type of one uploaded course file."""
+    entry = content_manifest.get((course_id, content_id))
+    if entry is None:
+        # $elemMatch projection: only the matching element of course_content leaves the server
+        course = await courses_collection.find_one({"_id": course_id}, {"course_content": {"$elemMatch": {"content_id": content_id, "type": "file"}}})
+        if not course: raise HTTPException(status_code=404, detail="Course not found")
+        if not course.get("course_content"): raise HTTPException(status_code=404, detail="Content not found")
+        entry = file_entry(course["course_content"][0])
+        content_manifest.set((course_id, content_id), entry)
+    stat = await storage.stat(entry["key"])
+    if stat is None: raise HTTPException(status_code=404, detail="File not found on server")
+    return {**entry, **stat}
+
+# File delivery: "app" streams from this worker through FileResponse (Range / If-Range -> 206, multipart/byteranges, 416;
+# zero-copy on servers implementing the ASGI pathsend extension). The proxy modes only authorize and hand the transfer off
+# (local storage only; GridFS / S3 objects are always streamed by `stream_stored_file`):
+#   x-accel-redirect (nginx):  location /protected-uploads/ { internal; alias /path/to/backend/uploads/; }
+#   x-sendfile (Apache mod_xsendfile / lighttpd): XSendFile On; XSendFilePath /path/to/backend/uploads
+FILE_DELIVERY_MODE = os.getenv("FILE_DELIVERY_MODE", "app").lower()
+FILE_DELIVERY_INTERNAL_PREFIX = os.getenv("FILE_DELIVERY_INTERNAL_PREFIX", "/protected-uploads").rstrip("/")
+if FILE_DELIVERY_MODE not in ("app", "x-accel-redirect", "x-sendfile"):
+    print(f"❌ Unknown FILE_DELIVERY_MODE {FILE_DELIVERY_MODE!r}, serving files from the app")
+
+def parse_byte_range(header: str, size: int):
+    """Single `bytes=` range -> (start, end) inclusive, or None to send the whole file (also for multi-range)."""
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec: return None
+    first, _, last = spec.strip().partition("-")
+    try: start, end = (int(first), int(last) if last else size - 1) if first else (size - int(last), size - 1)
+    except ValueError: return None
+    # last < first is malformed and ignored (RFC 9110 14.2); only a range that starts past the end is unsatisfiable
+    if first and last and end < start: return None
+    start, end = max(start, 0), min(end, size - 1)
+    if start > end: raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+def ignored_range(header: str, size: int) -> bool:
+    """A single range that parse_byte_range ignores (malformed, last < first): served as the whole file, not a 206/416."""
+    if not header or "," in header: return False
+    try: return parse_byte_range(header, size) is None
+    except HTTPException: return False
+
+class WholeFileResponse(FileResponse):
+    """FileResponse that leaves out the Range header (Starlette answers a malformed one with 400)."""
+    async def __call__(self, scope, receive, send):
+        await super().__call__({**scope, "headers": [(k, v) for k, v in scope["headers"] if k != b"range"]}, receive, send)
+
+async def stream_stored_file(request: Request, file: dict, disposition: str) -> Response:
+    """Stream an object from storage with ETag / Range / If-Range handling (single ranges are passed through to the backend)."""
+    etag = f'"{file["sha256"]}"' if file.get("sha256") else f'"{file["size"]:x}-{int(file["mtime"]):x}"'
+    headers = {"Content-Disposition": f'{disposition}; filename="{file["name"]}"', "Accept-Ranges": "bytes", "ETag": etag, "Last-Modified": formatdate(file["mtime"], usegmt=True)}
+    if request.headers.get("if-none-match") == etag: return Response(status_code=304, headers=headers)
+    byte_range = None
+    if "range" in request.headers and request.headers.get("if-range", etag) in (etag, headers["Last-Modified"]):
+        byte_range = parse_byte_range(request.headers["range"], file["size"])
+    if byte_range is None:
+        return StreamingResponse(storage.read(file["key"]), media_type=file["content_type"], headers={**headers, "Content-Length": str(file["size"])})
+    start, end = byte_range
+    return StreamingResponse(storage.read(file["key"], start, end), status_code=206, media_type=file["content_type"],
+                             headers={**headers, "Content-Range": f"bytes {start}-{end}/{file['size']}", "Content-Length": str(end - start + 1)})
+
+async def deliver_file(request: Request, file: dict, disposition: str) -> Response:
+    if file["path"] is None: return await stream_stored_file(request, file, disposition)
+    headers = {"Content-Disposition": f'{disposition}; filename="{file["name"]}"'}
+    if FILE_DELIVERY_MODE == "x-accel-redirect":
+        return Response(media_type=file["content_type"], headers={**headers, "X-Accel-Redirect": quote(f"{FILE_DELIVERY_INTERNAL_PREFIX}/{file['key']}")})
+    if FILE_DELIVERY_MODE == "x-sendfile":
+        return Response(media_type=file["content_type"], headers={**headers, "X-Sendfile": file["path"]})
+    response_class = WholeFileResponse if ignored_range(request.headers.get("range", ""), file["size"]) else FileResponse
+    return response_class(file["path"], media_type=file["content_type"], filename=file["name"], headers=headers)
+
 @app.get("/api/v1/student/course/{course_id}/download/{content_id}")
-async def download_course_file(course_id: str, content_id: str, student: dict = Depends(get_current_student)):
+async def download_course_file(course_id: str, content_id: str, request: Request, student: dict = Depends(get_current_student)):
     """Download course file with proper headers - always forces download"""
-    # Verify enrollment
-    enrolled_ids_str = [str(c) for c in student.get("enrolled_courses", [])]
-    if course_id not in enrolled_ids_str: 
-        raise HTTPException(status_code=403, detail="Not enrolled in this course")
-    
-    # Get course and find the content
-    course = courses_collection.find_one({"_id": ObjectId(course_id)})
-    if not course: 
-        raise HTTPException(status_code=404, detail="Course not found")
-    
-    # Find the content item
-    content_item = None
-    for item in course.get("course_content", []):
-        if item.get("content_id") == content_id and item.get("type") == "file":
-            content_item = item
-            break
-    
-    if not content_item:
-        raise HTTPException(status_code=404, detail="Content not found")
-    
-    file_path = content_item.get("path")
-    if not file_path:
-        raise HTTPException(status_code=404, detail="File path not found")
-    
-    # Normalize path and resolve to absolute path
-    file_path = file_path.replace("\\", "/")
-    # If path is relative, resolve it relative to BASE_DIR
-    if not os.path.isabs(file_path):
-        file_path = os.path.join(BASE_DIR, file_path)
-    # Normalize the path (resolve .. and . components)
-    file_path = os.path.normpath(file_path)
-    
-    # Security: Ensure the file is within the uploads directory
-    if not file_path.startswith(os.path.normpath(UPLOADS_DIR)):
-        raise HTTPException(status_code=403, detail="Access denied")
-    
-    if not os.path.exists(file_path):
-        raise HTTPException(status_code=404, detail="File not found on server")
-    
-    # Get filename
-    filename = content_item.get("name", os.path.basename(file_path))
-    ext = os.path.splitext(filename)[1].lower()
-    
-    # Determine content type
-    if ext == ".pdf":
-        content_type = "application/pdf"
-    elif ext in [".doc", ".docx"]:
-        content_type = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-    else:
-        content_type, _ = mimetypes.guess_type(file_path)
-        if not content_type:
-            content_type = "application/octet-stream"
-    
-    # Always force download for the download endpoint
-    return FileResponse(
-        file_path,
-        media_type=content_type,
-        filename=filename,
-        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
-    )
+    obj_course_id = await require_enrollment(student, course_id)
+    return await deliver_file(request, await resolve_course_file(obj_course_id, content_id), "attachment")
 
 @app.get("/api/v1/student/course/{course_id}/view/{content_id}")
-async def view_course_file(course_id: str, content_id: str, student: dict = Depends(get_current_student)):
+async def view_course_file(course_id: str, content_id: str, request: Request, student: dict = Depends(get_current_student)):
     """View course file (for PDF preview only - DOCX will be forced to download)"""
-    # Verify enrollment
-    enrolled_ids_str = [str(c) for c in student.get("enrolled_courses", [])]
-    if course_id not in enrolled_ids_str: 
-        raise HTTPException(status_code=403, detail="Not enrolled in this course")
-    
-    # Get course and find the content
-    course = courses_collection.find_one({"_id": ObjectId(course_id)})
-    if not course: 
-        raise HTTPException(status_code=404, detail="Course not found")
-    
-    # Find the content item
-    content_item = None
+    obj_course_id = await require_enrollment(student, course_id)
+    file = await resolve_course_file(obj_course_id, content_id)
+    return await deliver_file(request, file, view_disposition(file["name"]))
+
+# --- Signed URLs: /uploads/<path>?exp=&name=&disposition=&sig= is served by SignedStaticFiles without any DB reads.
+# Expiry is rounded up to SIGNED_URL_ALIGN so repeated requests get identical (browser-cacheable) URLs ---
+SIGNED_URL_TTL = int(os.getenv("SIGNED_URL_TTL", "900"))
+SIGNED_URL_ALIGN = 300
+SIGNED_URLS_ENABLED = url_signing_configured()
+if not SIGNED_URLS_ENABLED:
+    print(f"❌ URL_SIGNING_KEY is not set (at least {MIN_SECRET_BYTES} bytes): signed /uploads links are disabled, files are served by the authenticated routes")
+
+def signed_file_url(file: dict, disposition: str, expires: int) -> str:
+    path = "/uploads/" + file["key"]
+    signature = sign_url(path, expires, f"{file['name']}\n{disposition}")
+    return f"{quote(path)}?{urlencode({'exp': expires, 'name': file['name'], 'disposition': disposition, 'sig': signature})}"
+
+@app.get("/api/v1/student/course/{course_id}/file-urls")
+async def get_signed_file_urls(course_id: str, student: dict = Depends(get_current_student)):
+    """Signed view/download URLs for every file of an enrolled course."""
+    if not SIGNED_URLS_ENABLED: raise HTTPException(status_code=404, detail="Signed URLs are not configured")
+    obj_course_id = await require_enrollment(student, course_id)
+    course = await courses_collection.find_one({"_id": obj_course_id}, {"course_content": 1})
+    if not course: raise HTTPException(status_code=404, detail="Course not found")
+    expires = -(-(int(time.time()) + SIGNED_URL_TTL) // SIGNED_URL_ALIGN) * SIGNED_URL_ALIGN
+    files = {}
     for item in course.get("course_content", []):
-        if item.get("content_id") == content_id and item.get("type") == "file":
-            content_item = item
-            break
-    
-    if not content_item:
-        raise HTTPException(status_code=404, detail="Content not found")
-    
-    file_path = content_item.get("path")
-    if not file_path:
-        raise HTTPException(status_code=404, detail="File path not found")
-    
-    # Normalize path and resolve to absolute path
-    file_path = file_path.replace("\\", "/")
-    # If path is relative, resolve it relative to BASE_DIR
-    if not os.path.isabs(file_path):
-        file_path = os.path.join(BASE_DIR, file_path)
-    # Normalize the path (resolve .. and . components)
-    file_path = os.path.normpath(file_path)
-    
-    # Security: Ensure the file is within the uploads directory
-    if not file_path.startswith(os.path.normpath(UPLOADS_DIR)):
-        raise HTTPException(status_code=403, detail="Access denied")
-    
-    if not os.path.exists(file_path):
-        raise HTTPException(status_code=404, detail="File not found on server")
-    
-    # Get filename and content type
-    filename = content_item.get("name", os.path.basename(file_path))
-    ext = os.path.splitext(filename)[1].lower()
-    
-    # Determine content type
-    if ext == ".pdf":
-        content_type = "application/pdf"
-    elif ext in [".doc", ".docx"]:
-        content_type = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-    else:
-        content_type, _ = mimetypes.guess_type(file_path)
-        if not content_type:
-            content_type = "application/octet-stream"
-    
-    # For DOCX files, force download (browsers cannot preview DOCX inline)
-    if ext in [".doc", ".docx"]:
-        return FileResponse(
-            file_path,
-            media_type=content_type,
-            filename=filename,
-            headers={"Content-Disposition": f'attachment; filename="{filename}"'}
-        )
-    
-    # For PDF files, allow inline viewing
-    return FileResponse(
-        file_path,
-        media_type=content_type,
-        filename=filename,
-        headers={"Content-Disposition": f'inline; filename="{filename}"'}
-    )
+        if item.get("type") != "file": continue
+        try: file = file_entry(item)
+        except HTTPException: continue
+        files[item["content_id"]] = {"view_url": signed_file_url(file, view_disposition(file["name"]), expires), "download_url": signed_file_url(file, "attachment", expires)}
+    return {"expires_at": datetime.utcfromtimestamp(expires), "files": files}
 
 @app.get("/api/v1/student/progress")
 async def get_student_progress(student: dict = Depends(get_current_student)):
+    student = await load_student(student, "enrolled_courses", "enrollments")
     enrolled_ids = student.get("enrolled_courses", [])
     if not enrolled_ids: return []
 
     progress_data = []
-    student_progress = student.get("progress", {})
-    courses = list(courses_collection.find({"_id": {"$in": enrolled_ids}}))
-
-    for course in courses:
+    enrollments = student.get("enrollments", {})
+    async for course in courses_collection.find({"_id": {"$in": enrolled_ids}}, {"title": 1}):
         course_id_str = str(course["_id"])
-        total_content = len(course.get("course_content", []))
-        completed_content = len(student_progress.get(course_id_str, []))
-        percentage = round((completed_content / total_content) * 100) if total_content > 0 else 0
-        progress_data.append({"course_id": course_id_str, "course_title": course["title"], "percentage": percentage})
+        progress_data.append({"course_id": course_id_str, "course_title": course["title"], "percentage": enrollments.get(course_id_str, {}).get("percentage", 0)})
     return progress_data
 
 # ==============================================================================
 # 5. ADMIN API ROUTES (STABLE)
 # ==============================================================================
 @app.post("/api/v1/admin/register")
-def register_admin(data: AdminRegister):
-    if admins_collection.find_one({"email": data.email}): raise HTTPException(status_code=400, detail="Email already registered")
-    admins_collection.insert_one(data.dict()); return {"message": "Admin registered successfully"}
+async def register_admin(data: AdminRegister):
+    try: await admins_collection.insert_one(data.dict())
+    except DuplicateKeyError: raise HTTPException(status_code=400, detail="Email already registered")
+    return {"message": "Admin registered successfully"}
 
 @app.post("/api/v1/admin/login")
-def login_admin(data: AdminLogin):
-    admin = admins_collection.find_one({"email": data.email, "password": data.password})
+async def login_admin(data: AdminLogin):
+    admin = await admins_collection.find_one({"email": data.email, "password": data.password})
     if not admin: raise HTTPException(status_code=401, detail="Invalid credentials")
-    token = f"fake-admin-token-for-{admin['_id']}"; admins_collection.update_one({"_id": admin["_id"]}, {"$set": {"access_token": token}})
+    token = issue_token("admin", admin)
+    if AUTH_MODE != "jwt":
+        await admins_collection.update_one({"_id": admin["_id"]}, {"$set": {"access_token": token}})
+        invalidate_principal("admin", admin["_id"])
     return {"message": "Login successful", "admin_id": str(admin["_id"]), "full_name": admin["full_name"], "access_token": token}
 
 @app.get("/api/v1/admin/profile")
 async def get_admin_profile(admin: dict = Depends(get_current_admin)):
-    admin_data = admin.copy(); admin_data["_id"] = str(admin_data["_id"])
+    admin_data = await admins_collection.find_one({"_id": admin["_id"]})
+    if not admin_data: raise HTTPException(status_code=401, detail="Invalid token")
+    admin_data["_id"] = str(admin_data["_id"])
     if "access_token" in admin_data: del admin_data["access_token"]
     return admin_data
 
@@ -405,192 +966,584 @@ async def update_admin_profile(update_data: AdminProfileUpdate, admin: dict = De
     print(f"DEBUG: Updating admin {admin['_id']} with {update_dict}")
     
     if update_dict:
-        result = admins_collection.update_one({"_id": admin["_id"]}, {"$set": update_dict})
+        try: result = await admins_collection.update_one({"_id": admin["_id"]}, {"$set": update_dict})
+        except DuplicateKeyError: raise HTTPException(status_code=400, detail="Email already in use")
         print(f"DEBUG: Update result - matched: {result.matched_count}, modified: {result.modified_count}")
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="Admin not found")
+        invalidate_principal("admin", admin["_id"])
     return {"message": "Profile updated successfully"}
 
 @app.delete("/api/v1/admin/delete")
 async def delete_admin_account_by_admin(admin: dict = Depends(get_current_admin)):
-    admins_collection.delete_one({"_id": admin["_id"]}); return {"message": "Admin account deleted successfully"}
+    await admins_collection.delete_one({"_id": admin["_id"]}); invalidate_principal("admin", admin["_id"])
+    return {"message": "Admin account deleted successfully"}
 
 @app.get("/api/v1/admin/dashboard-stats")
-async def get_dashboard_stats(admin: dict = Depends(get_current_admin)):
-    total_students = students_collection.count_documents({})
-    total_courses = courses_collection.count_documents({})
-    
-    # Calculate unique students who have completed at least one course
-    all_students = list(students_collection.find({}, {"enrolled_courses": 1, "progress": 1}))
-    completed_students_count = 0
-    
-    # Get all courses to know content counts
-    all_courses = {str(c["_id"]): len(c.get("course_content", [])) for c in courses_collection.find({}, {"course_content": 1})}
-    
-    for student in all_students:
-        has_completed_any = False
-        progress = student.get("progress", {})
-        enrolled = student.get("enrolled_courses", [])
-        
-        for course_id in enrolled:
-             course_id_str = str(course_id)
-             # If course exists and has content
-             if course_id_str in all_courses and all_courses[course_id_str] > 0:
-                 # Check if completed count matches total content
-                 if len(progress.get(course_id_str, [])) == all_courses[course_id_str]:
-                     has_completed_any = True
-                     break
-        
-        if has_completed_any:
-            completed_students_count += 1
+async def get_dashboard_stats(response: Response, admin: dict = Depends(get_current_admin)):
+    async def compute():
+        stats = await stats_collection.find_one({"_id": DASHBOARD_STATS_ID}) or {}
+        trending = await top_courses(TRENDING_DASHBOARD_WINDOW, 1) or await top_courses("all", 1)
+        trending_course = trending[0]["title"] if trending else "N/A"
+        return {"total_students": stats.get("total_students", 0), "completed_students": stats.get("completed_students", 0), "total_courses": stats.get("total_courses", 0), "trending_course": trending_course}
+    stats, headers = await cached_aggregate("dashboard", None, compute)
+    response.headers.update(headers)
+    return stats
 
-    trending_course = "N/A"
-    pipeline = [{"$unwind": "$enrolled_courses"}, {"$group": {"_id": "$enrolled_courses", "count": {"$sum": 1}}}, {"$sort": {"count": -1}}, {"$limit": 1}, {"$lookup": {"from": "courses", "localField": "_id", "foreignField": "_id", "as": "course_details"}}, {"$unwind": "$course_details"}]
-    result = list(students_collection.aggregate(pipeline))
-    if result: trending_course = result[0]["course_details"]["title"]
-    
-    return {"total_students": total_students, "completed_students": completed_students_count, "total_courses": total_courses, "trending_course": trending_course}
+@app.get("/api/v1/admin/trending")
+async def get_trending_courses(window: str = Query("7d", pattern="^(24h|7d|30d|all)$"), k: int = Query(5, ge=1, le=50), admin: dict = Depends(get_current_admin)):
+    return {"window": window, "items": await top_courses(window, k)}
+
+@app.get("/api/v1/admin/cache-stats")
+async def get_cache_stats(admin: dict = Depends(get_current_admin)):
+    return {"session_cache": session_cache.stats(), **{f"{name}_cache": cache.stats() for name, cache in admin_caches.items()}}
+
+# Admin student list, joined server-side: titles of the enrolled courses that still exist, in enrollment order,
+# and the number of those with a completed enrollment. Requires MongoDB 5.0+ ($lookup with localField + pipeline).
+ADMIN_STUDENTS_PIPELINE = [
+    {"$project": {"password": 0, "access_token": 0, "completed_courses": 0, "progress": 0}},
+    {"$lookup": {"from": "courses", "localField": "enrolled_courses", "foreignField": "_id", "pipeline": [{"$project": {"title": {"$ifNull": ["$title", "Unknown"]}}}], "as": "enrolled_course_docs"}},
+    {"$addFields": {
+        "_id": {"$toString": "$_id"},
+        "enrolled_course_titles": {"$map": {
+            "input": {"$filter": {"input": {"$ifNull": ["$enrolled_courses", []]}, "as": "cid", "cond": {"$in": ["$$cid", "$enrolled_course_docs._id"]}}},
+            "as": "cid",
+            "in": {"$arrayElemAt": ["$enrolled_course_docs.title", {"$indexOfArray": ["$enrolled_course_docs._id", "$$cid"]}]},
+        }},
+        "completed_courses_count": {"$size": {"$filter": {
+            "input": {"$objectToArray": {"$ifNull": ["$enrollments", {}]}},
+            "cond": {"$and": [
+                {"$ne": [{"$ifNull": ["$$this.v.completed_at", None]}, None]},
+                {"$in": ["$$this.k", {"$map": {"input": "$enrolled_course_docs._id", "in": {"$toString": "$$this"}}}]},
+            ]},
+        }}},
+        "total_enrolled_count": {"$size": {"$ifNull": ["$enrolled_courses", []]}},
+    }},
+    {"$project": {"enrolled_courses": 0, "enrollments": 0, "enrolled_course_docs": 0}},
+]
+CURSOR_BATCH_SIZE = 500
+
+async def stream_json_page(cursor, page: Page):
+    """Serialize a page (limit + 1 docs, string `_id`) as {"items": [...], "next": ...} one document at a time."""
+    yield '{"items": ['
+    count, last_id = 0, None
+    async for doc in cursor:
+        if count == page.limit:
+            yield f'], "next": {json.dumps(encode_cursor(ObjectId(last_id)))}}}'
+            return
+        yield ("," if count else "") + json.dumps(jsonable_encoder(doc))
+        count, last_id = count + 1, doc["_id"]
+    yield '], "next": null}'
 
 @app.get("/api/v1/admin/students/")
-async def get_all_students(admin: dict = Depends(get_current_admin)):
-    # Fetch all students and courses to perform manual join (avoids strict ObjectId type issues)
-    students = list(students_collection.find({}, {"password": 0, "access_token": 0}))
-    
-    # Get all courses map: ID_STR -> {title, content_count}
-    all_courses = {}
-    for c in courses_collection.find({}, {"title": 1, "course_content": 1}):
-        all_courses[str(c["_id"])] = {
-            "title": c.get("title", "Unknown"),
-            "content_count": len(c.get("course_content", []))
-        }
-
-    for student in students:
-        student["_id"] = str(student["_id"])
-        
-        # Calculate Stats
-        progress = student.get("progress", {})
-        enrolled_ids = student.get("enrolled_courses", [])
-        
-        enrolled_titles = []
-        completed_count = 0
-        
-        for c_id in enrolled_ids:
-            c_str = str(c_id)
-            if c_str in all_courses:
-                course_data = all_courses[c_str]
-                enrolled_titles.append(course_data["title"])
-                
-                # Check completion
-                if course_data["content_count"] > 0:
-                    student_completed_content = len(progress.get(c_str, []))
-                    if student_completed_content == course_data["content_count"]:
-                        completed_count += 1
-        
-        student["enrolled_course_titles"] = enrolled_titles
-        student["completed_courses_count"] = completed_count
-        student["total_enrolled_count"] = len(enrolled_ids) # Helper for frontend status
-        
-        # Cleanup
-        if "progress" in student: del student["progress"]
-        if "enrolled_courses" in student: del student["enrolled_courses"]
+async def get_all_students(admin: dict = Depends(get_current_admin), page: Page = Depends()):
+    async def compute():
+        pipeline = [{"$match": page.after_id()}, {"$sort": {"_id": 1}}, {"$limit": page.limit + 1}] + ADMIN_STUDENTS_PIPELINE
+        cursor = await students_collection.aggregate(pipeline, batchSize=CURSOR_BATCH_SIZE)
+        return "".join([chunk async for chunk in stream_json_page(cursor, page)])
+    # The encoded page is cached, so hits skip both the aggregation and the serialization
+    body, headers = await cached_aggregate("students", page.cache_key(), compute)
+    return Response(content=body, media_type="application/json", headers=headers)
 
-    return students
+@app.get("/api/v1/admin/students/suggest")
+async def suggest_students(q: str = Query(..., min_length=1, max_length=200), limit: int = Query(SUGGEST_LIMIT, ge=1, le=50), admin: dict = Depends(get_current_admin)):
+    return {"items": student_suggestions.search(q, limit)}
 
 @app.delete("/api/v1/admin/students/{student_id}")
 async def delete_student_by_admin(student_id: str, admin: dict = Depends(get_current_admin)):
-    students_collection.delete_one({"_id": ObjectId(student_id)}); return {"message": "Student deleted successfully"}
+    deleted = await students_collection.find_one_and_delete({"_id": ObjectId(student_id)}, projection={"enrolled_courses": 1, "completed_courses": 1})
+    invalidate_principal("student", ObjectId(student_id))
+    if deleted: await forget_student(deleted)
+    admin_caches["students"].clear(); admin_caches["dashboard"].clear()
+    return {"message": "Student deleted successfully"}
 
 @app.post("/api/v1/admin/students/{student_id}/allow-certificate")
 async def allow_certificate(student_id: str, course_id: str = Form(...), admin: dict = Depends(get_current_admin)):
-    course = courses_collection.find_one({"_id": ObjectId(course_id)})
+    course = await courses_collection.find_one({"_id": ObjectId(course_id)})
     if not course: raise HTTPException(status_code=404, detail="Course not found")
-    students_collection.update_one({"_id": ObjectId(student_id)}, {"$set": {"certificate_allowed": True, "status": "Completed"}, "$push": {"certificates": {"course_id": course_id, "course_name": course["title"], "issued_date": datetime.utcnow()}}})
+    await students_collection.update_one({"_id": ObjectId(student_id)}, {"$set": {"certificate_allowed": True, "status": "Completed"}, "$push": {"certificates": {"course_id": course_id, "course_name": course["title"], "issued_date": datetime.utcnow()}}})
     return {"message": "Certificate access granted"}
 
 @app.get("/api/v1/student/certificates")
 async def get_student_certificates(student: dict = Depends(get_current_student)):
-    certificates = student.get("certificates", [])
+    certificates = (await load_student(student, "certificates")).get("certificates", [])
     for cert in certificates: cert["issued_date"] = str(cert["issued_date"])
     return {"certificates": certificates}
 
 @app.post("/api/v1/admin/messages")
 async def send_message_to_student(data: AdminMessageSchema, admin: dict = Depends(get_current_admin)):
     student_obj_id = ObjectId(data.student_id)
-    if not students_collection.find_one({"_id": student_obj_id}): raise HTTPException(status_code=404, detail="Student not found.")
+    recipient = await students_collection.find_one({"_id": student_obj_id}, {"full_name": 1})
+    if not recipient: raise HTTPException(status_code=404, detail="Student not found.")
     message_doc = {"sender_id": admin["_id"], "sender_type": "admin", "recipient_id": student_obj_id, "recipient_type": "student", "message": data.message, "timestamp": datetime.utcnow()}
-    messages_collection.insert_one(message_doc); return {"message": "Message sent successfully"}
+    result = await record_message(student_obj_id, recipient.get("full_name"), message_doc)
+    await push_message(student_channel(student_obj_id), result.inserted_id, message_json(message_doc))
+    return {"message": "Message sent successfully"}
 
 @app.get("/api/v1/admin/messages")
-async def get_admin_messages(admin: dict = Depends(get_current_admin)):
-    pipeline = [{"$match": {"sender_type": "student"}}, {"$lookup": {"from": "students", "localField": "sender_id", "foreignField": "_id", "as": "student_info"}}, {"$unwind": "$student_info"}, {"$sort": {"timestamp": -1}}, {"$project": {"_id": 0, "message_id": {"$toString": "$_id"}, "student_name": "$student_info.full_name", "message": "$message", "timestamp": "$timestamp"}}]
-    return list(messages_collection.aggregate(pipeline))
+async def get_admin_messages(admin: dict = Depends(get_current_admin), page: Page = Depends()):
+    messages = await messages_collection.find({"sender_type": "student", **page.after_desc("timestamp")}, ADMIN_INBOX_PROJECTION).sort([("timestamp", DESCENDING), ("_id", DESCENDING)]).limit(page.limit + 1).to_list()
+    next_cursor = page.next_cursor(messages, "timestamp", "_id")
+    return {"items": await admin_inbox_items(messages), "next": next_cursor}
+
+ADMIN_INBOX_PROJECTION = {"sender_id": 1, "message": 1, "timestamp": 1}
+
+async def admin_inbox_items(messages: list) -> list:
+    """Name the senders with one query for the page (not a $lookup per message); messages of deleted students are left out."""
+    names = {s["_id"]: s.get("full_name") async for s in students_collection.find({"_id": {"$in": list({m["sender_id"] for m in messages})}}, {"full_name": 1})}
+    return [{"message_id": str(m["_id"]), "student_id": str(m["sender_id"]), "student_name": names[m["sender_id"]], "message": m["message"], "timestamp": m["timestamp"]} for m in messages if m["sender_id"] in names]
+
+@app.get("/api/v1/admin/messages/stream")
+async def admin_message_stream(request: Request, admin: dict = Depends(get_current_admin)):
+    async def load_missed(after: ObjectId) -> tuple:
+        messages = await messages_collection.find({"sender_type": "student", "_id": {"$gt": after}}, ADMIN_INBOX_PROJECTION).sort("_id", ASCENDING).limit(SSE_BACKLOG_LIMIT).to_list()
+        # Messages of deleted students are dropped from the events, so the page size comes from the rows read
+        return [(item["message_id"], item) for item in await admin_inbox_items(messages)], backlog_next(messages)
+    return stream_messages(request, ADMIN_INBOX_CHANNEL, load_missed)
+
+@app.get("/api/v1/admin/conversations")
+async def get_admin_conversations(admin: dict = Depends(get_current_admin), page: Page = Depends()):
+    conversations = await conversations_collection.find(page.after_desc("last_message_at")).sort([("last_message_at", DESCENDING), ("_id", DESCENDING)]).limit(page.limit + 1).to_list()
+    next_cursor = page.next_cursor(conversations, "last_message_at", "_id")
+    return {"items": [conversation_json(c, "unread_admin") for c in conversations], "next": next_cursor}
+
+@app.get("/api/v1/admin/conversations/{student_id}/messages")
+async def get_admin_thread(student_id: str, admin: dict = Depends(get_current_admin), page: Page = Depends()):
+    conversation = await conversations_collection.find_one({"student_id": ObjectId(student_id)}, {"_id": 1}) if ObjectId.is_valid(student_id) else None
+    if not conversation: raise HTTPException(status_code=404, detail="Conversation not found.")
+    return await thread_page(conversation["_id"], page)
+
+@app.post("/api/v1/admin/conversations/{student_id}/read")
+async def mark_admin_conversation_read(student_id: str, admin: dict = Depends(get_current_admin)):
+    # One shared inbox: reading a thread clears it for every admin
+    if not ObjectId.is_valid(student_id) or not (await conversations_collection.update_one({"student_id": ObjectId(student_id)}, {"$set": {"unread_admin": 0}})).matched_count:
+        raise HTTPException(status_code=404, detail="Conversation not found.")
+    return {"message": "Conversation marked as read"}
+
+async def load_reviews_page(page: Page, after: dict) -> dict:
+    pipeline = [{"$match": after}, {"$sort": {"created_at": -1, "_id": -1}}, {"$limit": page.limit + 1}, {"$lookup": {"from": "courses", "localField": "course_id", "foreignField": "_id", "as": "course_info"}}, {"$unwind": {"path": "$course_info", "preserveNullAndEmptyArrays": True}}, {"$project": {"review_id": {"$toString": "$_id"}, "course_title": "$course_info.title", "student_name": "$student_name", "rating": "$rating", "comment": "$comment", "created_at": "$created_at"}}]
+    reviews = [r async for r in await reviews_collection.aggregate(pipeline)]
+    next_cursor = page.next_cursor(reviews, "created_at", "_id")
+    for r in reviews: r["_id"] = r.pop("review_id")
+    return {"items": reviews, "next": next_cursor}
 
 @app.get("/api/v1/admin/reviews/")
-async def get_all_reviews(admin: dict = Depends(get_current_admin)):
-    pipeline = [{"$sort": {"created_at": -1}}, {"$lookup": {"from": "courses", "localField": "course_id", "foreignField": "_id", "as": "course_info"}}, {"$unwind": {"path": "$course_info", "preserveNullAndEmptyArrays": True}}, {"$project": {"_id": {"$toString": "$_id"}, "course_title": "$course_info.title", "student_name": "$student_name", "rating": "$rating", "comment": "$comment", "created_at": "$created_at"}}]
-    return list(reviews_collection.aggregate(pipeline))
+async def get_all_reviews(response: Response, admin: dict = Depends(get_current_admin), page: Page = Depends()):
+    after = page.after_desc("created_at")   # a bad cursor is a 400 here, not a failed cache refresh
+    reviews, headers = await cached_aggregate("reviews", page.cache_key(), lambda: load_reviews_page(page, after))
+    response.headers.update(headers)
+    return reviews
+
+# --- Streaming exports: CSV / NDJSON straight from a cursor, memory stays flat regardless of row count ---
+EXPORT_BATCH_SIZE = 1000
+EXPORT_FLUSH_BYTES = 64 * 1024
+EXPORTS = {
+    "students": {
+        "collection": "students",
+        "pipeline": [{"$sort": {"_id": 1}}] + ADMIN_STUDENTS_PIPELINE,
+        "fields": ["_id", "full_name", "email", "gender", "date_of_birth", "enrolled_course_titles", "total_enrolled_count", "completed_courses_count"],
+    },
+    "progress": {
+        "collection": "students",
+        "pipeline": [
+            {"$sort": {"_id": 1}},
+            {"$project": {"full_name": 1, "email": 1, "enrollment": {"$objectToArray": {"$ifNull": ["$enrollments", {}]}}}},
+            {"$unwind": "$enrollment"},
+            {"$addFields": {"course_oid": {"$toObjectId": "$enrollment.k"}}},
+            {"$lookup": {"from": "courses", "localField": "course_oid", "foreignField": "_id", "pipeline": [{"$project": {"title": 1}}], "as": "course"}},
+            {"$project": {"_id": 0, "student_id": {"$toString": "$_id"}, "full_name": 1, "email": 1, "course_id": "$enrollment.k", "course_title": {"$arrayElemAt": ["$course.title", 0]},
+                          "completed_items": "$enrollment.v.completed_items", "total_items": "$enrollment.v.total_items", "percentage": "$enrollment.v.percentage", "completed_at": "$enrollment.v.completed_at"}},
+        ],
+        "fields": ["student_id", "full_name", "email", "course_id", "course_title", "completed_items", "total_items", "percentage", "completed_at"],
+    },
+    "reviews": {
+        "collection": "reviews",
+        "pipeline": [
+            {"$sort": {"_id": 1}},
+            {"$lookup": {"from": "courses", "localField": "course_id", "foreignField": "_id", "pipeline": [{"$project": {"title": 1}}], "as": "course"}},
+            {"$project": {"_id": {"$toString": "$_id"}, "course_id": {"$toString": "$course_id"}, "course_title": {"$arrayElemAt": ["$course.title", 0]}, "student_id": {"$toString": "$student_id"},
+                          "student_name": 1, "rating": 1, "comment": 1, "created_at": 1}},
+        ],
+        "fields": ["_id", "course_id", "course_title", "student_id", "student_name", "rating", "comment", "created_at"],
+    },
+}
+
+async def stream_export(cursor, fields: list, fmt: str):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction="ignore")
+    if fmt == "csv": writer.writeheader()
+    async for doc in cursor:
+        row = jsonable_encoder(doc)
+        if fmt == "csv":
+            writer.writerow({k: "; ".join(map(str, v)) if isinstance(v, list) else v for k, v in row.items()})
+        else:
+            buffer.write(json.dumps({f: row.get(f) for f in fields}) + "\n")
+        if buffer.tell() >= EXPORT_FLUSH_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0); buffer.truncate()
+    yield buffer.getvalue()
+
+@app.get("/api/v1/admin/export/{dataset}")
+async def export_dataset(dataset: str, format: str = Query("csv", pattern="^(csv|ndjson)$"), admin: dict = Depends(get_current_admin)):
+    export = EXPORTS.get(dataset)
+    if not export: raise HTTPException(status_code=404, detail=f"Unknown export. Choose one of: {', '.join(EXPORTS)}")
+    cursor = await db[export["collection"]].aggregate(export["pipeline"], batchSize=EXPORT_BATCH_SIZE)
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    filename = f"{dataset}.{format}"
+    return StreamingResponse(stream_export(cursor, export["fields"], format), media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
 
 # ==============================================================================
 # 6. COURSE & CONTENT MANAGEMENT ROUTES (STABLE)
 # ==============================================================================
 @app.get("/api/v1/admin/courses/")
-async def get_all_courses_for_admin(admin: dict = Depends(get_current_admin)):
-    courses = list(courses_collection.find())
+async def get_all_courses_for_admin(admin: dict = Depends(get_current_admin), page: Page = Depends()):
+    courses = await courses_collection.find(page.after_id()).sort("_id", ASCENDING).limit(page.limit + 1).to_list()
+    next_cursor = page.next_cursor(courses, "_id")
     for c in courses:
         c["_id"] = str(c["_id"])
         c["course_content"] = c.get("course_content", [])
-    return courses
+    return {"items": courses, "next": next_cursor}
+
+@app.get("/api/v1/admin/courses/suggest")
+async def suggest_courses_for_admin(q: str = Query(..., min_length=1, max_length=200), limit: int = Query(SUGGEST_LIMIT, ge=1, le=50), admin: dict = Depends(get_current_admin)):
+    return {"items": course_suggestions.search(q, limit)}
 
 @app.get("/api/v1/courses/")
-async def get_all_courses_for_student(student: dict = Depends(get_current_student)):
-    courses = list(courses_collection.find({}, {"course_content": 0, "file_path": 0}))
+async def get_all_courses_for_student(request: Request, response: Response, student: dict = Depends(get_current_student), page: Page = Depends()):
+    version = (await get_versions(CATALOG_VERSION_ID))[CATALOG_VERSION_ID]
+    if (not_modified := conditional(request, response, make_etag("catalog", version, page.after, page.limit))): return not_modified
+    courses = await courses_collection.find(page.after_id(), {"course_content": 0, "file_path": 0, **STUDENT_COURSE_HIDDEN}).sort("_id", ASCENDING).limit(page.limit + 1).to_list()
+    next_cursor = page.next_cursor(courses, "_id")
     for c in courses: c["_id"] = str(c["_id"])
-    return courses
+    return {"items": courses, "next": next_cursor}
+
+# --- Catalog search: $text over title/description ranked by textScore. The last word is also expanded to the most
+# common vocabulary terms it prefixes (search-as-you-type); pages are keyset cursors over (score, _id) ---
+SEARCH_MIN_PREFIX = 2
+SEARCH_PREFIX_EXPANSIONS = int(os.getenv("SEARCH_PREFIX_EXPANSIONS", "10"))
+SEARCH_MAX_QUERY = 200
+
+def search_words(*texts) -> list:
+    """Lower-cased word tokens in order, without duplicates; punctuation (and so $text's -negation and "phrases") is dropped."""
+    return list(dict.fromkeys(w for text in texts for w in re.findall(r"\w+", (text or "").lower())))
+
+async def index_course_terms(course: dict, delta: int):
+    """Vocabulary for prefix expansion: {_id: term, courses: number of courses using it}; delta is +1 on create, -1 on delete."""
+    terms = [t for t in search_words(course.get("title"), course.get("description")) if len(t) >= SEARCH_MIN_PREFIX]
+    if not terms: return
+    await search_terms_collection.bulk_write([UpdateOne({"_id": t}, {"$inc": {"courses": delta}}, upsert=True) for t in terms], ordered=False)
+    if delta < 0: await search_terms_collection.delete_many({"_id": {"$in": terms}, "courses": {"$lte": 0}})
+
+async def rebuild_search_terms() -> int:
+    """Recount the whole vocabulary from the courses (startup on an empty vocabulary, `manage.py rebuild-search-terms`)."""
+    counts = defaultdict(int)
+    async for course in courses_collection.find({}, {"title": 1, "description": 1}):
+        for t in search_words(course.get("title"), course.get("description")):
+            if len(t) >= SEARCH_MIN_PREFIX: counts[t] += 1
+    # Upserts instead of delete-all + insert: workers rebuilding side by side at startup write the same documents
+    terms = list(counts.items())
+    for i in range(0, len(terms), 1000):
+        await search_terms_collection.bulk_write([UpdateOne({"_id": t}, {"$set": {"courses": n}}, upsert=True) for t, n in terms[i:i + 1000]], ordered=False)
+    stale = [t["_id"] async for t in search_terms_collection.find({}, {"_id": 1}) if t["_id"] not in counts]
+    for i in range(0, len(stale), 1000): await search_terms_collection.delete_many({"_id": {"$in": stale[i:i + 1000]}})
+    return len(terms)
+
+async def expand_prefix(prefix: str) -> list:
+    if len(prefix) < SEARCH_MIN_PREFIX: return []
+    # Anchored regex on _id is an index range scan over the terms that start with the prefix
+    terms = await search_terms_collection.find({"_id": {"$regex": "^" + re.escape(prefix)}}).sort("courses", DESCENDING).limit(SEARCH_PREFIX_EXPANSIONS).to_list()
+    return [t["_id"] for t in terms]
+
+@app.get("/api/v1/courses/suggest")
+async def suggest_courses(q: str = Query(..., min_length=1, max_length=SEARCH_MAX_QUERY), limit: int = Query(SUGGEST_LIMIT, ge=1, le=50), student: dict = Depends(get_current_student)):
+    return {"items": course_suggestions.search(q, limit)}
+
+@app.get("/api/v1/courses/search")
+async def search_courses(request: Request, response: Response, q: str = Query(..., min_length=1, max_length=SEARCH_MAX_QUERY), student: dict = Depends(get_current_student), page: Page = Depends()):
+    words = search_words(q)
+    if not words: return {"items": [], "next": None}
+    version = (await get_versions(CATALOG_VERSION_ID))[CATALOG_VERSION_ID]
+    if (not_modified := conditional(request, response, make_etag("search", version, words, page.after, page.limit))): return not_modified
+    terms = list(dict.fromkeys(words + await expand_prefix(words[-1])))
+    pipeline = [{"$match": {"$text": {"$search": " ".join(terms)}}}, {"$addFields": {"score": {"$meta": "textScore"}}}]
+    if page.after: pipeline.append({"$match": page.after_desc("score")})
+    pipeline += [{"$sort": {"score": -1, "_id": -1}}, {"$limit": page.limit + 1}, {"$project": {"course_content": 0, "file_path": 0, **STUDENT_COURSE_HIDDEN}}]
+    courses = await (await courses_collection.aggregate(pipeline)).to_list()
+    next_cursor = page.next_cursor(courses, "score", "_id")
+    for c in courses: c["_id"] = str(c["_id"])
+    return {"items": courses, "next": next_cursor}
 
 @app.post("/api/v1/student/enroll/{course_id}")
 async def enroll_in_course(course_id: str, student: dict = Depends(get_current_student)):
     obj_course_id = ObjectId(course_id)
-    if not courses_collection.find_one({"_id": obj_course_id}): raise HTTPException(status_code=404, detail="Course not found.")
-    enrolled_ids_str = [str(c) for c in student.get("enrolled_courses", [])]
-    if course_id in enrolled_ids_str: raise HTTPException(status_code=400, detail="Already enrolled.")
-    students_collection.update_one({"_id": student["_id"]}, {"$addToSet": {"enrolled_courses": obj_course_id}})
+    course = await courses_collection.find_one({"_id": obj_course_id}, {"content_count": 1})
+    if not course: raise HTTPException(status_code=404, detail="Course not found.")
+    total = course.get("content_count", 0)
+    enrollment_key = f"enrollments.{course_id}"
+    updated = await students_collection.find_one_and_update({"_id": student["_id"], "enrolled_courses": {"$ne": obj_course_id}}, [
+        {"$set": {"enrolled_courses": {"$concatArrays": [{"$ifNull": ["$enrolled_courses", []]}, [obj_course_id]]},
+                  enrollment_key: {"completed_items": {"$size": {"$ifNull": [f"$progress.{course_id}", []]}}, "total_items": total, "percentage": 0, "completed_at": None}}},
+        refresh_enrollment_stage(course_id)], projection={enrollment_key: 1}, return_document=ReturnDocument.AFTER)
+    if updated is None: raise HTTPException(status_code=400, detail="Already enrolled.")
+    # Progress recorded before enrolling can already cover the whole course
+    if updated["enrollments"][course_id].get("completed_at"): await record_course_completed(student["_id"], obj_course_id)
+    await courses_collection.update_one({"_id": obj_course_id}, {"$inc": {"enrollment_count": 1}})
+    await record_enrollment_event(obj_course_id)
     return {"message": "Successfully enrolled."}
 
 @app.post("/api/v1/courses/no-file/")
 async def create_course_text_only(data: CourseSchema, admin: dict = Depends(get_current_admin)):
-    result = courses_collection.insert_one(data.dict())
+    result = await courses_collection.insert_one({**data.dict(), "enrollment_count": 0, "content_count": 0})
+    await bump_stats(total_courses=1)
+    await index_course_terms(data.dict(), 1)
+    course_suggestions.add(*course_suggestion({"_id": result.inserted_id, "title": data.title}))
+    await bump_versions(result.inserted_id)
+    admin_caches["dashboard"].clear()
     return {"message": "Course created successfully!", "course_id": str(result.inserted_id)}
 
+# --- Streaming uploads: the multipart body is parsed as it arrives (no spooled copy); file bytes are hashed and
+# written to a temporary storage object off the event loop, then moved to their blob key ---
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(500 * 1024 * 1024)))
+MAX_FORM_FIELD_BYTES = 64 * 1024
+UPLOAD_WRITE_CHUNK = 1024 * 1024
+
+class UploadSink:
+    """One uploaded file on its way into storage."""
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.tmp_key = f".upload-{ObjectId()}.part"
+        self.size = 0
+        self.sha256 = None
+        self.stored = False
+        self._hash = hashlib.sha256()
+        self._writer = None
+        self._closed = False
+
+    async def write(self, data: bytes):
+        if self._writer is None: self._writer = await storage.open_writer(self.tmp_key)
+        await run_in_threadpool(self._hash.update, data)
+        await self._writer.write(data)
+
+    async def close(self):
+        if self._writer is None: self._writer = await storage.open_writer(self.tmp_key)
+        await self._writer.close()
+        self._closed = True
+        self.sha256 = self._hash.hexdigest()
+
+    async def discard(self):
+        """Drop the temporary object unless it was moved into the blob store."""
+        if self._writer is None or self.stored: return
+        if self._closed: await storage.delete(self.tmp_key)
+        else: await self._writer.abort()
+
+async def receive_upload(request: Request) -> tuple:
+    """Parse a multipart/form-data body; returns (text fields, UploadSink of the `content` file or None)."""
+    mime, params = parse_options_header(request.headers.get("content-type", ""))
+    if mime == b"application/x-www-form-urlencoded":
+        # No file can be in it (e.g. a YouTube-only upload); small enough to parse in one go
+        form = await request.form(max_part_size=MAX_FORM_FIELD_BYTES)
+        return {name: str(value).strip() for name, value in form.items()}, None
+    if mime != b"multipart/form-data" or not params.get(b"boundary"): raise HTTPException(status_code=400, detail="Expected multipart/form-data")
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > MAX_UPLOAD_BYTES + MAX_FORM_FIELD_BYTES: raise HTTPException(status_code=413, detail="Upload too large")
+
+    fields, part, header = {}, {}, {"field": b"", "value": b""}
+    state = {"sink": None, "pending": bytearray(), "error": None}
+
+    def on_part_begin(): part.clear(); part["headers"] = {}
+    def on_header_field(data, start, end): header["field"] += data[start:end]
+    def on_header_value(data, start, end): header["value"] += data[start:end]
+    def on_header_end():
+        part["headers"][header["field"].lower()] = header["value"]; header["field"] = header["value"] = b""
+    def on_headers_finished():
+        _, options = parse_options_header(part["headers"].get(b"content-disposition", b""))
+        part["name"] = options.get(b"name", b"").decode()
+        filename = options.get(b"filename")
+        if filename is None: fields[part["name"]] = bytearray()
+        elif filename and part["name"] == "content" and state["sink"] is None: part["sink"] = state["sink"] = UploadSink(filename.decode(errors="replace"))
+    def on_part_data(data, start, end):
+        if part.get("sink"):
+            part["sink"].size += end - start
+            if part["sink"].size > MAX_UPLOAD_BYTES: state["error"] = HTTPException(status_code=413, detail="Upload too large")
+            else: state["pending"] += data[start:end]
+        elif part["name"] in fields:
+            fields[part["name"]] += data[start:end]
+            if len(fields[part["name"]]) > MAX_FORM_FIELD_BYTES: state["error"] = HTTPException(status_code=413, detail="Form field too large")
+
+    parser = MultipartParser(params[b"boundary"], {"on_part_begin": on_part_begin, "on_header_field": on_header_field, "on_header_value": on_header_value,
+                                                   "on_header_end": on_header_end, "on_headers_finished": on_headers_finished, "on_part_data": on_part_data})
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            if state["error"]: raise state["error"]
+            if len(state["pending"]) >= UPLOAD_WRITE_CHUNK:
+                await state["sink"].write(bytes(state["pending"])); state["pending"].clear()
+        parser.finalize()
+        if state["sink"]:
+            if state["pending"]: await state["sink"].write(bytes(state["pending"]))
+            await state["sink"].close()
+    except MultipartParseError:
+        if state["sink"]: await state["sink"].discard()
+        raise HTTPException(status_code=400, detail="Malformed multipart body")
+    except BaseException:
+        if state["sink"]: await state["sink"].discard()
+        raise
+    return {name: value.decode(errors="replace").strip() for name, value in fields.items()}, state["sink"]
+
+# --- Content-addressed file store: each distinct file is kept once under the storage key blobs/<aa>/<sha256>; a `blobs`
+# document {_id: sha256, size, path, refcount} counts the content items pointing at it (`python manage.py dedup-uploads`
+# moves pre-existing `<course_id>_<name>` files in) ---
+def blob_path(sha256: str) -> str:
+    """Blob location relative to BASE_DIR ("uploads/<storage key>"), the form stored on content items."""
+    return f"uploads/blobs/{sha256[:2]}/{sha256}"
+
+async def store_blob(upload: UploadSink) -> str:
+    """Take a reference on the blob holding this upload's bytes, creating it if the content is new; returns its path."""
+    path = blob_path(upload.sha256)
+    await blobs_collection.update_one({"_id": upload.sha256}, {"$inc": {"refcount": 1}, "$setOnInsert": {"size": upload.size, "path": path, "created_at": datetime.utcnow()}}, upsert=True)
+    if await storage.stat(storage_key(path)) is None:
+        await storage.move(upload.tmp_key, storage_key(path))
+        upload.stored = True
+    return path
+
+async def release_blobs(items: list):
+    """Drop one reference per file item; a blob nobody points at any more is deleted with its file."""
+    for item in items:
+        if item.get("type") != "file" or not item.get("sha256"): continue
+        blob = await blobs_collection.find_one_and_update({"_id": item["sha256"]}, {"$inc": {"refcount": -1}}, return_document=ReturnDocument.AFTER)
+        if blob and blob["refcount"] <= 0 and (await blobs_collection.delete_one({"_id": blob["_id"], "refcount": {"$lte": 0}})).deleted_count:
+            await storage.delete(storage_key(blob["path"]))
+
+# --- Content text index: after an upload, text is extracted from PDF/DOCX files in a bounded process pool, off the
+# request path, and stored as chunks {course_id, content_id, sha256, n, page, text, terms}. The multikey
+# (course_id, terms) index is the per-course inverted index. Chunks are reused by sha256, so re-uploading a file that
+# is already indexed anywhere costs no extraction; each file item records text_index: indexed | skipped | failed ---
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", "2"))
+EXTRACT_MAX_BYTES = int(os.getenv("EXTRACT_MAX_BYTES", str(50 * 1024 * 1024)))
+CONTENT_SEARCH_CANDIDATES = 200
+CONTENT_SEARCH_LIMIT = 20
+SNIPPET_CHARS = 160
+extract_pool = None
+extract_slots = asyncio.Semaphore(EXTRACT_WORKERS * 2)  # items being indexed at once (file bytes held in memory)
+indexing_tasks = set()
+
+def track_indexing(coro):
+    task = asyncio.create_task(coro)
+    indexing_tasks.add(task); task.add_done_callback(indexing_tasks.discard)
+
+def get_extract_pool() -> ProcessPoolExecutor:
+    global extract_pool
+    # spawn, not fork: the workers must not inherit the Mongo client or the event loop
+    if extract_pool is None: extract_pool = ProcessPoolExecutor(max_workers=EXTRACT_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return extract_pool
+
+async def set_index_state(course_id: ObjectId, content_id: str, state: str) -> bool:
+    result = await courses_collection.update_one({"_id": course_id, "course_content.content_id": content_id}, {"$set": {"course_content.$.text_index": state}})
+    return result.matched_count > 0
+
+async def index_content_item(course_id: ObjectId, item: dict):
+    content_id, sha256 = item["content_id"], item.get("sha256")
+    async with extract_slots:
+        try:
+            file = file_entry(item)
+            if not extraction_supported(file["name"]) or item.get("size", 0) > EXTRACT_MAX_BYTES:
+                await set_index_state(course_id, content_id, "skipped"); return
+            await content_chunks_collection.delete_many({"course_id": course_id, "content_id": content_id})
+            source = await content_chunks_collection.find_one({"sha256": sha256}, {"course_id": 1, "content_id": 1}) if sha256 else None
+            if source:
+                chunks = await content_chunks_collection.find({"course_id": source["course_id"], "content_id": source["content_id"]}, {"_id": 0, "course_id": 0, "content_id": 0}).to_list()
+            else:
+                data = file["path"] or b"".join([chunk async for chunk in storage.read(file["key"])])
+                chunks = await asyncio.get_running_loop().run_in_executor(get_extract_pool(), extract_chunks, data, file["name"])
+            if chunks: await content_chunks_collection.insert_many([{**c, "course_id": course_id, "content_id": content_id, "sha256": sha256} for c in chunks])
+            if not await set_index_state(course_id, content_id, "indexed"):
+                # The course or item went away while we were extracting
+                await content_chunks_collection.delete_many({"course_id": course_id, "content_id": content_id})
+        except Exception as e:
+            # Nothing to report when the course or item was deleted under us (its blob may be gone too)
+            if await set_index_state(course_id, content_id, "failed"): print(f"❌ Could not index content {content_id} of course {course_id}: {e!r}")
+
+async def index_pending_content():
+    """Startup catch-up for files uploaded before the index existed or while the server was down mid-extraction."""
+    async for course in courses_collection.find({"course_content": {"$elemMatch": {"type": "file", "text_index": {"$exists": False}}}}, {"course_content": 1}):
+        for item in course["course_content"]:
+            if item.get("type") == "file" and "text_index" not in item: track_indexing(index_content_item(course["_id"], item))
+
+def make_snippet(text: str, words: list) -> str:
+    lowered = text.lower()
+    at = min((i for i in (lowered.find(w) for w in words) if i >= 0), default=0)
+    start = max(0, min(at - SNIPPET_CHARS // 3, len(text) - SNIPPET_CHARS))
+    return ("…" if start else "") + text[start:start + SNIPPET_CHARS].strip() + ("…" if start + SNIPPET_CHARS < len(text) else "")
+
+@app.get("/api/v1/student/course/{course_id}/search")
+async def search_course_content(course_id: str, q: str = Query(..., min_length=1, max_length=SEARCH_MAX_QUERY), student: dict = Depends(get_current_student)):
+    obj_course_id = await require_enrollment(student, course_id)
+    words = text_terms(q)
+    if not words: return {"results": []}
+    # Every word must appear in the chunk; the last one may be a prefix (search-as-you-type)
+    match = [{"terms": w} for w in words[:-1]] + [{"terms": {"$regex": "^" + re.escape(words[-1])}}]
+    chunks = await content_chunks_collection.find({"course_id": obj_course_id, "$and": match}, {"content_id": 1, "page": 1, "text": 1}).limit(CONTENT_SEARCH_CANDIDATES).to_list()
+    ranked = sorted(chunks, key=lambda c: -sum(c["text"].lower().count(w) for w in words))[:CONTENT_SEARCH_LIMIT]
+    course = await courses_collection.find_one({"_id": obj_course_id}, {"course_content.content_id": 1, "course_content.name": 1})
+    names = {item.get("content_id"): item.get("name") for item in (course or {}).get("course_content", [])}
+    return {"results": [{"content_id": c["content_id"], "name": names.get(c["content_id"]), "page": c.get("page"), "snippet": make_snippet(c["text"], words)} for c in ranked]}
+
 @app.post("/api/v1/admin/upload")
-async def upload_course_content(admin: dict = Depends(get_current_admin), course_id: str = Form(...), content: Optional[UploadFile] = File(None), youtube_link_upload: Optional[str] = Form(None)):
-    if not (content and content.filename) and not youtube_link_upload: raise HTTPException(status_code=400, detail="File or YouTube link must be provided.")
-    obj_course_id = ObjectId(course_id)
-    if not courses_collection.find_one({"_id": obj_course_id}): raise HTTPException(status_code=404, detail="Course not found.")
-    
-    content_id = str(ObjectId())
-    update_data = {}
-    if content and content.filename:
-        safe_filename = "".join(c for c in content.filename if c.isalnum() or c in ('.', '_', '-', ' ')).strip()
-        # Use absolute path for file storage
-        file_path = os.path.join(UPLOADS_DIR, f"{course_id}_{safe_filename}")
-        with open(file_path, "wb") as buffer: shutil.copyfileobj(content.file, buffer)
-        # Store relative path in database for portability (will be resolved to absolute when needed)
-        db_path = os.path.join("uploads", f"{course_id}_{safe_filename}").replace("\\", "/")
-        update_data = {"type": "file", "path": db_path, "name": safe_filename, "content_id": content_id}
-    elif youtube_link_upload:
-        update_data = {"type": "youtube", "url": youtube_link_upload, "content_id": content_id}
-
-    if update_data: courses_collection.update_one({"_id": obj_course_id}, {"$push": {"course_content": {**update_data, "uploaded_at": datetime.utcnow()}}})
+async def upload_course_content(request: Request, admin: dict = Depends(get_current_admin)):
+    fields, upload = await receive_upload(request)
+    try:
+        course_id, youtube_link_upload = fields.get("course_id", ""), fields.get("youtube_link_upload")
+        if not upload and not youtube_link_upload: raise HTTPException(status_code=400, detail="File or YouTube link must be provided.")
+        if not ObjectId.is_valid(course_id): raise HTTPException(status_code=404, detail="Course not found.")
+        obj_course_id = ObjectId(course_id)
+        if not await courses_collection.find_one({"_id": obj_course_id}, {"_id": 1}): raise HTTPException(status_code=404, detail="Course not found.")
+
+        content_id = str(ObjectId())
+        update_data = {}
+        if upload:
+            safe_filename = "".join(c for c in upload.filename if c.isalnum() or c in ('.', '_', '-', ' ')).strip()
+            # The stored path is the blob's (relative to BASE_DIR); the original name is kept for display and downloads
+            db_path = await store_blob(upload)
+            update_data = {"type": "file", "path": db_path, "name": safe_filename, "content_id": content_id, "size": upload.size, "sha256": upload.sha256}
+        elif youtube_link_upload:
+            update_data = {"type": "youtube", "url": youtube_link_upload, "content_id": content_id}
+    finally:
+        if upload: await upload.discard()
+
+    if update_data:
+        course = await courses_collection.find_one_and_update({"_id": obj_course_id}, {"$push": {"course_content": {**update_data, "uploaded_at": datetime.utcnow()}}, "$inc": {"content_count": 1}}, projection={"content_count": 1}, return_document=ReturnDocument.AFTER)
+        if not course:
+            await release_blobs([update_data])
+            raise HTTPException(status_code=404, detail="Course not found.")
+        await students_collection.update_many({"enrolled_courses": obj_course_id, f"enrollments.{course_id}": {"$exists": True}}, [
+            {"$set": {f"enrollments.{course_id}.total_items": course["content_count"]}},
+            refresh_enrollment_stage(course_id)])
+        await clear_course_completions(obj_course_id)
+        await bump_versions(obj_course_id)
+        if update_data["type"] == "file": track_indexing(index_content_item(obj_course_id, update_data))
     return {"message": "Content uploaded successfully"}
 
 @app.delete("/api/v1/admin/courses/{course_id}")
 async def delete_course(course_id: str, admin: dict = Depends(get_current_admin)):
-    courses_collection.delete_one({"_id": ObjectId(course_id)}); return {"message": "Course deleted successfully"}
+    deleted = await courses_collection.find_one_and_delete({"_id": ObjectId(course_id)}, projection={"course_content": 1, "title": 1, "description": 1})
+    if deleted:
+        await bump_stats(total_courses=-1)
+        await index_course_terms(deleted, -1)
+        course_suggestions.remove(course_id)
+        await release_blobs(deleted.get("course_content", []))
+        await bump_versions(ObjectId(course_id))
+        await enrollment_buckets_collection.delete_many({"course_id": ObjectId(course_id)})
+        await content_chunks_collection.delete_many({"course_id": ObjectId(course_id)})
+        await clear_course_completions(ObjectId(course_id))
+        for cache in admin_caches.values(): cache.clear()
+        content_manifest.invalidate_where(lambda key, value: key[0] == ObjectId(course_id))
+        await students_collection.update_many({"enrolled_courses": ObjectId(course_id)}, {"$unset": {f"enrollments.{course_id}": ""}})
+    return {"message": "Course deleted successfully"}
 
 @app.post("/api/v1/reviews/")
 async def submit_review(data: ReviewSchema, student: dict = Depends(get_current_student)):
     review_data = data.dict(); review_data["course_id"] = ObjectId(data.course_id); review_data["student_id"] = student["_id"]
-    result = reviews_collection.insert_one(review_data)
+    result = await reviews_collection.insert_one(review_data)
     return {"message": "Review submitted", "review_id": str(result.inserted_id)}
 
 # Serve Frontend Static Files (Fix for Video Embeds Error 153)
@@ -0,0 +1,177 @@
+"""Maintenance commands for the Online Course Portal database.
+
+Usage (from the backend directory):
+    python manage.py indexes            # report missing / undeclared / unused indexes
+    python manage.py indexes --create   # ...and build the missing ones
+    python manage.py reconcile-stats    # recompute dashboard counters and report drift
+    python manage.py backfill-content-count [--all]   # set courses.content_count from course_content
+    python manage.py backfill-conversations           # thread messages written before conversations existed
+    python manage.py dedup-uploads [--dry-run]        # move uploads into the content-addressed blob store
+    python manage.py rebuild-search-terms             # recount the prefix-search vocabulary from the courses
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+from collections import defaultdict
+from datetime import datetime
+
+from main import db, INDEXES, ensure_indexes, reconcile_counters, backfill_content_count, backfill_conversations, rebuild_search_terms
+from main import BASE_DIR, UPLOADS_DIR, courses_collection, blobs_collection, blob_path, storage
+
+
+# ==============================================================================
+# INDEXES
+# ==============================================================================
+async def report_indexes(create: bool = False):
+    if create:
+        await ensure_indexes()
+    for collection_name, models in INDEXES.items():
+        collection = db[collection_name]
+        declared = {m.document["name"]: m.document["key"] for m in models}
+        # A text index is stored as {_fts: "text", _ftsx: 1}; compare its indexed fields (weights) instead
+        existing = {ix["name"]: ({f: "text" for f in ix["weights"]} if "weights" in ix else ix["key"]) async for ix in await collection.list_indexes()}
+        usage = {s["name"]: s["accesses"]["ops"] async for s in await collection.aggregate([{"$indexStats": {}}])}
+
+        print(f"\n[{collection_name}]")
+        for name, key in declared.items():
+            if name not in existing:
+                print(f"  MISSING    {name} {dict(key)}")
+            elif dict(existing[name]) != dict(key):
+                print(f"  MISMATCH   {name} declared {dict(key)} but found {dict(existing[name])}")
+            else:
+                print(f"  ok         {name} (ops since restart: {usage.get(name, 0)})")
+        for name in existing:
+            if name == "_id_" or name in declared: continue
+            print(f"  UNDECLARED {name} {dict(existing[name])} (ops since restart: {usage.get(name, 0)})")
+        for name, ops in usage.items():
+            if name != "_id_" and ops == 0:
+                print(f"  UNUSED     {name} has not served a query since the server started")
+
+
+# ==============================================================================
+# COUNTERS
+# ==============================================================================
+async def reconcile_stats(dry_run: bool = False):
+    drift = await reconcile_counters(apply=not dry_run)
+    verb = "would fix" if dry_run else "fixed"
+    for field, values in drift["stats"].items():
+        print(f"  {field}: stored {values['stored']} -> actual {values['actual']}")
+    for field, owner in (("content_count", "course"), ("enrollment_count", "course"), ("completed_courses", "student"), ("enrollments", "student")):
+        if drift[field]: print(f"  {verb} {field} on {drift[field]} {owner}(s)")
+    if not any(drift.values()): print("  no drift")
+
+
+async def backfill_counts(recompute_all: bool = False):
+    written = await backfill_content_count(only_missing=not recompute_all)
+    print(f"  content_count written on {written} course(s)")
+
+
+async def thread_messages():
+    threaded = await backfill_conversations()
+    print(f"  {threaded} message(s) added to their conversation")
+
+
+# ==============================================================================
+# UPLOADS
+# ==============================================================================
+def file_sha256(path: str) -> tuple:
+    digest, size = hashlib.sha256(), 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk); size += len(chunk)
+    return digest.hexdigest(), size
+
+
+async def dedup_uploads(dry_run: bool = False):
+    """Point every file item at its blob (one file per distinct content), drop the duplicates, recount references."""
+    if storage.name != "local":
+        print(f"  dedup-uploads works on the local uploads/ tree; STORAGE_BACKEND is {storage.name}")
+        return
+    legacy = {}                 # legacy file path -> (sha256, size)
+    moves = []                  # (course_id, content_id, legacy path)
+    refs, sizes = defaultdict(int), {}
+    async for course in courses_collection.find({"course_content.type": "file"}, {"course_content": 1}):
+        for item in course["course_content"]:
+            if item.get("type") != "file" or not item.get("path"): continue
+            if item.get("sha256") and item["path"] == blob_path(item["sha256"]):
+                refs[item["sha256"]] += 1; sizes[item["sha256"]] = item.get("size", 0)
+                continue
+            source = os.path.normpath(os.path.join(BASE_DIR, item["path"].replace("\\", "/")))
+            if source not in legacy:
+                if not os.path.exists(source):
+                    print(f"  MISSING    {item['path']} (course {course['_id']}, content {item.get('content_id')})")
+                    continue
+                legacy[source] = file_sha256(source)
+            sha256, size = legacy[source]
+            refs[sha256] += 1; sizes[sha256] = size
+            moves.append((course["_id"], item.get("content_id"), source))
+
+    reclaimed, removed, created = 0, 0, set()
+    for source, (sha256, size) in legacy.items():
+        target = os.path.join(BASE_DIR, blob_path(sha256))
+        if not os.path.exists(target) and sha256 not in created:
+            created.add(sha256)
+            if not dry_run:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(source, target)
+        else:
+            reclaimed += size; removed += 1
+            if not dry_run: os.remove(source)
+
+    if not dry_run:
+        for course_id, content_id, source in moves:
+            sha256, size = legacy[source]
+            await courses_collection.update_one({"_id": course_id, "course_content.content_id": content_id}, {"$set": {
+                "course_content.$.path": blob_path(sha256), "course_content.$.sha256": sha256, "course_content.$.size": size}})
+        for sha256, count in refs.items():
+            await blobs_collection.update_one({"_id": sha256}, {"$set": {"refcount": count, "size": sizes[sha256], "path": blob_path(sha256)}, "$setOnInsert": {"created_at": datetime.utcnow()}}, upsert=True)
+        await blobs_collection.delete_many({"_id": {"$nin": list(refs)}})
+
+    referenced = set(legacy) | {os.path.normpath(os.path.join(BASE_DIR, blob_path(h))) for h in refs}
+    orphans = [os.path.join(UPLOADS_DIR, n) for n in os.listdir(UPLOADS_DIR) if os.path.isfile(os.path.join(UPLOADS_DIR, n)) and os.path.normpath(os.path.join(UPLOADS_DIR, n)) not in referenced]
+    verb = "would" if dry_run else "did"
+    print(f"  {len(moves)} file item(s) across {len(legacy)} legacy file(s) -> {len(created)} new blob(s), {len(refs)} blob(s) referenced")
+    print(f"  {verb} remove {removed} duplicate file(s), reclaiming {reclaimed} bytes ({reclaimed / 1024 / 1024:.1f} MB)")
+    if orphans: print(f"  {len(orphans)} unreferenced file(s) left in uploads/ ({sum(os.path.getsize(p) for p in orphans)} bytes), not touched")
+
+
+# ==============================================================================
+# SEARCH
+# ==============================================================================
+async def rebuild_terms():
+    indexed = await rebuild_search_terms()
+    print(f"  {indexed} term(s) indexed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Online Course Portal maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+    indexes = commands.add_parser("indexes", help="report missing or unused indexes")
+    indexes.add_argument("--create", action="store_true", help="build missing indexes first")
+    reconcile = commands.add_parser("reconcile-stats", help="recompute dashboard counters and report drift")
+    reconcile.add_argument("--dry-run", action="store_true", help="only report, do not write")
+    backfill = commands.add_parser("backfill-content-count", help="set courses.content_count from course_content")
+    backfill.add_argument("--all", action="store_true", help="recompute every course, not only those missing the field")
+    commands.add_parser("backfill-conversations", help="thread messages written before conversations existed")
+    dedup = commands.add_parser("dedup-uploads", help="move uploads into the content-addressed blob store")
+    dedup.add_argument("--dry-run", action="store_true", help="only report, do not move or delete files")
+    commands.add_parser("rebuild-search-terms", help="recount the prefix-search vocabulary from the courses")
+
+    args = parser.parse_args()
+    if args.command == "indexes":
+        asyncio.run(report_indexes(create=args.create))
+    elif args.command == "reconcile-stats":
+        asyncio.run(reconcile_stats(dry_run=args.dry_run))
+    elif args.command == "backfill-content-count":
+        asyncio.run(backfill_counts(recompute_all=args.all))
+    elif args.command == "backfill-conversations":
+        asyncio.run(thread_messages())
+    elif args.command == "dedup-uploads":
+        asyncio.run(dedup_uploads(dry_run=args.dry_run))
+    elif args.command == "rebuild-search-terms":
+        asyncio.run(rebuild_terms())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import asyncio
+import json
+import os
+from collections import defaultdict
+
+# ==============================================================================
+# PUB/SUB FOR PUSHED EVENTS (SERVER-SENT EVENTS)
+# ==============================================================================
+# A subscriber is an asyncio.Queue of JSON-serializable events. A subscriber that falls QUEUE_SIZE events behind gets
+# None instead and should end its stream; the client reconnects with Last-Event-ID and catches up from the database.
+QUEUE_SIZE = 256
+
+
+class LocalBroker:
+    """Fan-out to the subscribers of this process only (a single worker)."""
+    name = "local"
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def subscribe(self, channel: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self._subscribers[channel].add(queue)
+        return queue
+
+    def unsubscribe(self, channel: str, queue: asyncio.Queue):
+        subscribers = self._subscribers.get(channel)
+        if subscribers is None: return
+        subscribers.discard(queue)
+        if not subscribers: del self._subscribers[channel]
+
+    def deliver(self, channel: str, event: dict):
+        for queue in list(self._subscribers.get(channel, ())):
+            if queue.full():
+                # Too slow: drop what it has not read and tell it to reconnect
+                while not queue.empty(): queue.get_nowait()
+                queue.put_nowait(None)
+                self._subscribers[channel].discard(queue)
+            else:
+                queue.put_nowait(event)
+
+    async def publish(self, channel: str, event: dict):
+        self.deliver(channel, event)
+
+    def subscriber_count(self) -> int:
+        return sum(len(s) for s in self._subscribers.values())
+
+
+class RedisBroker(LocalBroker):
+    """Publishes through Redis so every worker process sees every event; each process keeps one pattern subscription
+    and fans out to its own subscribers. Needs the optional redis package."""
+    name = "redis"
+
+    def __init__(self, url: str, prefix: str = "lms:events:"):
+        super().__init__()
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("MESSAGE_BROKER=redis requires the redis package (pip install redis)")
+        self.client = redis.from_url(url)
+        self.prefix = prefix
+        self._reader = None
+
+    async def start(self):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        await pubsub.psubscribe(self.prefix + "*")
+        self._reader = asyncio.create_task(self._read(pubsub))
+
+    async def _read(self, pubsub):
+        try:
+            while True:
+                try:
+                    async for message in pubsub.listen():
+                        if message.get("type") != "pmessage": continue
+                        self.deliver(message["channel"].decode()[len(self.prefix):], json.loads(message["data"]))
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    # redis-py re-subscribes when it reconnects. Events published meanwhile are not pushed; clients
+                    # still see them in their lists and after any reconnect (the Last-Event-ID catch-up reads the database)
+                    print(f"❌ Redis event subscription failed, retrying: {e!r}")
+                    await asyncio.sleep(1)
+        finally:
+            await pubsub.aclose()
+
+    async def close(self):
+        if self._reader:
+            self._reader.cancel()
+            try: await self._reader
+            except asyncio.CancelledError: pass
+        await self.client.aclose()
+
+    async def publish(self, channel: str, event: dict):
+        await self.client.publish(self.prefix + channel, json.dumps(event))
+
+
+def broker_from_env():
+    """MESSAGE_BROKER=local (default, one worker) | redis (REDIS_URL, for several workers or hosts)."""
+    if os.getenv("MESSAGE_BROKER", "local").lower() == "redis":
+        return RedisBroker(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+    return LocalBroker()
@@ -0,0 +1,202 @@
+import os
+from fastapi.concurrency import run_in_threadpool
+from gridfs import AsyncGridFSBucket
+
+# ==============================================================================
+# STORAGE BACKENDS FOR UPLOADED COURSE FILES
+# ==============================================================================
+# Every backend stores objects under a key: a POSIX path relative to the uploads root (e.g. "blobs/ab/ab12...").
+# Interface: open_writer(key) -> writer with async write/close/abort, read(key, start, end) -> async byte chunks
+# (end inclusive, for range requests), stat(key) -> {"size", "mtime"} or None, delete(key), move(src, dst), and
+# local_path(key) -> filesystem path or None (only local storage can be served by FileResponse / the proxy modes).
+READ_CHUNK = 256 * 1024
+
+
+class LocalStorage:
+    name = "local"
+
+    def __init__(self, root: str):
+        self.root = os.path.normpath(root)
+
+    def local_path(self, key: str) -> str:
+        path = os.path.normpath(os.path.join(self.root, key))
+        if os.path.commonpath([path, self.root]) != self.root: raise ValueError(f"Key outside the storage root: {key!r}")
+        return path
+
+    async def open_writer(self, key: str):
+        return await run_in_threadpool(LocalWriter, self.local_path(key))
+
+    async def read(self, key: str, start: int = 0, end: int = None):
+        with await run_in_threadpool(open, self.local_path(key), "rb") as f:
+            await run_in_threadpool(f.seek, start)
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                chunk = await run_in_threadpool(f.read, READ_CHUNK if remaining is None else min(READ_CHUNK, remaining))
+                if not chunk: break
+                if remaining is not None: remaining -= len(chunk)
+                yield chunk
+
+    async def stat(self, key: str):
+        try: st = await run_in_threadpool(os.stat, self.local_path(key))
+        except FileNotFoundError: return None
+        return {"size": st.st_size, "mtime": st.st_mtime}
+
+    async def delete(self, key: str):
+        try: await run_in_threadpool(os.remove, self.local_path(key))
+        except FileNotFoundError: pass
+
+    async def move(self, src: str, dst: str):
+        target = self.local_path(dst)
+        await run_in_threadpool(os.makedirs, os.path.dirname(target), exist_ok=True)
+        await run_in_threadpool(os.replace, self.local_path(src), target)
+
+
+class LocalWriter:
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self._file = open(path, "wb")
+
+    async def write(self, data: bytes):
+        await run_in_threadpool(self._file.write, data)
+
+    async def close(self):
+        await run_in_threadpool(self._file.close)
+
+    async def abort(self):
+        await run_in_threadpool(self._file.close)
+        try: await run_in_threadpool(os.remove, self.path)
+        except FileNotFoundError: pass
+
+
+class GridFSStorage:
+    """Files in a GridFS bucket of the application database; the key is the GridFS filename."""
+    name = "gridfs"
+
+    def __init__(self, db, bucket_name: str = "uploads"):
+        self.bucket = AsyncGridFSBucket(db, bucket_name=bucket_name)
+        self.files = db[f"{bucket_name}.files"]
+
+    def local_path(self, key: str):
+        return None
+
+    async def open_writer(self, key: str):
+        return self.bucket.open_upload_stream(key)
+
+    async def read(self, key: str, start: int = 0, end: int = None):
+        grid_out = await self.bucket.open_download_stream_by_name(key)
+        try:
+            await grid_out.seek(start)
+            remaining = (grid_out.length if end is None else end + 1) - start
+            while remaining > 0:
+                chunk = await grid_out.read(min(READ_CHUNK, remaining))
+                if not chunk: break
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            await grid_out.close()
+
+    async def stat(self, key: str):
+        doc = await self.files.find_one({"filename": key}, {"length": 1, "uploadDate": 1}, sort=[("uploadDate", -1)])
+        return {"size": doc["length"], "mtime": doc["uploadDate"].timestamp()} if doc else None
+
+    async def delete(self, key: str):
+        async for doc in self.files.find({"filename": key}, {"_id": 1}):
+            await self.bucket.delete(doc["_id"])
+
+    async def move(self, src: str, dst: str):
+        async for doc in self.files.find({"filename": src}, {"_id": 1}):
+            await self.bucket.rename(doc["_id"], dst)
+
+
+class S3Storage:
+    """Objects in an S3-compatible bucket (AWS, MinIO, ...); needs the optional boto3 package."""
+    name = "s3"
+    PART_SIZE = 8 * 1024 * 1024
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: str = None):
+        try:
+            import boto3
+            from botocore.exceptions import ClientError
+        except ImportError:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires boto3 (pip install boto3)")
+        self.client = boto3.client("s3", endpoint_url=endpoint_url)
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.ClientError = ClientError
+
+    def local_path(self, key: str):
+        return None
+
+    def object_key(self, key: str) -> str:
+        return self.prefix + key
+
+    async def open_writer(self, key: str):
+        return S3Writer(self, self.object_key(key))
+
+    async def read(self, key: str, start: int = 0, end: int = None):
+        # No Range header for a whole-object read: S3 rejects "bytes=0-" on an empty object with InvalidRange
+        ranged = {"Range": f"bytes={start}-{'' if end is None else end}"} if start > 0 or end is not None else {}
+        response = await run_in_threadpool(self.client.get_object, Bucket=self.bucket, Key=self.object_key(key), **ranged)
+        body = response["Body"]
+        try:
+            while chunk := await run_in_threadpool(body.read, READ_CHUNK):
+                yield chunk
+        finally:
+            body.close()
+
+    async def stat(self, key: str):
+        try: head = await run_in_threadpool(self.client.head_object, Bucket=self.bucket, Key=self.object_key(key))
+        except self.ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"): return None
+            raise
+        return {"size": head["ContentLength"], "mtime": head["LastModified"].timestamp()}
+
+    async def delete(self, key: str):
+        await run_in_threadpool(self.client.delete_object, Bucket=self.bucket, Key=self.object_key(key))
+
+    async def move(self, src: str, dst: str):
+        await run_in_threadpool(self.client.copy_object, Bucket=self.bucket, Key=self.object_key(dst), CopySource={"Bucket": self.bucket, "Key": self.object_key(src)})
+        await self.delete(src)
+
+
+class S3Writer:
+    """Buffers PART_SIZE bytes per multipart part; files smaller than one part are sent with a single PUT."""
+    def __init__(self, storage: S3Storage, object_key: str):
+        self.storage, self.object_key = storage, object_key
+        self.client, self.bucket = storage.client, storage.bucket
+        self._buffer = bytearray()
+        self._upload_id = None
+        self._parts = []
+
+    async def write(self, data: bytes):
+        self._buffer += data
+        while len(self._buffer) >= self.storage.PART_SIZE:
+            await self._send_part(bytes(self._buffer[:self.storage.PART_SIZE]))
+            del self._buffer[:self.storage.PART_SIZE]
+
+    async def _send_part(self, data: bytes):
+        if self._upload_id is None:
+            self._upload_id = (await run_in_threadpool(self.client.create_multipart_upload, Bucket=self.bucket, Key=self.object_key))["UploadId"]
+        number = len(self._parts) + 1
+        part = await run_in_threadpool(self.client.upload_part, Bucket=self.bucket, Key=self.object_key, UploadId=self._upload_id, PartNumber=number, Body=data)
+        self._parts.append({"PartNumber": number, "ETag": part["ETag"]})
+
+    async def close(self):
+        if self._upload_id is None:
+            await run_in_threadpool(self.client.put_object, Bucket=self.bucket, Key=self.object_key, Body=bytes(self._buffer))
+            return
+        if self._buffer: await self._send_part(bytes(self._buffer))
+        await run_in_threadpool(self.client.complete_multipart_upload, Bucket=self.bucket, Key=self.object_key, UploadId=self._upload_id, MultipartUpload={"Parts": self._parts})
+
+    async def abort(self):
+        if self._upload_id is not None:
+            await run_in_threadpool(self.client.abort_multipart_upload, Bucket=self.bucket, Key=self.object_key, UploadId=self._upload_id)
+
+
+def storage_from_env(db, uploads_dir: str):
+    """STORAGE_BACKEND=local (default) | gridfs (GRIDFS_BUCKET) | s3 (S3_BUCKET, S3_PREFIX, S3_ENDPOINT_URL + the usual AWS_* credentials)."""
+    backend = os.getenv("STORAGE_BACKEND", "local").lower()
+    if backend == "gridfs": return GridFSStorage(db, os.getenv("GRIDFS_BUCKET", "uploads"))
+    if backend == "s3": return S3Storage(os.environ["S3_BUCKET"], os.getenv("S3_PREFIX", ""), os.getenv("S3_ENDPOINT_URL"))
+    return LocalStorage(uploads_dir)
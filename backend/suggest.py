@@ -0,0 +1,68 @@
+import re
+from bisect import bisect_left, insort
+
+# ==============================================================================
+# IN-MEMORY PREFIX INDEX (AUTOCOMPLETE)
+# ==============================================================================
+class PrefixIndex:
+    """Sorted array of "key\0id" strings answering "which entries have a word starting with q?" by binary search.
+
+    Each entry is indexed at every word start of its `texts` ("advanced python" -> "advanced python", "python"), so
+    "pyth" finds it as well as "adv", and once from the start of each of its `whole` texts (e.g. an email address).
+    A lookup is one bisect plus a scan of the matching keys; an insert or remove is a bisect plus a list insert/delete
+    (a memmove), which is fine for register/create/delete rates. Entries come back in key order, payloads as stored.
+    """
+
+    MAX_WORDS = 8
+
+    def __init__(self):
+        self._keys = []      # sorted "key\0id"; \0 sorts before any word character, so ids stay grouped under their key
+        self._entries = {}   # id -> (keys, payload)
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return " ".join(re.findall(r"\w+", (text or "").casefold()))
+
+    def _keys_for(self, entry_id: str, texts, whole) -> list:
+        keys = set()
+        for text in texts:
+            words = self.normalize(text).split(" ")
+            keys.update(" ".join(words[i:]) for i in range(min(len(words), self.MAX_WORDS)) if words[i])
+        keys.update(key for key in map(self.normalize, whole) if key)
+        return [f"{key}\0{entry_id}" for key in keys]
+
+    def build(self, items):
+        """Replace the contents with `items`: iterable of (id, texts, whole, payload); one sort instead of n inserts."""
+        self._entries = {}
+        for entry_id, texts, whole, payload in items:
+            self._entries[entry_id] = (self._keys_for(entry_id, texts, whole), payload)
+        self._keys = sorted(key for keys, _ in self._entries.values() for key in keys)
+
+    def add(self, entry_id: str, texts, whole, payload):
+        self.remove(entry_id)
+        keys = self._keys_for(entry_id, texts, whole)
+        self._entries[entry_id] = (keys, payload)
+        for key in keys: insort(self._keys, key)
+
+    def remove(self, entry_id: str):
+        entry = self._entries.pop(entry_id, None)
+        if not entry: return
+        for key in entry[0]:
+            i = bisect_left(self._keys, key)
+            if i < len(self._keys) and self._keys[i] == key: del self._keys[i]
+
+    def search(self, query: str, limit: int = 10) -> list:
+        prefix = self.normalize(query)
+        if not prefix: return []
+        found = {}
+        for i in range(bisect_left(self._keys, prefix), len(self._keys)):
+            key = self._keys[i]
+            if not key.startswith(prefix): break
+            entry_id = key[key.index("\0") + 1:]
+            if entry_id not in found:
+                found[entry_id] = self._entries[entry_id][1]
+                if len(found) >= limit: break
+        return list(found.values())
+
+    def __len__(self):
+        return len(self._entries)
@@ -12,6 +12,74 @@ document.addEventListener('DOMContentLoaded', () => {
         if (!isFormData) headers['Content-Type'] = 'application/json';
         return headers;
     };
+    // List endpoints are keyset-paginated: render the first page, then one more page per click on `moreBtn`.
+    // onPage(items, first) renders a page; the returned promise settles with the first page.
+    const loadPages = (url, moreBtn, onPage) => {
+        let next = null;
+        const load = async (first) => {
+            const res = await fetch(next ? `${url}?after=${encodeURIComponent(next)}` : url, { headers: getAuthHeaders() });
+            if (!res.ok) throw new Error(`Request failed: ${res.status}`);
+            const page = await res.json();
+            onPage(page.items, first);
+            next = page.next;
+            moreBtn.style.display = next ? '' : 'none';
+        };
+        moreBtn.onclick = () => load(false).catch(error => console.error(error));
+        return load(true);
+    };
+    // Pickers over long lists: suggestions come from the server's prefix index as the admin types; the picked id goes to
+    // the hidden `picked` input (empty until the text matches a suggestion)
+    const attachPicker = (search, options, picked, url, label) => {
+        let suggested = {}, debounce = null;
+        search.oninput = () => {
+            picked.value = suggested[search.value] || '';
+            clearTimeout(debounce);
+            if (picked.value || !search.value.trim()) return;
+            debounce = setTimeout(async () => {
+                try {
+                    const res = await fetch(`${url}?q=${encodeURIComponent(search.value)}`, { headers: getAuthHeaders() });
+                    if (!res.ok) throw new Error();
+                    suggested = {};
+                    options.innerHTML = '';
+                    (await res.json()).items.forEach(item => { suggested[label(item)] = item._id; options.append(new Option(label(item))); });
+                    picked.value = suggested[search.value] || '';
+                } catch (err) { options.innerHTML = ''; }
+            }, 150);
+        };
+    };
+    // Pushed messages arrive over Server-Sent Events. Read with fetch because EventSource cannot send the Authorization
+    // header. On reconnect, Last-Event-ID makes the server replay what was missed.
+    let messageStream = null, reloadMessages = null;
+    const streamMessages = async (url, lastEventId, onMessage) => {
+        if (messageStream) messageStream.abort();
+        const controller = messageStream = new AbortController();
+        while (!controller.signal.aborted) {
+            try {
+                const headers = getAuthHeaders();
+                if (lastEventId) headers['Last-Event-ID'] = lastEventId;
+                const response = await fetch(url, { headers, signal: controller.signal });
+                if (response.status === 401 || response.status === 403) return;
+                if (!response.ok) throw new Error(`Server status: ${response.status}`);
+                const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+                let buffer = '';
+                for (;;) {
+                    const { value, done } = await reader.read();
+                    if (done) break;
+                    buffer += value;
+                    let end;
+                    while ((end = buffer.indexOf('\n\n')) >= 0) {
+                        const lines = buffer.slice(0, end).split('\n');
+                        buffer = buffer.slice(end + 2);
+                        const id = lines.find(l => l.startsWith('id: ')), data = lines.filter(l => l.startsWith('data: ')).map(l => l.slice(6)).join('\n');
+                        if (!data) continue;
+                        if (id) lastEventId = id.slice(4);
+                        onMessage(JSON.parse(data));
+                    }
+                }
+            } catch (error) { if (controller.signal.aborted) return; }
+            await new Promise(resolve => setTimeout(resolve, 3000));
+        }
+    };
     function showModal(type, title, message, onConfirm) {
         const modal = document.getElementById('custom-modal'), actions = modal.querySelector('.modal-actions');
         modal.querySelector('#modal-title').textContent = title;
@@ -163,22 +231,23 @@ document.addEventListener('DOMContentLoaded', () => {
                 </div>
                 
                 <h3 style="margin-top:40px; border-top:2px solid var(--bg-color); padding-top:20px;">Existing Courses</h3>
-                <table class="table"><thead><tr><th style="width:20%">Title</th><th style="width:35%">Description</th><th style="width:30%">Content</th><th style="width:15%">Actions</th></tr></thead><tbody id="courses-list-body"></tbody></table>`;
+                <table class="table"><thead><tr><th style="width:20%">Title</th><th style="width:35%">Description</th><th style="width:30%">Content</th><th style="width:15%">Actions</th></tr></thead><tbody id="courses-list-body"></tbody></table>
+                <button id="more-admin-courses-btn" class="btn btn-secondary" style="display: none;">Load more</button>`;
             try {
-                const response = await fetch(`${API_BASE_URL}/admin/courses/`, { headers: getAuthHeaders() });
-                const courses = await response.json();
                 const tableBody = document.getElementById('courses-list-body');
-                tableBody.innerHTML = courses.length ? '' : '<tr><td colspan="4" style="text-align:center;">No courses found.</td></tr>';
-                courses.forEach(course => {
-                    const contentHtml = course.course_content.map(content =>
-                        `<li><i class="fas ${content.type === 'file' ? 'fa-file-alt' : 'fa-video'}"></i> ${content.type === 'file' ? (content.path.split(/[\\/]/).pop()) : 'YouTube Link'}</li>`
-                    ).join('');
-                    tableBody.insertAdjacentHTML('beforeend', `
-                        <tr>
-                            <td>${course.title}</td><td>${course.description}</td>
-                            <td><ul class="course-content-list">${contentHtml || 'No content yet'}</ul></td>
-                            <td class="action-buttons"><button class="btn btn-danger" data-action="delete-course" data-id="${course._id}">Delete</button></td>
-                        </tr>`);
+                await loadPages(`${API_BASE_URL}/admin/courses/`, document.getElementById('more-admin-courses-btn'), (courses, first) => {
+                    if (first) tableBody.innerHTML = courses.length ? '' : '<tr><td colspan="4" style="text-align:center;">No courses found.</td></tr>';
+                    courses.forEach(course => {
+                        const contentHtml = course.course_content.map(content =>
+                            `<li><i class="fas ${content.type === 'file' ? 'fa-file-alt' : 'fa-video'}"></i> ${content.type === 'file' ? (content.name || content.path.split(/[\\/]/).pop()) : 'YouTube Link'}</li>`
+                        ).join('');
+                        tableBody.insertAdjacentHTML('beforeend', `
+                            <tr>
+                                <td>${course.title}</td><td>${course.description}</td>
+                                <td><ul class="course-content-list">${contentHtml || 'No content yet'}</ul></td>
+                                <td class="action-buttons"><button class="btn btn-danger" data-action="delete-course" data-id="${course._id}">Delete</button></td>
+                            </tr>`);
+                    });
                 });
             } catch (error) { console.error("Error loading courses:", error); }
         },
@@ -189,9 +258,9 @@ document.addEventListener('DOMContentLoaded', () => {
                     <form id="upload-content-form">
                         <div class="upload-input-group">
                             <label><i class="fas fa-book"></i> 1. Select Course</label>
-                            <select id="course-select" name="course_id" required class="form-control">
-                                <option value="">-- Choose a Course --</option>
-                            </select>
+                            <input type="search" id="course-search" list="course-options" autocomplete="off" required class="form-control" placeholder="Start typing a course title...">
+                            <datalist id="course-options"></datalist>
+                            <input type="hidden" id="course-select" name="course_id">
                         </div>
                         
                         <div class="upload-divider"><span>THEN CHOOSE CONTENT SOURCE</span></div>
@@ -215,12 +284,8 @@ document.addEventListener('DOMContentLoaded', () => {
                         </div>
                     </form>
                 </div>`;
-            try {
-                const response = await fetch(`${API_BASE_URL}/admin/courses/`, { headers: getAuthHeaders() });
-                const courses = await response.json();
-                const courseSelect = document.getElementById('course-select');
-                courses.forEach(course => courseSelect.add(new Option(course.title, course._id)));
-            } catch (error) { console.error(error); }
+            attachPicker(document.getElementById('course-search'), document.getElementById('course-options'), document.getElementById('course-select'),
+                `${API_BASE_URL}/admin/courses/suggest`, c => c.title);
         },
         'view-students-section': async () => {
             const section = document.getElementById('view-students-section');
@@ -228,34 +293,34 @@ document.addEventListener('DOMContentLoaded', () => {
                 <table class="table">
                     <thead><tr><th style="width:20%">Name</th><th style="width:25%">Email</th><th style="width:25%">Courses Enrolled</th><th style="width:15%">Status</th><th style="width:15%">Actions</th></tr></thead>
                     <tbody id="students-table-body"></tbody>
-                </table>`;
+                </table>
+                <button id="more-students-btn" class="btn btn-secondary" style="display: none;">Load more</button>`;
             try {
-                const response = await fetch(`${API_BASE_URL}/admin/students/`, { headers: getAuthHeaders() });
-                if (!response.ok) throw new Error('Failed to fetch students');
-                const students = await response.json();
                 const tableBody = document.getElementById('students-table-body');
-                tableBody.innerHTML = '';
-                if (students.length === 0) {
-                    tableBody.innerHTML = '<tr><td colspan="5" style="text-align:center;">No students have registered yet.</td></tr>';
-                } else {
-                    students.forEach(student => {
-                        const enrolledCoursesHtml = student.enrolled_course_titles && student.enrolled_course_titles.length > 0
-                            ? student.enrolled_course_titles.join('<br>')
-                            : 'No courses enrolled';
-                        tableBody.insertAdjacentHTML('beforeend', `
-                            <tr>
-                                <td>${student.full_name || 'N/A'}</td>
-                                <td>${student.email || 'N/A'}</td>
-                                <td>${enrolledCoursesHtml}</td>
-                                <td style="text-align:center;">
-                                    ${(student.completed_courses_count > 0 && student.total_enrolled_count > 0 && student.completed_courses_count === student.total_enrolled_count) ? '<span class="status-badge success">Completed</span>' : '<span class="status-badge warning">In Progress</span>'}
-                                </td>
-                                <td class="action-buttons">
-                                    <button class="btn btn-danger" data-action="delete-student" data-id="${student._id}">Delete</button>
-                                </td>
-                            </tr>`);
-                    });
-                }
+                await loadPages(`${API_BASE_URL}/admin/students/`, document.getElementById('more-students-btn'), (students, first) => {
+                    if (first) tableBody.innerHTML = '';
+                    if (first && students.length === 0) {
+                        tableBody.innerHTML = '<tr><td colspan="5" style="text-align:center;">No students have registered yet.</td></tr>';
+                    } else {
+                        students.forEach(student => {
+                            const enrolledCoursesHtml = student.enrolled_course_titles && student.enrolled_course_titles.length > 0
+                                ? student.enrolled_course_titles.join('<br>')
+                                : 'No courses enrolled';
+                            tableBody.insertAdjacentHTML('beforeend', `
+                                <tr>
+                                    <td>${student.full_name || 'N/A'}</td>
+                                    <td>${student.email || 'N/A'}</td>
+                                    <td>${enrolledCoursesHtml}</td>
+                                    <td style="text-align:center;">
+                                        ${(student.completed_courses_count > 0 && student.total_enrolled_count > 0 && student.completed_courses_count === student.total_enrolled_count) ? '<span class="status-badge success">Completed</span>' : '<span class="status-badge warning">In Progress</span>'}
+                                    </td>
+                                    <td class="action-buttons">
+                                        <button class="btn btn-danger" data-action="delete-student" data-id="${student._id}">Delete</button>
+                                    </td>
+                                </tr>`);
+                        });
+                    }
+                });
             } catch (error) {
                 document.getElementById('students-table-body').innerHTML = '<tr><td colspan="5" style="color:red; text-align:center;">Could not load student data. Please check the server.</td></tr>';
             }
@@ -267,8 +332,10 @@ document.addEventListener('DOMContentLoaded', () => {
                     <h3 style="margin-bottom: 20px;"><i class="fas fa-paper-plane"></i> Send a Message</h3>
                     <form id="send-message-form">
                         <div class="form-group">
-                            <label for="message-student-select">To Student:</label>
-                            <select id="message-student-select" required><option value="">Loading students...</option></select>
+                            <label for="message-student-search">To Student:</label>
+                            <input type="search" id="message-student-search" list="message-student-options" autocomplete="off" required placeholder="Start typing a name or email...">
+                            <datalist id="message-student-options"></datalist>
+                            <input type="hidden" id="message-student-select">
                         </div>
                         <div class="form-group">
                             <label for="message-text">Message:</label>
@@ -279,58 +346,94 @@ document.addEventListener('DOMContentLoaded', () => {
                         </div>
                     </form>
                 </div>
+                <div id="thread-wrapper" style="margin-top:40px; display: none;">
+                    <h3><i class="fas fa-comments"></i> Conversation with <span id="thread-student-name"></span></h3>
+                    <div id="thread-container" style="margin-top: 15px;"></div>
+                    <button id="thread-older-btn" class="btn btn-secondary" style="display: none;">Load older</button>
+                </div>
                 <div style="margin-top:40px;">
                     <h3><i class="fas fa-inbox"></i> Inbox</h3>
                     <div id="received-messages-container" style="margin-top: 15px;"><p>Loading messages...</p></div>
                 </div>`;
+            // Student picker: suggestions come from the server's prefix index as the admin types
+            attachPicker(document.getElementById('message-student-search'), document.getElementById('message-student-options'), document.getElementById('message-student-select'),
+                `${API_BASE_URL}/admin/students/suggest`, s => `${s.full_name} (${s.email})`);
+            // Inbox: one row per student conversation, newest first, with the unread count kept by the server
+            const container = document.getElementById('received-messages-container'), thread = document.getElementById('thread-container'), olderBtn = document.getElementById('thread-older-btn');
+            let openStudentId = null, threadNext = null;
+            const messageCard = (msg, from) => `<div class="message-card">
+                    <div class="message-card-header"><span>From: ${from}</span><span class="timestamp">${new Date(msg.timestamp).toLocaleString()}</span></div>
+                    <p>${msg.message}</p></div>`;
+            const loadInbox = async () => {
+                const res = await fetch(`${API_BASE_URL}/admin/conversations`, { headers: getAuthHeaders() });
+                if (!res.ok) throw new Error(`Request failed: ${res.status}`);
+                const conversations = (await res.json()).items;
+                container.innerHTML = conversations.length ? '' : '<p>No messages received yet.</p>';
+                conversations.forEach(c => container.insertAdjacentHTML('beforeend', `<div class="message-card" data-student-id="${c.student_id}" data-student-name="${c.student_name}" style="cursor: pointer;">
+                    <div class="message-card-header"><span>${c.student_name}${c.unread ? ` <span class="status-badge warning">${c.unread} unread</span>` : ''}</span><span class="timestamp">${new Date(c.last_message_at).toLocaleString()}</span></div>
+                    <p>${c.last_sender_type === 'admin' ? 'You: ' : ''}${c.preview}</p></div>`));
+                return conversations;
+            };
+            const loadThread = async (append) => {
+                const params = new URLSearchParams({ limit: 20 });
+                if (append && threadNext) params.set('after', threadNext);
+                const res = await fetch(`${API_BASE_URL}/admin/conversations/${openStudentId}/messages?${params}`, { headers: getAuthHeaders() });
+                if (!res.ok) throw new Error(`Request failed: ${res.status}`);
+                const page = await res.json();
+                if (!append) thread.innerHTML = '';
+                page.messages.forEach(msg => thread.insertAdjacentHTML('beforeend', messageCard(msg, msg.sender_type === 'admin' ? 'Admin' : document.getElementById('thread-student-name').textContent)));
+                threadNext = page.next;
+                olderBtn.style.display = threadNext ? '' : 'none';
+            };
+            const openThread = async (studentId, studentName) => {
+                openStudentId = studentId;
+                document.getElementById('thread-wrapper').style.display = '';
+                document.getElementById('thread-student-name').textContent = studentName;
+                search.value = studentName; picked.value = studentId;
+                await loadThread(false);
+                await fetch(`${API_BASE_URL}/admin/conversations/${studentId}/read`, { method: 'POST', headers: getAuthHeaders() });
+                await loadInbox();
+            };
+            container.onclick = e => { const card = e.target.closest('[data-student-id]'); if (card) openThread(card.dataset.studentId, card.dataset.studentName).catch(() => showModal('error', 'Error', 'Could not open the conversation.')); };
+            olderBtn.onclick = () => loadThread(true);
+            // After the admin sends a message: refresh the inbox and the thread it went to
+            reloadMessages = studentId => (studentId === openStudentId ? loadThread(false) : Promise.resolve()).then(loadInbox).catch(() => {});
             try {
-                const res = await fetch(`${API_BASE_URL}/admin/students/`, { headers: getAuthHeaders() });
-                if (!res.ok) throw new Error('Could not load students');
-                const students = await res.json();
-                const select = document.getElementById('message-student-select');
-                select.innerHTML = '<option value="">-- Select a Student --</option>';
-                students.forEach(s => select.add(new Option(`${s.full_name} (${s.email})`, s._id)));
-            } catch (err) {
-                document.getElementById('message-student-select').innerHTML = '<option>Could not load students</option>';
-            }
-            try {
-                const res = await fetch(`${API_BASE_URL}/admin/messages`, { headers: getAuthHeaders() });
-                if (!res.ok) throw new Error('Could not load messages');
-                const messages = await res.json();
-                const container = document.getElementById('received-messages-container');
-                container.innerHTML = messages.length ? '' : '<p>No messages received yet.</p>';
-                messages.forEach(msg => {
-                    container.insertAdjacentHTML('beforeend', `<div class="message-card">
-                        <div class="message-card-header"><span>From: ${msg.student_name}</span><span class="timestamp">${new Date(msg.timestamp).toLocaleString()}</span></div>
-                        <p>${msg.message}</p></div>`);
+                const conversations = await loadInbox();
+                // The newest conversation holds the newest message seen; with none yet, all zeros replays whatever arrived since
+                streamMessages(`${API_BASE_URL}/admin/messages/stream`, conversations.length && conversations[0].last_message_id ? conversations[0].last_message_id : '0'.repeat(24), msg => {
+                    if (!document.body.contains(container)) return;
+                    if (msg.student_id === openStudentId) thread.insertAdjacentHTML('afterbegin', messageCard(msg, msg.student_name));
+                    loadInbox().catch(() => {});
                 });
             } catch (err) {
-                document.getElementById('received-messages-container').innerHTML = '<p style="color:red">Could not load messages.</p>';
+                container.innerHTML = '<p style="color:red">Could not load messages.</p>';
             }
         },
         'reviews-section': async () => {
             const section = document.getElementById('reviews-section');
-            section.innerHTML = `<h2>Student Reviews</h2><div id="reviews-container" class="reviews-grid"><p>Loading reviews...</p></div>`;
+            section.innerHTML = `<h2>Student Reviews</h2><div id="reviews-container" class="reviews-grid"><p>Loading reviews...</p></div>
+                <button id="more-reviews-btn" class="btn btn-secondary" style="display: none;">Load more</button>`;
             try {
-                const response = await fetch(`${API_BASE_URL}/admin/reviews/`, { headers: getAuthHeaders() });
-                const reviews = await response.json();
                 const container = document.getElementById('reviews-container');
-                container.innerHTML = reviews.length ? '' : '<p>No reviews submitted yet.</p>';
-                reviews.forEach(review => {
-                    const stars = '<i class="fas fa-star"></i>'.repeat(review.rating);
-                    const emptyStars = '<i class="far fa-star"></i>'.repeat(5 - review.rating);
-                    container.insertAdjacentHTML('beforeend', `
-                        <div class="review-card">
-                            <div class="review-card-header">
-                                <div>
-                                    <span class="review-author">${review.student_name}</span>
-                                    <span class="review-course">on ${review.course_title || 'Unknown Course'}</span>
+                await loadPages(`${API_BASE_URL}/admin/reviews/`, document.getElementById('more-reviews-btn'), (reviews, first) => {
+                    if (first) container.innerHTML = reviews.length ? '' : '<p>No reviews submitted yet.</p>';
+                    reviews.forEach(review => {
+                        const stars = '<i class="fas fa-star"></i>'.repeat(review.rating);
+                        const emptyStars = '<i class="far fa-star"></i>'.repeat(5 - review.rating);
+                        container.insertAdjacentHTML('beforeend', `
+                            <div class="review-card">
+                                <div class="review-card-header">
+                                    <div>
+                                        <span class="review-author">${review.student_name}</span>
+                                        <span class="review-course">on ${review.course_title || 'Unknown Course'}</span>
+                                    </div>
+                                    <span class="rating-stars">${stars}${emptyStars}</span>
                                 </div>
-                                <span class="rating-stars">${stars}${emptyStars}</span>
-                            </div>
-                            <p style="color: #444; font-style: italic;">"${review.comment}"</p>
-                            <small class="timestamp">${new Date(review.created_at).toLocaleDateString()} ${new Date(review.created_at).toLocaleTimeString()}</small>
-                        </div>`);
+                                <p style="color: #444; font-style: italic;">"${review.comment}"</p>
+                                <small class="timestamp">${new Date(review.created_at).toLocaleDateString()} ${new Date(review.created_at).toLocaleTimeString()}</small>
+                            </div>`);
+                    });
                 });
             } catch (error) { document.getElementById('reviews-container').innerHTML = `<p style="color:red">Could not load reviews.</p>`; }
         }
@@ -379,11 +482,14 @@ document.addEventListener('DOMContentLoaded', () => {
         }
         // FIX: Added course selection logic for certificates
         if (action === "allow-cert") {
-            fetch(`${API_BASE_URL}/admin/courses/`, { headers: getAuthHeaders() })
-                .then(res => res.json())
-                .then(courses => {
-                    if (courses.length === 0) { showModal('error', 'No Courses', 'Please create a course first.'); return; }
-                    let courseList = 'Available courses:\n\n';
+            // Narrow the catalog by title first (suggest endpoint), then pick from the matches
+            const title = prompt('Course title (or its first letters):');
+            if (!title || !title.trim()) return;
+            fetch(`${API_BASE_URL}/admin/courses/suggest?q=${encodeURIComponent(title.trim())}`, { headers: getAuthHeaders() })
+                .then(res => { if (!res.ok) throw new Error(); return res.json(); })
+                .then(({ items: courses }) => {
+                    if (courses.length === 0) { showModal('error', 'No Courses', `No course title matches "${title.trim()}".`); return; }
+                    let courseList = 'Matching courses:\n\n';
                     courses.forEach((c, index) => { courseList += `${index + 1}. ${c.title}\n`; });
                     courseList += '\nEnter course number:';
                     const courseNum = prompt(courseList);
@@ -429,6 +535,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 if (!response.ok) throw new Error((await response.json()).detail);
                 showModal('success', 'Message Sent', 'Your message was sent successfully.');
                 e.target.reset();
+                if (reloadMessages) reloadMessages(studentId);
             } catch (error) { showModal('error', 'Send Error', `Could not send message: ${error.message}`); }
         }
         if (e.target.id === 'course-form') {
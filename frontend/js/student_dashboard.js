@@ -10,6 +10,53 @@ document.addEventListener('DOMContentLoaded', () => {
     let allCoursesCache = [];
 
     const getAuthHeaders = () => ({ 'Authorization': `Bearer ${userToken}`, 'Content-Type': 'application/json' });
+    // List endpoints are keyset-paginated: follow `next` cursors until the last page
+    const fetchAllPages = async (url, field = 'items') => {
+        const items = [];
+        let next = null;
+        do {
+            const response = await fetch(next ? `${url}?after=${encodeURIComponent(next)}` : url, { headers: getAuthHeaders() });
+            if (!response.ok) throw new Error(`Request failed. Server status: ${response.status}`);
+            const page = await response.json();
+            items.push(...page[field]);
+            next = page.next;
+        } while (next);
+        return items;
+    };
+
+    // Pushed messages arrive over Server-Sent Events. Read with fetch because EventSource cannot send the Authorization
+    // header. On reconnect, Last-Event-ID makes the server replay what was missed.
+    let messageStream = null, reloadMessages = null;
+    const streamMessages = async (url, lastEventId, onMessage) => {
+        if (messageStream) messageStream.abort();
+        const controller = messageStream = new AbortController();
+        while (!controller.signal.aborted) {
+            try {
+                const headers = getAuthHeaders();
+                if (lastEventId) headers['Last-Event-ID'] = lastEventId;
+                const response = await fetch(url, { headers, signal: controller.signal });
+                if (response.status === 401 || response.status === 403) return;
+                if (!response.ok) throw new Error(`Server status: ${response.status}`);
+                const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+                let buffer = '';
+                for (;;) {
+                    const { value, done } = await reader.read();
+                    if (done) break;
+                    buffer += value;
+                    let end;
+                    while ((end = buffer.indexOf('\n\n')) >= 0) {
+                        const lines = buffer.slice(0, end).split('\n');
+                        buffer = buffer.slice(end + 2);
+                        const id = lines.find(l => l.startsWith('id: ')), data = lines.filter(l => l.startsWith('data: ')).map(l => l.slice(6)).join('\n');
+                        if (!data) continue;
+                        if (id) lastEventId = id.slice(4);
+                        onMessage(JSON.parse(data));
+                    }
+                }
+            } catch (error) { if (controller.signal.aborted) return; }
+            await new Promise(resolve => setTimeout(resolve, 3000));
+        }
+    };
 
     function showModal(type, title, message, onConfirmCallback = null) {
         const modal = document.getElementById('custom-modal'),
@@ -315,31 +362,49 @@ document.addEventListener('DOMContentLoaded', () => {
         const section = document.getElementById('messages-section');
         section.innerHTML = `<h2><i class="fas fa-envelope"></i> Messages</h2>
             <div><h3>Send a Message to Admin</h3><form id="send-message-form"><div class="form-group"><label for="message-text">Your Message:</label><textarea id="message-text" rows="4" required placeholder="Type your query..."></textarea></div><button type="submit" class="btn">Send Message</button></form></div>
-            <div style="margin-top: 40px; border-top: 2px solid var(--light-blue-bg); padding-top: 20px;"><h3>Received Messages</h3><div id="received-messages-container"><p>Loading messages...</p></div></div>`;
+            <div style="margin-top: 40px; border-top: 2px solid var(--light-blue-bg); padding-top: 20px;"><h3>Conversation with Admin</h3><div id="received-messages-container"><p>Loading messages...</p></div></div>`;
         try {
-            const response = await fetch(`${API_BASE_URL}/api/v1/student/messages`, { headers: getAuthHeaders() });
-            if (!response.ok) { throw new Error(`Failed to load messages. Server status: ${response.status}`); }
-            const data = await response.json();
-            // Handle both old format (array) and new format (object with messages property)
-            const messages = Array.isArray(data) ? data : (data.messages || []);
+            // One conversation with the admins, newest first; older pages on demand
             const container = document.getElementById('received-messages-container');
-            if (messages && messages.length > 0) {
-                container.innerHTML = '';
-                messages.forEach(msg => {
-                    const timestamp = msg.timestamp || msg.created_at || new Date().toISOString();
-                    const date = new Date(timestamp).toLocaleString();
-                    container.insertAdjacentHTML('beforeend', `
+            const messageCard = msg => {
+                const timestamp = msg.timestamp || msg.created_at || new Date().toISOString();
+                const date = new Date(timestamp).toLocaleString();
+                return `
                         <div class="message-card">
                             <div class="message-card-header">
-                                <strong>From: Admin</strong>
+                                <strong>From: ${msg.sender_type === 'student' ? 'You' : 'Admin'}</strong>
                                 <span class="timestamp">${date}</span>
                             </div>
                             <p>${msg.message || msg.text || ''}</p>
-                        </div>`);
-                });
-            } else {
-                container.innerHTML = '<p style="padding: 20px; text-align: center; color: #666;">No messages from admin yet.</p>';
-            }
+                        </div>`;
+            };
+            let next = null;
+            const olderBtn = document.createElement('button');
+            olderBtn.className = 'btn btn-secondary'; olderBtn.textContent = 'Load older'; olderBtn.style.display = 'none';
+            container.after(olderBtn);
+            const loadPage = async (append) => {
+                const params = new URLSearchParams({ limit: 20 });
+                if (append && next) params.set('after', next);
+                const response = await fetch(`${API_BASE_URL}/api/v1/student/conversation/messages?${params}`, { headers: getAuthHeaders() });
+                if (!response.ok) throw new Error(`Request failed. Server status: ${response.status}`);
+                const page = await response.json();
+                if (!append) container.innerHTML = page.messages.length ? '' : '<p style="padding: 20px; text-align: center; color: #666;">No messages from admin yet.</p>';
+                page.messages.forEach(msg => container.insertAdjacentHTML('beforeend', messageCard(msg)));
+                next = page.next;
+                olderBtn.style.display = next ? '' : 'none';
+                return page.messages;
+            };
+            olderBtn.onclick = () => loadPage(true);
+            const messages = await loadPage(false);
+            fetch(`${API_BASE_URL}/api/v1/student/conversation/read`, { method: 'POST', headers: getAuthHeaders() });
+            reloadMessages = () => loadPage(false).catch(() => {});
+            // Newest first, so messages[0] is the last one seen; with an empty list, all zeros replays whatever arrived since
+            streamMessages(`${API_BASE_URL}/api/v1/student/messages/stream`, messages.length ? messages[0]._id : '0'.repeat(24), msg => {
+                if (!document.body.contains(container)) return;
+                if (!container.querySelector('.message-card')) container.innerHTML = '';
+                container.insertAdjacentHTML('afterbegin', messageCard(msg));
+                fetch(`${API_BASE_URL}/api/v1/student/conversation/read`, { method: 'POST', headers: getAuthHeaders() });
+            });
         } catch (error) {
             console.error("Error in renderMessagesSection:", error);
             const container = document.getElementById('received-messages-container');
@@ -351,19 +416,41 @@ document.addEventListener('DOMContentLoaded', () => {
 
     async function renderSearchSection() {
         const section = document.getElementById('search-section');
-        section.innerHTML = `<h2><i class="fas fa-search"></i> Search & Enroll in Courses</h2><div class="form-group"><input type="search" id="course-search-input" class="form-group input" placeholder="Type to search for a course..."></div><div id="all-courses-container"><p>Loading available courses...</p></div>`;
-        const searchInput = document.getElementById('course-search-input'), container = document.getElementById('all-courses-container');
-        try {
-            const response = await fetch(`${API_BASE_URL}/api/v1/courses/`, { headers: getAuthHeaders() });
-            if (!response.ok) throw new Error('Failed to fetch courses');
-            allCoursesCache = await response.json();
-            searchInput.oninput = () => {
-                const searchTerm = searchInput.value.toLowerCase(),
-                    filteredCourses = allCoursesCache.filter(c => c.title.toLowerCase().includes(searchTerm));
-                displayCourses(filteredCourses, container);
-            };
-            displayCourses(allCoursesCache, container);
-        } catch (error) { container.innerHTML = `<p style="color: red;">Could not load courses.</p>`; }
+        section.innerHTML = `<h2><i class="fas fa-search"></i> Search & Enroll in Courses</h2><div class="form-group"><input type="search" id="course-search-input" class="form-group input" list="course-suggestions" autocomplete="off" placeholder="Type to search for a course..."><datalist id="course-suggestions"></datalist></div><div id="all-courses-container"><p>Loading available courses...</p></div><button id="more-courses-btn" class="btn btn-secondary" style="display: none;">Load more</button>`;
+        const searchInput = document.getElementById('course-search-input'), container = document.getElementById('all-courses-container'), moreBtn = document.getElementById('more-courses-btn');
+        // One page at a time: the catalog when the box is empty, ranked server-side search otherwise
+        let query = '', next = null, debounce = null, generation = 0;
+        const loadPage = async (append) => {
+            const current = ++generation, params = new URLSearchParams();
+            if (query) params.set('q', query);
+            if (append && next) params.set('after', next);
+            try {
+                const response = await fetch(`${API_BASE_URL}/api/v1/courses/${query ? 'search' : ''}?${params}`, { headers: getAuthHeaders() });
+                if (!response.ok) throw new Error(`Server status: ${response.status}`);
+                const page = await response.json();
+                if (current !== generation) return;
+                allCoursesCache = append ? allCoursesCache.concat(page.items) : page.items;
+                next = page.next;
+                displayCourses(allCoursesCache, container);
+                moreBtn.style.display = next ? '' : 'none';
+            } catch (error) { if (current === generation) container.innerHTML = `<p style="color: red;">Could not load courses.</p>`; }
+        };
+        const suggestions = document.getElementById('course-suggestions');
+        const loadSuggestions = async (q) => {
+            try {
+                const response = await fetch(`${API_BASE_URL}/api/v1/courses/suggest?q=${encodeURIComponent(q)}`, { headers: getAuthHeaders() });
+                if (!response.ok) return;
+                suggestions.innerHTML = '';
+                (await response.json()).items.forEach(c => suggestions.append(new Option(c.title)));
+            } catch (error) { suggestions.innerHTML = ''; }
+        };
+        searchInput.oninput = () => {
+            clearTimeout(debounce);
+            if (searchInput.value.trim()) loadSuggestions(searchInput.value.trim());
+            debounce = setTimeout(() => { query = searchInput.value.trim(); loadPage(false); }, 250);
+        };
+        moreBtn.onclick = () => loadPage(true);
+        await loadPage(false);
     }
 
     function displayCourses(courses, container) {
@@ -502,17 +589,24 @@ document.addEventListener('DOMContentLoaded', () => {
             const contentArea = document.querySelector(`#course-card-${courseId} .course-content-area`);
             if (contentArea.style.display === 'block') { contentArea.style.display = 'none'; return; }
             try {
-                const response = await fetch(`${API_BASE_URL}/api/v1/student/course/${courseId}`, { headers: getAuthHeaders() });
+                const [response, urlsResponse] = await Promise.all([
+                    fetch(`${API_BASE_URL}/api/v1/student/course/${courseId}`, { headers: getAuthHeaders() }),
+                    fetch(`${API_BASE_URL}/api/v1/student/course/${courseId}/file-urls`, { headers: getAuthHeaders() })
+                ]);
                 if (!response.ok) throw new Error("Could not load course content.");
                 const courseData = await response.json();
+                // Signed URLs are served straight from /uploads; fall back to the authenticated routes if unavailable
+                const signedFiles = urlsResponse.ok ? (await urlsResponse.json()).files : {};
                 const contentList = courseData.course_content || [];
                 let contentHtml = '<ul class="course-content-list">';
                 contentList.forEach(item => {
                     const icon = item.type === 'file' ? 'fa-file-alt' : 'fa-video';
-                    let url, name;
+                    let url, downloadUrl, name;
                     if (item.type === 'file') {
+                        const signed = signedFiles[item.content_id];
                         // Use the view URL if available (for PDF preview), otherwise use download URL
-                        url = item.view_url ? `${API_BASE_URL}${item.view_url}` : (item.download_url ? `${API_BASE_URL}${item.download_url}` : `${API_BASE_URL}/uploads/${item.path.split('/').pop()}`);
+                        url = signed ? `${API_BASE_URL}${signed.view_url}` : (item.view_url ? `${API_BASE_URL}${item.view_url}` : `${API_BASE_URL}${item.download_url}`);
+                        downloadUrl = signed ? `${API_BASE_URL}${signed.download_url}` : (item.download_url ? `${API_BASE_URL}${item.download_url}` : url);
                         name = item.name || 'File';
                     } else if (item.type === 'youtube') {
                         // Use the URL from the item (should be full YouTube URL)
@@ -524,7 +618,7 @@ document.addEventListener('DOMContentLoaded', () => {
                     }
                     contentHtml += `<li data-action="view-content-item" data-type="${item.type}" data-url="${url}" data-file-name="${name}" data-course-id="${courseId}" data-content-id="${item.content_id}" style="display:flex; justify-content:space-between; align-items:center;">
                         <span><i class="fas ${icon}"></i> ${name}</span>
-                        ${item.type === 'file' ? `<button class="btn btn-sm btn-light" style="padding:2px 10px; font-size:0.8rem; z-index:10;" data-action="download-content-item" data-url="${url}" data-file-name="${name}"><i class="fas fa-download"></i></button>` : ''}
+                        ${item.type === 'file' ? `<button class="btn btn-sm btn-light" style="padding:2px 10px; font-size:0.8rem; z-index:10;" data-action="download-content-item" data-url="${downloadUrl}" data-file-name="${name}"><i class="fas fa-download"></i></button>` : ''}
                     </li>`;
                 });
                 contentHtml += '</ul>';
@@ -701,6 +795,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 if (!response.ok) throw new Error('Failed to send message.');
                 showModal('success', 'Message Sent', 'Your message has been sent to the admin.');
                 e.target.reset();
+                if (reloadMessages) reloadMessages();
             } catch (error) { showModal('error', 'Error', 'Could not send the message.'); }
         } else if (e.target.id === 'review-form') {
             const courseId = document.getElementById('review-course-select').value,